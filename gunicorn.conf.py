@@ -0,0 +1,45 @@
+# gunicorn.conf.py
+#
+# Used by the Procfile and render.yaml: `gunicorn -c gunicorn.conf.py`.
+#
+# SERVER_MODE=wsgi (the default) runs the WSGI app on sync workers, one request
+# per worker at a time. SERVER_MODE=asgi runs the ASGI app on uvicorn workers,
+# where the async views (notices/async_views.py) and the asyncio push sender let
+# each worker keep many slow clients and push round-trips in flight at once.
+# Settings read SERVER_MODE too (ASYNC_VIEWS, PUSH_SENDER, connection reuse).
+#
+# The master also runs `manage.py sweep_attachments` every ATTACHMENT_SWEEP_INTERVAL
+# seconds (default an hour, 0 to turn it off): unused attachment files can only be
+# deleted on the machine that holds MEDIA_ROOT, and a separate worker or cron
+# service (on Render, say) has a filesystem of its own.
+
+import os
+import subprocess
+import sys
+
+mode = os.environ.get('SERVER_MODE', 'wsgi')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+if mode == 'asgi':
+    wsgi_app = 'notice_board_project.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+elif mode == 'wsgi':
+    wsgi_app = 'notice_board_project.wsgi:application'
+else:
+    raise RuntimeError(f"SERVER_MODE must be 'wsgi' or 'asgi', not {mode!r}")
+
+sweep_interval = float(os.environ.get('ATTACHMENT_SWEEP_INTERVAL', 3600))
+sweeper = None
+
+
+def when_ready(server):
+    global sweeper
+    if sweep_interval > 0:
+        manage = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manage.py')
+        sweeper = subprocess.Popen([sys.executable, manage, 'sweep_attachments', '--every', str(sweep_interval)])
+
+
+def on_exit(server):
+    if sweeper is not None:
+        sweeper.terminate()
+        sweeper.wait(timeout=10)
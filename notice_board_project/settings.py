@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 import environ
 import dj_database_url
@@ -58,7 +59,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # whitenoise.middleware.WhiteNoiseMiddleware that also works in an async middleware chain
+    'notices.middleware.AsyncWhiteNoiseMiddleware',
+    # After WhiteNoise, so static files aren't counted
+    'notices.middleware.MetricsMiddleware',
+    # Before anything that reads the database (sessions, users), so those reads use the replica too
+    'notices.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,12 +86,20 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'notices.context_processors.vapid_key',  # Add this line
+                'notices.context_processors.fragment_cache',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'notice_board_project.wsgi.application'
+ASGI_APPLICATION = 'notice_board_project.asgi.application'
+
+# 'wsgi' (sync gunicorn workers) or 'asgi' (uvicorn workers); gunicorn.conf.py picks the worker from this
+SERVER_MODE = env('SERVER_MODE', default='wsgi')
+# Route the read pages and /subscribe/ to their async versions (notices/async_views.py).
+# Under WSGI the sync views are cheaper, so this follows SERVER_MODE unless set.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=SERVER_MODE == 'asgi')
 
 
 # Database
@@ -94,9 +108,51 @@ WSGI_APPLICATION = 'notice_board_project.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default=env('DATABASE_URL'),
-        conn_max_age=600
+        # Under ASGI every request runs its queries on a thread of its own, so a persistent
+        # connection would be left behind by each request; connect per request instead
+        conn_max_age=0 if SERVER_MODE == 'asgi' else 600
+    )
+}
+
+# Optional read replica (e.g. a PostgreSQL standby; two SQLite files work for trying it out).
+# GET and HEAD requests read from it, except shortly after a write (notices/replicas.py).
+REPLICA_DATABASE_URL = env('REPLICA_DATABASE_URL', default='')
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL, conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
     )
+DATABASE_ROUTERS = ['notices.replicas.ReplicaRouter']
+# The alias those reads go to; None reads everything from the primary
+READ_REPLICA = 'replica' if REPLICA_DATABASE_URL else None
+# After a browser writes anything, or any notice changes, reads stay on the primary this long
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)
+# Seconds between checks that the replica answers; a PostgreSQL standby further behind
+# than REPLICA_MAX_LAG seconds is skipped until it catches up
+REPLICA_HEALTH_CHECK_INTERVAL = env.int('REPLICA_HEALTH_CHECK_INTERVAL', default=30)
+REPLICA_MAX_LAG = env.int('REPLICA_MAX_LAG', default=30)
+# Runs the replica tests against a second SQLite database when no replica is configured
+TEST_RUNNER = 'notices.testing.NoticeTestRunner'
+
+
+# Cache
+# The default file cache is shared by all gunicorn workers on the host, so a new notice
+# invalidates cached pages everywhere. locmemcache:// works too, but each worker then only
+# sees its own invalidations until NOTICE_CACHE_TIMEOUT runs out.
+
+# Rendered notice cards ({% cache %} in _notice_cards.html) live in 'template_fragments'. Their keys
+# include the notice's updated_at, so an edit never needs invalidating across workers and a per-process
+# memory cache is enough; it saves the file read per card that the default cache would cost.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default=f"filecache://{os.path.join(tempfile.gettempdir(), 'notice-board-cache')}"),
+    'template_fragments': env.cache('FRAGMENT_CACHE_URL', default='locmemcache://notice-cards'),
 }
+CACHES['template_fragments'].setdefault('OPTIONS', {}).setdefault('MAX_ENTRIES', 5000)
+
+NOTICE_CACHE_ENABLED = env.bool('NOTICE_CACHE_ENABLED', default=True)
+NOTICE_CACHE_TIMEOUT = env.int('NOTICE_CACHE_TIMEOUT', default=300)
+# 0 turns card caching off
+NOTICE_FRAGMENT_CACHE_TIMEOUT = env.int('NOTICE_FRAGMENT_CACHE_TIMEOUT', default=86400)
 
 
 # Password validation
@@ -146,6 +202,14 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 if not DEBUG:
     # Tell Django to copy static assets into a path called `staticfiles` (this is specific to Render)
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    # Parse each template once per worker instead of on every render
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -154,8 +218,115 @@ LOGOUT_REDIRECT_URL = '/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Who sends attachment bytes: 'django' (FileResponse, sendfile under gunicorn),
+# 'x-accel-redirect' (nginx, internal location at ATTACHMENT_ACCEL_PREFIX) or 'x-sendfile'
+ATTACHMENT_SERVE_MODE = env.str('ATTACHMENT_SERVE_MODE', default='django')
+ATTACHMENT_ACCEL_PREFIX = env.str('ATTACHMENT_ACCEL_PREFIX', default='/protected-media/')
+ATTACHMENT_CACHE_MAX_AGE = env.int('ATTACHMENT_CACHE_MAX_AGE', default=60 * 60 * 24 * 365)
+# A stored file nothing refers to any more is only deleted once it hasn't been uploaded again for
+# this long, so an upload of the same bytes that is still committing keeps it (notices/storage.py)
+ATTACHMENT_BLOB_GRACE_SECONDS = env.int('ATTACHMENT_BLOB_GRACE_SECONDS', default=600)
+
+# Hash uploads as they stream in so attachments can be stored once per content
+FILE_UPLOAD_HANDLERS = [
+    'notices.storage.HashingMemoryFileUploadHandler',
+    'notices.storage.HashingTemporaryFileUploadHandler',
+]
+
 WEBPUSH_SETTINGS = {
     "VAPID_PUBLIC_KEY": env('VAPID_PUBLIC_KEY'),
     "VAPID_PRIVATE_KEY": env('VAPID_PRIVATE_KEY'), 
     "VAPID_ADMIN_EMAIL": env('VAPID_ADMIN_EMAIL'), # Use a real admin email
 }
+
+# Push fan-out runs on a background pool; PUSH_MAX_WORKERS bounds the parallel sends per process
+PUSH_ASYNC = env.bool('PUSH_ASYNC', default=True)
+PUSH_MAX_WORKERS = env.int('PUSH_MAX_WORKERS', default=16)
+PUSH_TTL = env.int('PUSH_TTL', default=1000)  # seconds a push service keeps an undelivered message
+PUSH_TIMEOUT = env.float('PUSH_TIMEOUT', default=10.0)
+# 'threads' sends each batch through PUSH_MAX_WORKERS threads; 'asyncio' sends it on an event loop
+# (aiohttp) with up to PUSH_MAX_WORKERS requests in flight, which ASGI mode uses by default
+PUSH_SENDER = env('PUSH_SENDER', default='asyncio' if SERVER_MODE == 'asgi' else 'threads')
+# Per push service (endpoint origin, see notices/push_transport.py): pooled keep-alive connections,
+# sends spaced to PUSH_ORIGIN_RATE per second (0 = unlimited), and sends that would wait longer than
+# PUSH_ORIGIN_MAX_WAIT seconds (for that rate or a Retry-After) put back in the outbox instead
+PUSH_ORIGIN_CONCURRENCY = env.int('PUSH_ORIGIN_CONCURRENCY', default=PUSH_MAX_WORKERS)
+PUSH_ORIGIN_RATE = env.float('PUSH_ORIGIN_RATE', default=0)
+PUSH_ORIGIN_MAX_WAIT = env.float('PUSH_ORIGIN_MAX_WAIT', default=5.0)
+PUSH_VAPID_TTL = env.int('PUSH_VAPID_TTL', default=12 * 3600)  # signed VAPID headers are reused until near expiry
+
+# Browsers re-subscribe on every page load: an identical repeat within SUBSCRIBE_SKIP_TTL seconds
+# of saving it in this process skips the database (0 turns that off)
+SUBSCRIBE_SKIP_TTL = env.int('SUBSCRIBE_SKIP_TTL', default=300)
+SUBSCRIBE_SKIP_MAX_ENTRIES = env.int('SUBSCRIBE_SKIP_MAX_ENTRIES', default=10000)
+
+# Outbox: pushes are queued as PushDelivery rows and drained in batches.
+# With PUSH_INLINE_DRAIN off the web process only queues and `manage.py push_worker` sends.
+PUSH_INLINE_DRAIN = env.bool('PUSH_INLINE_DRAIN', default=True)
+PUSH_BATCH_SIZE = env.int('PUSH_BATCH_SIZE', default=200)
+PUSH_CLAIM_LEASE = env.int('PUSH_CLAIM_LEASE', default=300)  # seconds before a stuck claim is retaken
+PUSH_MAX_ATTEMPTS = env.int('PUSH_MAX_ATTEMPTS', default=6)
+PUSH_RETRY_BASE_DELAY = env.int('PUSH_RETRY_BASE_DELAY', default=30)
+PUSH_RETRY_MAX_DELAY = env.int('PUSH_RETRY_MAX_DELAY', default=3600)
+PUSH_DELIVERY_RETENTION_DAYS = env.int('PUSH_DELIVERY_RETENTION_DAYS', default=7)
+PUSH_WORKER_POLL_INTERVAL = env.float('PUSH_WORKER_POLL_INTERVAL', default=2.0)
+
+# Image attachments get a WebP thumbnail and preview, rendered by a pool of PREVIEW_WORKERS processes.
+# Sizes are the longest side in pixels; `manage.py generate_previews` backfills older attachments.
+PREVIEWS_ASYNC = env.bool('PREVIEWS_ASYNC', default=True)
+PREVIEW_WORKERS = env.int('PREVIEW_WORKERS', default=2)
+PREVIEW_THUMBNAIL_SIZE = env.int('PREVIEW_THUMBNAIL_SIZE', default=320)
+PREVIEW_SIZE = env.int('PREVIEW_SIZE', default=1280)
+PREVIEW_WEBP_QUALITY = env.int('PREVIEW_WEBP_QUALITY', default=80)
+PREVIEW_MAX_PIXELS = env.int('PREVIEW_MAX_PIXELS', default=50_000_000)  # refuse decompression bombs
+
+# Per-view request metrics and push counters, served at /metrics to staff (or with METRICS_TOKEN).
+# Each process writes its totals to its own file in METRICS_DIR; /metrics adds them up.
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+METRICS_DIR = env('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'notice-board-metrics'))
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', default=1.0)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'notices': {
+            'handlers': ['console'],
+            'level': env('NOTICES_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
+
+# Full-text search: 'auto' uses PostgreSQL tsvector/GIN or SQLite FTS5 depending on the database,
+# or give a dotted path to a class in notices.search
+NOTICE_SEARCH_BACKEND = env('NOTICE_SEARCH_BACKEND', default='auto')
+NOTICE_SEARCH_MAX_RESULTS = env.int('NOTICE_SEARCH_MAX_RESULTS', default=1000)
+
+# Text inside .txt/.csv/.docx attachments is extracted in the background and added to the search index
+TEXT_EXTRACTION_ASYNC = env.bool('TEXT_EXTRACTION_ASYNC', default=True)
+ATTACHMENT_TEXT_MAX_BYTES = env.int('ATTACHMENT_TEXT_MAX_BYTES', default=5 * 1024 * 1024)  # read per file
+ATTACHMENT_TEXT_MAX_CHARS = env.int('ATTACHMENT_TEXT_MAX_CHARS', default=100_000)  # kept per file
+
+# Notices per page on the board, archive and my-notices lists (cursor paginated)
+NOTICES_PER_PAGE = env.int('NOTICES_PER_PAGE', default=20)
+
+# `manage.py archive_notices` moves notices posted more than this many days ago out of the
+# tables the board and My Notices read into the archive tables (notices/archive.py)
+NOTICE_ARCHIVE_AFTER_DAYS = env.int('NOTICE_ARCHIVE_AFTER_DAYS', default=365)
+NOTICE_ARCHIVE_BATCH_SIZE = env.int('NOTICE_ARCHIVE_BATCH_SIZE', default=500)  # notices moved per transaction
+
+# Live feed (/live/, notices/live.py): Server-Sent Events that update the board's cards in place.
+# With LIVE_STREAMING each screen holds a connection open, which needs ASGI; otherwise every
+# request answers with what the screen missed and the browser reconnects after LIVE_RECONNECT_INTERVAL.
+LIVE_STREAMING = env.bool('LIVE_STREAMING', default=SERVER_MODE == 'asgi')
+LIVE_POLL_INTERVAL = env.float('LIVE_POLL_INTERVAL', default=2.0)  # seconds between checks for other workers' changes
+LIVE_RECONNECT_INTERVAL = env.int('LIVE_RECONNECT_INTERVAL', default=15)  # seconds
+LIVE_KEEPALIVE = env.int('LIVE_KEEPALIVE', default=20)  # seconds between comments on an idle stream
+LIVE_MAX_DURATION = env.int('LIVE_MAX_DURATION', default=600)  # seconds before a stream ends and reconnects
+LIVE_REPLAY_LIMIT = env.int('LIVE_REPLAY_LIMIT', default=100)  # missed more than this: reload the page
+# Also how far back /api/sync/ can bring an offline copy up to date; purged by push_worker
+LIVE_EVENT_RETENTION_HOURS = env.int('LIVE_EVENT_RETENTION_HOURS', default=7 * 24)
@@ -0,0 +1,170 @@
+# notices/api.py
+#
+# Read-only JSON views for display screens and mobile clients. Each one subclasses
+# the HTML view it mirrors, so filters, cursor pagination, caching and conditional
+# GET behave exactly as on the site; only the rendering differs.
+
+import csv
+import itertools
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views import View
+
+from .models import ArchivedNotice, Notice, NoticeEvent
+from .streaming import is_asgi, iterate_in_thread, joined
+from .views import AllNoticesListView, NoticeDetailView, StudentNoticeListView
+
+# Columns of the bulk export, in order
+EXPORT_FIELDS = [
+    'id', 'title', 'notice_type', 'department', 'semester', 'description',
+    'posted_by__username', 'posted_at', 'updated_at',
+]
+EXPORT_CHUNK_SIZE = 500
+# Events read per /api/sync/ response; clients follow `more`
+SYNC_PAGE_SIZE = 500
+
+
+def notice_to_dict(notice, attachments=None):
+    data = {
+        'id': notice.pk,
+        'title': notice.title,
+        'notice_type': notice.notice_type,
+        'department': notice.department,
+        'semester': notice.semester,
+        'description': notice.description,
+        'posted_by': notice.posted_by.username,
+        'posted_at': notice.posted_at,
+        'updated_at': notice.updated_at,
+        'url': reverse('notice-detail', kwargs={'pk': notice.pk}),
+    }
+    if attachments is not None:
+        data['attachments'] = [
+            {'name': attachment.name or attachment.filename(), 'url': attachment.download_url()}
+            for attachment in attachments
+        ]
+    return data
+
+
+class JSONListMixin:
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse({
+            'results': [notice_to_dict(notice) for notice in context['notices']],
+            'next': context['next_page_url'],
+        })
+
+
+class BoardAPIView(JSONListMixin, StudentNoticeListView):
+    page_url_name = 'api-board'
+    fragment_url_name = 'api-board'
+
+
+class NoticeListAPIView(JSONListMixin, AllNoticesListView):
+    page_url_name = 'api-notices'
+    fragment_url_name = 'api-notices'
+
+
+class NoticeDetailAPIView(NoticeDetailView):
+    def render_to_response(self, context, **response_kwargs):
+        notice = context['notice']
+        return JsonResponse(notice_to_dict(notice, attachments=notice.attachments.all()))
+
+
+class Echo:
+    # csv.writer only needs something with write(); hand each line straight back
+    def write(self, value):
+        return value
+
+
+class NoticeExportView(AllNoticesListView):
+    """
+    Stream every notice matching the archive filters as NDJSON (default) or CSV.
+
+    Rows are read from a server-side cursor EXPORT_CHUNK_SIZE at a time and written
+    out as they arrive, so memory use doesn't grow with the size of the archive
+    (under ASGI too: see notices/streaming.py).
+    Archived notices follow the hot ones, as on the archive page.
+    """
+
+    def get(self, request, *args, **kwargs):
+        rows = itertools.chain.from_iterable(
+            queryset.order_by('-posted_at', '-id').values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            for queryset in (self.get_queryset(), self.get_archive_queryset())
+        )
+        if request.GET.get('format') == 'csv':
+            lines, content_type = self.csv_lines(rows), 'text/csv; charset=utf-8'
+        else:
+            lines, content_type = self.ndjson_lines(rows), 'application/x-ndjson'
+        if is_asgi(request):
+            lines = iterate_in_thread(joined(lines, EXPORT_CHUNK_SIZE))
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        if request.GET.get('format') == 'csv':
+            response['Content-Disposition'] = 'attachment; filename="notices.csv"'
+        return response
+
+    def ndjson_lines(self, rows):
+        names = [field.replace('posted_by__username', 'posted_by') for field in EXPORT_FIELDS]
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            yield encoder.encode(dict(zip(names, row))) + '\n'
+
+    def csv_lines(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow([field.replace('posted_by__username', 'posted_by') for field in EXPORT_FIELDS])
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class NoticeSyncView(View):
+    """
+    What changed since a client last synced, for copies kept offline (the service worker).
+
+    GET ?since=<cursor> returns {cursor, reset, changed, deleted, more}: the notices
+    created or edited since then, the ids of those deleted since (tombstones), and the
+    cursor to send next time. reset is true when there is no cursor, or when it is
+    older than the change log (LIVE_EVENT_RETENTION_HOURS): the client should then
+    treat everything it has as stale. Changes come from NoticeEvent (notices/live.py).
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET['since'])
+        except (KeyError, ValueError):
+            since = None
+        first, latest = self.log_range()
+
+        if since is None or since > latest or (first is not None and since < first - 1):
+            response = JsonResponse({'cursor': latest, 'reset': True, 'changed': [], 'deleted': [], 'more': False})
+        else:
+            response = JsonResponse(self.changes(since))
+        patch_cache_control(response, no_store=True)
+        return response
+
+    def log_range(self):
+        events = NoticeEvent.objects.order_by('pk').values_list('pk', flat=True)
+        return events.first(), events.last() or 0
+
+    def changes(self, since):
+        events = list(
+            NoticeEvent.objects.filter(pk__gt=since).order_by('pk').values_list('pk', 'notice_id', 'kind')[:SYNC_PAGE_SIZE + 1]
+        )
+        more = len(events) > SYNC_PAGE_SIZE
+        events = events[:SYNC_PAGE_SIZE]
+        # Only the last change to each notice matters
+        last_kind = {notice_id: kind for _, notice_id, kind in events}
+        ids = [notice_id for notice_id, kind in last_kind.items() if kind != NoticeEvent.DELETED]
+        notices = Notice.objects.select_related('posted_by').in_bulk(ids)
+        missing = [notice_id for notice_id in ids if notice_id not in notices]
+        if missing:
+            # Moved to the archive since (notices/archive.py): still there, just not hot
+            notices.update(ArchivedNotice.objects.select_related('posted_by').in_bulk(missing))
+        return {
+            'cursor': events[-1][0] if events else since,
+            'reset': False,
+            # A notice in neither table was deleted after this page; its delete event follows
+            'changed': [notice_to_dict(notices[notice_id]) for notice_id in ids if notice_id in notices],
+            'deleted': [notice_id for notice_id, kind in last_kind.items() if kind == NoticeEvent.DELETED],
+            'more': more,
+        }
@@ -0,0 +1,149 @@
+# notices/archive.py
+#
+# Hot and cold notices. The board, My Notices and every write only touch
+# `Notice`, so it should only hold what they need: `manage.py archive_notices`
+# (run daily, e.g. from cron) moves notices posted more than
+# NOTICE_ARCHIVE_AFTER_DAYS ago, with their attachments and search rows, into
+# ArchivedNotice / ArchivedAttachment / ArchivedNoticeSearchIndex. Those keep
+# the same ids and have their own indexes and full-text index, so the hot
+# tables and their indexes stay the size of a few semesters however long the
+# college keeps its history.
+#
+# The archive page lists hot notices and then archived ones (ArchiveListMixin);
+# notice pages and attachment downloads look in the archive when an id isn't
+# hot any more. Archived notices are read-only.
+#
+# Rows are moved with INSERT ... SELECT and DELETE in the database, a batch per
+# transaction, without loading them into Python. That skips the Notice and
+# Attachment signals on purpose: an archived notice hasn't changed, so there is
+# no live or sync event to send, nothing to re-index and no blob to release.
+
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import cache
+from .models import (
+    ArchivedAttachment, ArchivedNotice, ArchivedNoticeSearchIndex, Attachment, Notice, NoticeSearchIndex,
+    PushDelivery,
+)
+from .pagination import decode_cursor, encode_cursor
+
+
+def copy_rows(connection, source, target, column, ids, **values):
+    """
+    Copy the rows of `source` whose `column` is in `ids` into `target`, which has the
+    same columns plus the ones given in `values` (the same value for every row).
+    """
+    quote = connection.ops.quote_name
+    extra = [target._meta.get_field(name) for name in values]
+    columns = [field.column for field in target._meta.concrete_fields if field not in extra]
+    params = [field.get_db_prep_value(values[field.name], connection) for field in extra]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(target._meta.db_table)} "
+            f"({', '.join(quote(name) for name in columns + [field.column for field in extra])}) "
+            f"SELECT {', '.join([quote(name) for name in columns] + ['%s'] * len(extra))} "
+            f"FROM {quote(source._meta.db_table)} WHERE {quote(column)} IN ({', '.join(['%s'] * len(ids))})",
+            [*params, *ids],
+        )
+
+
+def delete_rows(connection, model, column, ids):
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({', '.join(['%s'] * len(ids))})",
+            ids,
+        )
+
+
+def archive_cutoff(days=None):
+    days = settings.NOTICE_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to `batch_size` of the oldest notices posted before `cutoff`. Returns how many moved."""
+    using = router.db_for_write(Notice)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        # Locked, so an edit can't land between the copy and the delete
+        ids = list(
+            Notice.objects.using(using).select_for_update().filter(posted_at__lt=cutoff)
+            .order_by('posted_at', 'id').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        copy_rows(connection, Notice, ArchivedNotice, 'id', ids, archived_at=timezone.now())
+        copy_rows(connection, Attachment, ArchivedAttachment, 'notice_id', ids)
+        copy_rows(connection, NoticeSearchIndex, ArchivedNoticeSearchIndex, 'notice_id', ids)
+        # Push deliveries of a notice this old were finished long ago
+        for model in (NoticeSearchIndex, Attachment, PushDelivery):
+            delete_rows(connection, model, 'notice_id', ids)
+        delete_rows(connection, Notice, 'id', ids)
+    # The archive page's cursor and the notices' board state are different now
+    cache.bump_board_version()
+    return len(ids)
+
+
+def archive_notices(days=None, batch_size=None):
+    """Move every notice posted more than `days` ago into the archive. Returns how many moved."""
+    cutoff = archive_cutoff(days)
+    batch_size = batch_size or settings.NOTICE_ARCHIVE_BATCH_SIZE
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+class ArchiveListMixin:
+    """
+    For KeysetPaginationMixin views that list archived notices too: the hot notices
+    come first and the archived ones (all older) after them, a page taking what it
+    needs from one and then the other. The archive is only read once the hot notices
+    run out. Cursors start with whether they stopped in the archive.
+    """
+
+    def get_archive_queryset(self):
+        raise NotImplementedError
+
+    def cursor_in_archive(self):
+        values = decode_cursor(self.request.GET.get(self.cursor_param, ''))
+        return bool(values) and values[0] is True
+
+    def get_cursor_values(self, queryset, fields):
+        values = decode_cursor(self.request.GET.get(self.cursor_param, ''))
+        # A cursor from the hot notices means "from the top" for the archive
+        if not values or values[0] is not queryset.model.archived:
+            return None
+        return self.parse_cursor(queryset, fields, values[1:])
+
+    def row_cursor(self, row, fields):
+        return encode_cursor([row.archived, *(getattr(row, field) for field in fields)])
+
+    def paginate_keyset(self, queryset):
+        rows = []
+        if not self.cursor_in_archive():
+            page, fields = self.page_queryset(queryset)
+            rows = list(page)
+        if len(rows) <= self.get_page_size():
+            page, fields = self.page_queryset(self.get_archive_queryset())
+            rows += list(page)
+        return self.split_page(rows, fields)
+
+    async def apaginate_keyset(self, queryset):
+        rows = []
+        if not self.cursor_in_archive():
+            page, fields = self.page_queryset(queryset)
+            rows = [row async for row in page]
+        if len(rows) <= self.get_page_size():
+            # The SQLite search ranks its matches up front, like get_queryset
+            page, fields = self.page_queryset(await sync_to_async(self.get_archive_queryset)())
+            rows += [row async for row in page]
+        return self.split_page(rows, fields)
@@ -0,0 +1,106 @@
+# notices/async_views.py
+#
+# Async versions of the busiest views, routed instead of the sync ones when
+# ASYNC_VIEWS is on (the ASGI mode in gunicorn.conf.py). They reuse the sync
+# views' querysets, validators and templates; what changes is that a request
+# waiting on the database or the cache no longer holds a worker thread.
+#
+# Django renders the TemplateResponse of an async view on a thread, so template
+# code (context processors, lazy relations) runs exactly as it does under WSGI.
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .cache import add_validators, cache_response, cached_response, check_preconditions, response_cache_key
+from .live import latest_event_id
+from .models import ArchivedNotice, Notice
+from .subscriptions import recent, save_subscription
+from .views import (
+    AllNoticesListView, NoticeDetailView, StudentNoticeListView, logger, parse_subscription, subscription_response,
+)
+
+
+class AsyncPageMixin:
+    """ConditionalGetMixin and CachedResponseMixin (notices/cache.py) for views with async handlers."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Resolve the user up front: viewer_key() and the templates read request.user,
+        # which would otherwise be loaded lazily (and synchronously) from the session
+        request.user = await request.auser()
+        if request.method not in ('GET', 'HEAD'):
+            return await super().dispatch(request, *args, **kwargs)
+
+        etag, last_modified = await sync_to_async(self.get_validators)(request, *args, **kwargs)
+        etag, last_modified, response = check_preconditions(request, etag, last_modified)
+        if response is None:
+            response = await self.cached_get(request, *args, **kwargs)
+        return add_validators(response, etag, last_modified)
+
+    async def cached_get(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower())
+        if request.method != 'GET' or not settings.NOTICE_CACHE_ENABLED:
+            return await handler(request, *args, **kwargs)
+
+        def lookup():
+            key = response_cache_key(request)
+            return key, cached_response(key)
+
+        key, response = await sync_to_async(lookup)()
+        if response is not None:
+            return response
+        return cache_response(key, await handler(request, *args, **kwargs))
+
+
+class AsyncNoticeDetailView(AsyncPageMixin, NoticeDetailView):
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.get_queryset().aget(pk=kwargs['pk'])
+        except Notice.DoesNotExist:
+            try:
+                self.object = await self.get_archive_queryset().aget(pk=kwargs['pk'])
+            except ArchivedNotice.DoesNotExist:
+                raise Http404("No notice found matching the query")
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class AsyncNoticeListMixin(AsyncPageMixin):
+
+    async def get(self, request, *args, **kwargs):
+        if self.goes_live():
+            self.live_since = await sync_to_async(latest_event_id)()
+        # get_queryset may already query: the SQLite search ranks its matches up front
+        self.object_list = await sync_to_async(self.get_queryset)()
+        self.keyset_page = await self.apaginate_keyset(self.object_list)
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncStudentNoticeListView(AsyncNoticeListMixin, StudentNoticeListView):
+    pass
+
+
+class AsyncAllNoticesListView(AsyncNoticeListMixin, AllNoticesListView):
+    pass
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncSubscribeView(View):
+    async def post(self, request, *args, **kwargs):
+        try:
+            endpoint, fields = parse_subscription(request.body)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        # Repeats of a recent subscription are answered without leaving the event loop
+        if recent.seen(endpoint, fields):
+            return subscription_response(False)
+        try:
+            created = await sync_to_async(save_subscription)(endpoint, fields)
+        except Exception as e:
+            logger.exception("Subscription error: %s", e)
+            return JsonResponse({'status': 'error', 'message': f'Server error: {str(e)}'}, status=500)
+        return subscription_response(created)
@@ -0,0 +1,74 @@
+# notices/audience.py
+#
+# Works out which push subscriptions a notice should reach.
+# A subscription matches when its department is 'ALL' or the notice's department,
+# and its semester is 'ALL' or the notice's semester (a notice for 'ALL'
+# semesters reaches every semester of its department).
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import PushSubscription
+
+KEY_FIELDS = ('endpoint', 'p256dh_key', 'auth_key')
+
+SEGMENT_VERSION_KEY = 'push-audience:version'
+SEGMENT_TIMEOUT = 60 * 60
+
+
+def audience_filter(department, semester):
+    query = Q(department__in=['ALL', department])
+    if semester and semester != 'ALL':
+        query &= Q(semester__in=['ALL', semester])
+    return query
+
+
+def reaches(subscription_department, subscription_semester, department, semester):
+    """audience_filter() for one subscription, without a query."""
+    if subscription_department not in ('ALL', department):
+        return False
+    return not semester or semester == 'ALL' or subscription_semester in ('ALL', semester)
+
+
+def audience(notice):
+    return PushSubscription.objects.filter(audience_filter(notice.department, notice.semester))
+
+
+def audience_chunks(notice, fields=KEY_FIELDS, chunk_size=1000):
+    """
+    Yield the audience as lists of tuples of `fields`, chunk_size rows at a time.
+
+    Only the requested columns are read and rows are streamed from the cursor,
+    so memory stays flat however many students are subscribed.
+    """
+    rows = audience(notice).order_by().values_list(*fields).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _segment_version():
+    return cache.get_or_set(SEGMENT_VERSION_KEY, 1, timeout=None)
+
+
+def segment_size(department, semester):
+    """Number of subscriptions a notice for this department/semester reaches, cached."""
+    key = f'push-audience:{_segment_version()}:{department}:{semester}'
+    size = cache.get(key)
+    if size is None:
+        size = PushSubscription.objects.filter(audience_filter(department, semester)).count()
+        cache.set(key, size, SEGMENT_TIMEOUT)
+    return size
+
+
+def invalidate_segments():
+    # Called whenever a subscription is added, changed or removed
+    try:
+        cache.incr(SEGMENT_VERSION_KEY)
+    except ValueError:
+        cache.set(SEGMENT_VERSION_KEY, 2, timeout=None)
@@ -0,0 +1,187 @@
+# notices/cache.py
+#
+# HTTP caching for the public notice pages.
+#
+# CachedResponseMixin is a whole-response cache. Every key embeds the current
+# "board version", a counter bumped by the signals in notices/signals.py whenever
+# a notice or attachment is written, so a write makes all cached pages unreachable
+# at once instead of deleting them one by one.
+#
+# ConditionalGetMixin answers browser revalidation (If-None-Match / If-Modified-Since)
+# from one small query, before the page query runs or anything is rendered.
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import replicas
+from .models import ArchivedNotice, Notice
+
+BOARD_VERSION_KEY = 'notices:board-version'
+
+
+def board_version():
+    return cache.get_or_set(BOARD_VERSION_KEY, 1, timeout=None)
+
+
+def bump_board_version():
+    replicas.note_board_write()
+    try:
+        return cache.incr(BOARD_VERSION_KEY)
+    except ValueError:
+        # Evicted or never set: any value that differs from what pages were cached under will do
+        cache.set(BOARD_VERSION_KEY, 2, timeout=None)
+        return 2
+
+
+def viewer_key(request):
+    # Anonymous visitors all share one copy. Signed-in teachers see their own edit controls
+    # and a logout form carrying their CSRF token, so they get a copy per user and token.
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    return f'user:{user.pk}:{request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")}'
+
+
+def response_cache_key(request):
+    params = sorted(request.GET.lists())
+    raw = f'{request.path}|{params}|{viewer_key(request)}'
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f'notices:page:{board_version()}:{digest}'
+
+
+def cached_response(key):
+    """The response stored under `key` (see cache_response), or None."""
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = 'hit'
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def cache_response(key, response):
+    """Store a successful response under `key` once it has been rendered."""
+    if response.status_code != 200 or response.streaming:
+        return response
+
+    def store(rendered):
+        # Never replay a response that sets cookies on someone else
+        if not rendered.cookies:
+            cache.set(key, (rendered.content, rendered['Content-Type']), settings.NOTICE_CACHE_TIMEOUT)
+
+    if hasattr(response, 'add_post_render_callback') and not response.is_rendered:
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    response['X-Cache'] = 'miss'
+    return response
+
+
+class CachedResponseMixin:
+    """Serve GETs from the cache, keyed on path, query string, viewer and board version."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or not settings.NOTICE_CACHE_ENABLED:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = response_cache_key(request)
+        response = cached_response(key)
+        if response is not None:
+            return response
+        return cache_response(key, super().dispatch(request, *args, **kwargs))
+
+
+def board_state():
+    """(latest updated_at, number of notices): changes on every create, edit and delete."""
+    def compute():
+        state = Notice.objects.aggregate(last_updated=Max('updated_at'), count=Count('id'))
+        return state['last_updated'], state['count']
+    # Stored under the board version, so it is recomputed once per write rather than per request
+    return cache.get_or_set(f'notices:board-state:{board_version()}', compute, settings.NOTICE_CACHE_TIMEOUT)
+
+
+def archive_state():
+    """board_state() for the archived notices, which the archive page lists after the hot ones."""
+    def compute():
+        state = ArchivedNotice.objects.aggregate(last_updated=Max('updated_at'), count=Count('id'))
+        return state['last_updated'], state['count']
+    return cache.get_or_set(f'notices:archive-state:{board_version()}', compute, settings.NOTICE_CACHE_TIMEOUT)
+
+
+def notice_updated_at(pk):
+    key = f'notices:updated-at:{board_version()}:{pk}'
+    updated_at = cache.get(key)
+    if updated_at is None:
+        updated_at = Notice.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            # Not hot any more, perhaps (notices/archive.py)
+            updated_at = ArchivedNotice.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is not None:
+            cache.set(key, updated_at, settings.NOTICE_CACHE_TIMEOUT)
+    return updated_at
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5('|'.join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with 304 before the view does any real work.
+
+    Subclasses return (etag, last_modified) from get_validators(); either may be None.
+    Last-Modified is only used for anonymous visitors, because a date can't tell
+    a teacher's page (with edit controls) apart from the public one.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        etag, last_modified, response = check_preconditions(request, etag, last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        return add_validators(response, etag, last_modified)
+
+
+def check_preconditions(request, etag, last_modified):
+    """
+    Returns (etag, last_modified timestamp, response), where response is the 304/412
+    to send instead of the page, or None when the view has to run.
+    """
+    if viewer_key(request) != 'anon':
+        last_modified = None
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def add_validators(response, etag, last_modified):
+    if response.status_code not in (200, 304, 412):
+        return response
+    if etag:
+        response.headers.setdefault('ETag', etag)
+    if last_modified:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    # Let browsers keep the page but check back every time; the check is now cheap
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+class BoardConditionalMixin(ConditionalGetMixin):
+    # List pages change whenever any notice does
+    def get_validators(self, request, *args, **kwargs):
+        last_updated, count = board_state()
+        return make_etag('board', last_updated, count, viewer_key(request)), last_updated
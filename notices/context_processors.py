@@ -6,4 +6,11 @@ def vapid_key(request):
     # This function returns the public key from settings, which Django/webpush expects
     return {
         'vapid_key': settings.WEBPUSH_SETTINGS.get('VAPID_PUBLIC_KEY')
-    }
\ No newline at end of file
+    }
+
+
+def fragment_cache(request):
+    # Lifetime of the cached notice cards; their keys change with every edit anyway
+    return {
+        'card_cache_timeout': settings.NOTICE_FRAGMENT_CACHE_TIMEOUT,
+    }
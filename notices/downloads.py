@@ -0,0 +1,170 @@
+# notices/downloads.py
+#
+# Attachment downloads. Media is only served by Django's static() helper in DEBUG,
+# so production needs a real view: one that answers Range requests (resumed and
+# seeking PDF downloads), revalidates with strong ETags, and hands the bytes to
+# the kernel instead of copying them through Python.
+#
+# ATTACHMENT_SERVE_MODE picks who sends the file:
+#   'django'            FileResponse; gunicorn turns it into sendfile(2), uvicorn reads it in chunks
+#   'x-accel-redirect'  nginx sends it from an internal location (ATTACHMENT_ACCEL_PREFIX)
+#   'x-sendfile'        Apache mod_xsendfile / lighttpd send it from its path on disk
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
+from django.views import View
+
+from .models import ArchivedAttachment, Attachment
+from .streaming import is_asgi, read_in_thread
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, or None to send the whole file.
+
+    Multiple ranges and malformed headers are ignored, as RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-500: the last 500 bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+class RangeFile:
+    """
+    A file positioned at `start` that reads at most `length` bytes.
+
+    It keeps fileno(), so gunicorn's wsgi.file_wrapper still uses sendfile(2): it starts
+    at the descriptor's current offset and stops after Content-Length bytes.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def attachment_etag(attachment, stat, variant=None):
+    # Content hash when we have one; older uploads fall back to size and mtime
+    if attachment.sha256:
+        return f'"{attachment.sha256}-{variant}"' if variant else f'"{attachment.sha256}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class AttachmentDownloadView(View):
+    # None for the uploaded file, or 'thumbnail' / 'preview' for its WebP derivatives
+    variant = None
+
+    def get(self, request, pk):
+        fields = ('file', 'sha256', 'original_filename', 'thumbnail', 'preview')
+        attachment = Attachment.objects.only(*fields).filter(pk=pk).first()
+        if attachment is None:
+            # Archived along with its notice (notices/archive.py)
+            attachment = get_object_or_404(ArchivedAttachment.objects.only(*fields), pk=pk)
+        field = getattr(attachment, self.variant or 'file')
+        try:
+            path = field.path
+            stat = os.stat(path)
+        except (ValueError, FileNotFoundError):
+            raise Http404('Attachment file is missing')
+
+        etag = attachment_etag(attachment, stat, self.variant)
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self.file_response(request, field, self.get_filename(attachment), stat.st_size, etag)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        self.patch_cache_headers(request, response, attachment)
+        return response
+
+    def get_filename(self, attachment):
+        if self.variant:
+            return f'{os.path.splitext(attachment.filename())[0]}-{self.variant}.webp'
+        return attachment.filename()
+
+    def file_response(self, request, field, filename, size, etag):
+        path = field.path
+        mode = settings.ATTACHMENT_SERVE_MODE
+        if mode in ('x-accel-redirect', 'x-sendfile'):
+            # The proxy handles Range itself; we only decide who may have the file and how it's named
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = HttpResponse(content_type=content_type)
+            if mode == 'x-accel-redirect':
+                response['X-Accel-Redirect'] = quote(settings.ATTACHMENT_ACCEL_PREFIX.rstrip('/') + '/' + field.name)
+            else:
+                response['X-Sendfile'] = path
+            response['Content-Disposition'] = content_disposition_header(False, filename)
+            return response
+
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (if_range is None or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), filename=filename)
+        else:
+            start, end = byte_range
+            response = FileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), filename=filename)
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        if is_asgi(request):
+            # FileResponse has set the headers from the file; send its bytes without buffering them
+            response.streaming_content = read_in_thread(response.file_to_stream)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def patch_cache_headers(self, request, response, attachment):
+        # download_url() carries a content version: that URL can never change, so cache it for good.
+        # Without one (or with a stale one) browsers keep the file but revalidate it.
+        if attachment.sha256 and request.GET.get('v') == attachment.version():
+            patch_cache_control(response, public=True, max_age=settings.ATTACHMENT_CACHE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
@@ -0,0 +1,188 @@
+# notices/extraction.py
+#
+# Text inside attachments, for search. After an upload commits, a background
+# thread reads the file once, stores its text as an AttachmentText row keyed by
+# the content hash, and reindexes the notice; search then matches that text
+# through the usual index rows without touching files.
+#
+# Work is incremental: content whose hash already has a row is never read again,
+# so re-saving a notice or posting the same file elsewhere costs nothing.
+#
+# Only formats the standard library can read are supported: plain text, CSV/TSV
+# and Word (.docx, which is zipped XML).
+
+import codecs
+import csv
+import io
+import logging
+import os
+import re
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import cache, search
+from .models import Attachment, AttachmentText
+from .storage import content_digest
+
+logger = logging.getLogger(__name__)
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DOCX_PARTS = re.compile(r'^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$')
+
+
+def decode(data):
+    # The read may have stopped inside a character at the byte limit. The incremental decoder
+    # leaves those last bytes out, where a plain decode would fail and turn the whole text into cp1252
+    try:
+        return codecs.getincrementaldecoder('utf-8-sig')().decode(data)
+    except UnicodeDecodeError:
+        pass
+    try:
+        return data.decode('cp1252')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def extract_plain(file, limit):
+    return decode(file.read(limit))
+
+
+def extract_csv(file, limit, delimiter=','):
+    text = decode(file.read(limit))
+    # Cells become words; the separators and quoting would only get in the way of matching
+    return '\n'.join(' '.join(cell for cell in row if cell) for row in csv.reader(io.StringIO(text), delimiter=delimiter))
+
+
+def extract_tsv(file, limit):
+    return extract_csv(file, limit, delimiter='\t')
+
+
+def extract_docx(file, limit):
+    paragraphs = []
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if not DOCX_PARTS.match(info.filename):
+                continue
+            if info.file_size > limit:
+                raise ValueError(f"{info.filename} is too large ({info.file_size} bytes)")
+            with archive.open(info) as part:
+                for _, element in ElementTree.iterparse(part):
+                    if element.tag == f'{WORD_NS}p':
+                        text = ''.join(node.text or '' for node in element.iter(f'{WORD_NS}t'))
+                        if text:
+                            paragraphs.append(text)
+                        element.clear()
+    return '\n'.join(paragraphs)
+
+
+EXTRACTORS = {
+    '.txt': extract_plain,
+    '.md': extract_plain,
+    '.csv': extract_csv,
+    '.tsv': extract_tsv,
+    '.docx': extract_docx,
+}
+
+
+def is_extractable(filename):
+    return os.path.splitext(filename)[1].lower() in EXTRACTORS
+
+
+def extract_text(file, filename):
+    """Text of an open binary file, normalised and cut to ATTACHMENT_TEXT_MAX_CHARS."""
+    extractor = EXTRACTORS[os.path.splitext(filename)[1].lower()]
+    text = extractor(file, settings.ATTACHMENT_TEXT_MAX_BYTES)
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    text = re.sub(r'\s*\n\s*', '\n', text).strip()
+    return text[:settings.ATTACHMENT_TEXT_MAX_CHARS]
+
+
+def store_text(digest, attachment):
+    try:
+        with attachment.file.open('rb') as file:
+            text = extract_text(file, attachment.filename())
+        error = ''
+    except Exception as e:
+        logger.warning("Could not read text from attachment %s (%s): %s", attachment.pk, attachment.filename(), e)
+        text, error = '', str(e)[:200]
+    AttachmentText.objects.update_or_create(sha256=digest, defaults={
+        'content': zlib.compress(text.encode()), 'chars': len(text), 'error': error,
+    })
+    return len(text)
+
+
+def extract_attachments(attachments, force=False):
+    """
+    Extract text for the attachments whose content has none yet (or all of them with
+    force=True). Returns the ids of the notices whose search text changed.
+    """
+    candidates = [attachment for attachment in attachments if is_extractable(attachment.filename())]
+    for attachment in candidates:
+        if not attachment.sha256:
+            # Uploaded before content hashing: hash it now so its text can be shared like the rest
+            attachment.sha256 = content_digest(attachment.file)
+            Attachment.objects.filter(pk=attachment.pk).update(sha256=attachment.sha256)
+
+    known = set()
+    if not force:
+        known = set(AttachmentText.objects.filter(
+            sha256__in={attachment.sha256 for attachment in candidates},
+        ).values_list('sha256', flat=True))
+
+    changed = set()
+    for attachment in candidates:
+        if attachment.sha256 not in known:
+            store_text(attachment.sha256, attachment)
+            known.add(attachment.sha256)
+            changed.add(attachment.notice_id)
+        elif force:
+            changed.add(attachment.notice_id)
+    return changed
+
+
+class TextExtractor:
+    """Runs extract_attachments for new uploads on a background thread, then reindexes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='extract-text')
+
+    def schedule(self, attachment_id):
+        if not settings.TEXT_EXTRACTION_ASYNC:
+            return self.run([attachment_id])
+        self._start()
+        return self._executor.submit(self._run_in_thread, [attachment_id])
+
+    def _run_in_thread(self, attachment_ids):
+        close_old_connections()
+        try:
+            return self.run(attachment_ids)
+        except Exception:
+            logger.exception("Text extraction for attachments %s crashed", attachment_ids)
+        finally:
+            close_old_connections()
+
+    def run(self, attachment_ids, force=False):
+        attachments = Attachment.objects.filter(pk__in=attachment_ids).only(
+            'file', 'original_filename', 'sha256', 'notice',
+        )
+        notice_ids = extract_attachments(attachments, force=force)
+        if notice_ids:
+            search.index_notices(notice_ids)
+            # Cached search result pages were rendered without this text
+            cache.bump_board_version()
+        return notice_ids
+
+
+extractor = TextExtractor()
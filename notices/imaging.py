@@ -0,0 +1,42 @@
+# notices/imaging.py
+#
+# Image work for attachment previews. This module runs inside the preview process
+# pool (see notices/previews.py), so it imports Pillow and nothing from Django:
+# children only get a file path and some sizes, and hand back encoded bytes.
+
+import io
+import os
+
+from PIL import Image, ImageOps
+
+PREVIEWABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+
+def is_previewable(filename):
+    return os.path.splitext(filename)[1].lower() in PREVIEWABLE_EXTENSIONS
+
+
+def render_derivatives(source_path, sizes, quality=80, max_pixels=None):
+    """
+    Scale the image at `source_path` to fit each of `sizes` ({variant: longest side})
+    and encode it as WebP.
+
+    Returns {variant: (webp bytes, width, height)}. Images are never enlarged.
+    """
+    if max_pixels:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+    largest = max(sizes.values())
+    with Image.open(source_path) as image:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, which is most of the saving on phone photos
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        results = {}
+        for variant, side in sorted(sizes.items(), key=lambda item: -item[1]):
+            scaled = image.copy()
+            scaled.thumbnail((side, side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            scaled.save(buffer, 'WEBP', quality=quality, method=4)
+            results[variant] = (buffer.getvalue(), scaled.width, scaled.height)
+        return results
@@ -0,0 +1,294 @@
+# notices/live.py
+#
+# Live feed of notice changes over Server-Sent Events (/live/), so the board
+# screens in corridors and labs update their cards in place (see base.html)
+# instead of reloading the whole page.
+#
+# Every create, edit and delete writes a NoticeEvent row in the same
+# transaction (notices/signals.py). Each worker process runs one LiveHub: while
+# screens are connected to it, it reads new events from that table and
+# broadcasts them to all of them, so an event costs one query and one card
+# render per worker however many screens are open. Writes made by this process
+# wake the hub as soon as they commit; writes made by other workers are picked
+# up by polling every LIVE_POLL_INTERVAL seconds.
+#
+# Keeping a connection open per screen only makes sense under ASGI
+# (LIVE_STREAMING, on with SERVER_MODE=asgi). Otherwise each request answers
+# with the events the screen missed and the browser reconnects after
+# LIVE_RECONNECT_INTERVAL: still one indexed query instead of a full page.
+
+import asyncio
+import json
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from .cache import board_version
+from .models import Notice, NoticeEvent
+
+logger = logging.getLogger(__name__)
+
+# How far back the hub looks for rows committed out of order by other workers
+POLL_GRACE = timedelta(seconds=10)
+
+
+def record(notice, kind):
+    """Log a change for the live feed; called from the Notice signals."""
+    NoticeEvent.objects.create(
+        notice_id=notice.pk, kind=kind, department=notice.department, semester=notice.semester,
+    )
+    transaction.on_commit(hub.notify)
+
+
+def purge_events():
+    cutoff = timezone.now() - timedelta(hours=settings.LIVE_EVENT_RETENTION_HOURS)
+    deleted, _ = NoticeEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def latest_event_id():
+    # Cached under the board version like board_state: every event comes with a version bump,
+    # and an id that is behind only makes the feed replay a change the page already shows
+    def compute():
+        return NoticeEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    return cache.get_or_set(f'notices:latest-event:{board_version()}', compute, settings.NOTICE_CACHE_TIMEOUT)
+
+
+class LiveFeedMixin:
+    """Adds live_url to notice list pages: the feed that keeps their first page of cards current."""
+    live_filters = ('department',)
+    # The last event before the page was read; the async views look it up ahead of get_context_data
+    live_since = None
+
+    def goes_live(self):
+        # Search results and later pages aren't in posting order, so only plain first pages go live
+        return not self.fragment and not self.request.GET.get('search') and self.cursor_param not in self.request.GET
+
+    def get_context_data(self, **kwargs):
+        if self.goes_live() and self.live_since is None:
+            # Before super() pages through the notices, so a change in between is replayed, not missed
+            self.live_since = latest_event_id()
+        context = super().get_context_data(**kwargs)
+        context['live_url'] = None
+        if self.goes_live():
+            params = {name: self.request.GET[name] for name in self.live_filters if self.request.GET.get(name)}
+            # Event ids rather than the clock: the same page always links the same feed, and the feed
+            # replays every change made after this page (or its cached copy) was read
+            params['since'] = self.live_since
+            context['live_url'] = f"{reverse('notice-live')}?{urlencode(params)}"
+        return context
+
+
+class LiveMessage:
+    """An event with its card already rendered, ready to be sent to any screen."""
+
+    def __init__(self, event, html):
+        self.id = event.pk
+        self.kind = event.kind
+        self.notice_id = event.notice_id
+        self.department = event.department
+        self.semester = event.semester
+        self.html = html
+
+    def shown_on(self, department, semester):
+        # The same filters as the board and the archive
+        return (
+            (not department or self.department == department) and
+            (not semester or semester == 'ALL' or self.semester == semester)
+        )
+
+    def for_screen(self, department, semester):
+        if self.shown_on(department, semester):
+            kind = self.kind
+        elif self.kind == NoticeEvent.UPDATED:
+            # Edited into another department or semester: drop the card if the screen has it
+            kind = 'removed'
+        else:
+            # Nothing to show, but move the screen's Last-Event-ID past it
+            return f'id: {self.id}\n\n'
+        data = json.dumps({'id': self.notice_id, 'html': self.html if kind != 'removed' else ''})
+        return f'event: {kind}\nid: {self.id}\ndata: {data}\n\n'
+
+
+def render_messages(events):
+    cards = {}
+    notices = Notice.objects.select_related('posted_by').in_bulk(
+        {event.notice_id for event in events if event.kind != NoticeEvent.DELETED}
+    )
+    messages = []
+    for event in events:
+        if event.kind != NoticeEvent.DELETED:
+            notice = notices.get(event.notice_id)
+            if notice is None:
+                continue  # deleted since; its own event follows
+            if notice.pk not in cards:
+                # Rendered as anonymous visitors see it; base.html keeps an author's own controls
+                cards[notice.pk] = render_to_string('notices/_notice_card.html', {
+                    'notice': notice, 'card_cache_timeout': settings.NOTICE_FRAGMENT_CACHE_TIMEOUT,
+                })
+        messages.append(LiveMessage(event, cards.get(event.notice_id, '')))
+    return messages
+
+
+def replay(last_event_id):
+    """
+    What a screen missed after the event `last_event_id`: (messages, latest event id, complete).
+    complete is False when more than LIVE_REPLAY_LIMIT events were missed and the page should reload.
+    """
+    latest = NoticeEvent.objects.order_by('-pk').values_list('pk', flat=True).first()
+    if last_event_id is None:
+        return [], latest, True
+    limit = settings.LIVE_REPLAY_LIMIT
+    events = list(NoticeEvent.objects.filter(pk__gt=last_event_id).order_by('pk')[:limit + 1])
+    if len(events) > limit:
+        return [], latest, False
+    return render_messages(events), latest, True
+
+
+class LiveHub:
+    """Broadcasts new events to the screens connected to this process; runs on its event loop."""
+
+    def __init__(self):
+        self.loop = None
+        self.wake = None
+        self.poller = None
+        self.screens = set()
+        self.since = None
+        self.seen = {}
+
+    def connect(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            # The first screen on this loop (a worker has one; tests start a new one each time)
+            self.loop, self.wake, self.poller, self.screens = loop, asyncio.Event(), None, set()
+        queue = asyncio.Queue()
+        self.screens.add(queue)
+        if self.poller is None or self.poller.done():
+            self.since, self.seen = timezone.now(), {}
+            self.poller = loop.create_task(self.poll())
+        return queue
+
+    def disconnect(self, queue):
+        self.screens.discard(queue)
+        if not self.screens and self.poller is not None:
+            # Nobody left to tell: stop polling the database until the next screen connects
+            self.poller.cancel()
+
+    def notify(self):
+        # After a commit in this process, from whichever thread made it
+        loop, wake = self.loop, self.wake
+        if loop is None or wake is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # that loop has closed
+
+    async def poll(self):
+        while self.screens:
+            try:
+                await asyncio.wait_for(self.wake.wait(), settings.LIVE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                messages = await sync_to_async(self.fetch)()
+            except Exception:
+                logger.exception("Live feed poll failed")
+                continue
+            for message in messages:
+                for queue in list(self.screens):
+                    queue.put_nowait(message)
+
+    def fetch(self):
+        # Rows from other workers can commit a little out of order, so look back a few
+        # seconds each time and skip the ones already broadcast
+        now = timezone.now()
+        events = list(
+            NoticeEvent.objects.filter(created_at__gte=self.since - POLL_GRACE)
+            .exclude(pk__in=list(self.seen)).order_by('pk')
+        )
+        for event in events:
+            self.seen[event.pk] = event.created_at
+        self.since = now
+        self.seen = {pk: created_at for pk, created_at in self.seen.items() if created_at >= now - POLL_GRACE}
+        return render_messages(events) if events else []
+
+
+hub = LiveHub()
+
+
+async def stream(screen, last_event_id):
+    # Connect before the replay, so nothing committed in between is missed
+    queue = hub.connect()
+    try:
+        messages, latest, complete = await sync_to_async(replay)(last_event_id)
+        yield f'retry: {settings.LIVE_RECONNECT_INTERVAL * 1000}\n\n'
+        if not complete:
+            yield 'event: reload\ndata: {}\n\n'
+            return
+        replayed = set()
+        for message in messages:
+            replayed.add(message.id)
+            yield message.for_screen(*screen)
+        if latest is not None:
+            yield f'id: {latest}\n\n'
+
+        deadline = time.monotonic() + settings.LIVE_MAX_DURATION
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                message = await asyncio.wait_for(queue.get(), min(settings.LIVE_KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            if message.id not in replayed:
+                yield message.for_screen(*screen)
+        # The browser reconnects with Last-Event-ID and carries on from here
+    finally:
+        hub.disconnect(queue)
+
+
+def parse_request(request):
+    screen = (request.GET.get('department', ''), request.GET.get('semester', ''))
+    # A reconnecting browser sends the last event it saw; a page's first connection, ?since=
+    # with the last event before the page was rendered
+    last_event_id = None
+    for value in (request.headers.get('Last-Event-ID'), request.GET.get('since')):
+        try:
+            last_event_id = int(value)
+            break
+        except (TypeError, ValueError):
+            continue
+    return screen, last_event_id
+
+
+async def live_feed(request):
+    """SSE stream of created/updated/deleted notices, filtered by ?department= and ?semester=."""
+    screen, last_event_id = parse_request(request)
+    if settings.LIVE_STREAMING:
+        response = StreamingHttpResponse(stream(screen, last_event_id), content_type='text/event-stream')
+    else:
+        messages, latest, complete = await sync_to_async(replay)(last_event_id)
+        parts = [f'retry: {settings.LIVE_RECONNECT_INTERVAL * 1000}\n\n']
+        if complete:
+            parts += [message.for_screen(*screen) for message in messages]
+            if latest is not None:
+                parts.append(f'id: {latest}\n\n')
+        else:
+            parts.append('event: reload\ndata: {}\n\n')
+        response = HttpResponse(''.join(parts), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
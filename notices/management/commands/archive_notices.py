@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notices.archive import archive_cutoff, archive_notices
+from notices.models import Notice
+
+
+class Command(BaseCommand):
+    help = "Move notices older than NOTICE_ARCHIVE_AFTER_DAYS out of the hot tables into the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.NOTICE_ARCHIVE_AFTER_DAYS,
+                            help="Archive notices posted more than this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=settings.NOTICE_ARCHIVE_BATCH_SIZE,
+                            help="Notices moved per transaction.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the notices that would be archived.")
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if options['dry_run']:
+            count = Notice.objects.filter(posted_at__lt=archive_cutoff(days)).count()
+            self.stdout.write(f"{count} notices posted more than {days} days ago would be archived")
+            return
+        moved = archive_notices(days, batch_size=options['batch_size'])
+        self.stdout.write(f"Archived {moved} notices posted more than {days} days ago")
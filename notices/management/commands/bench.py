@@ -0,0 +1,397 @@
+import itertools
+import json
+import logging
+import math
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from importlib import import_module
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+import django
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from notices.models import Attachment, Notice, PushSubscription
+from notices.urls import urlpatterns
+
+# GET on create_admin changes data, and with LIVE_STREAMING notice-live never finishes,
+# so they are never benchmarked
+SKIPPED = {'create_admin', 'notice-live'}
+# Pages for signed-in teachers; requested as the author of the sample notice
+LOGIN_REQUIRED = {'create-notice', 'my-notices', 'my-notices-more', 'notice-update', 'notice-delete'}
+# Subscriptions made by the benchmark, removed again at the end
+BENCH_ENDPOINT = 'https://push.invalid/bench/'
+# The repeat-subscribe scenario cycles through this many endpoints, like open pages reloading
+RESUBSCRIBE_ENDPOINTS = 20
+
+# Filtered and searched variants of the list pages, on top of one plain request per URL
+VARIANTS = [
+    ('notice-list', {'department': 'CSE'}),
+    ('notice-list', {'search': 'exam'}),
+    ('notice-archive', {'department': 'CSE', 'semester': 'S3'}),
+    ('notice-archive', {'search': 'exam schedule'}),
+    ('api-notices', {'search': 'exam'}),
+    ('api-notices-export', {'format': 'csv'}),
+]
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank: the smallest value with at least pct% of samples at or below it
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Scenario:
+    def __init__(self, url_name, url, method='GET', login=False, headers=None, repeat=False):
+        self.url_name = url_name
+        self.url = url
+        self.method = method
+        self.login = login
+        self.headers = headers or {}
+        # For subscribe: post the same few subscriptions over and over instead of new ones
+        self.repeat = repeat
+        self.sent = itertools.count()
+
+    @property
+    def name(self):
+        label = f'{self.method} {self.url}'
+        if self.headers:
+            label += ' [' + ', '.join(f'{key}: {value}' for key, value in self.headers.items()) + ']'
+        if self.repeat:
+            label += ' [repeat]'
+        return label
+
+    def body(self):
+        if self.url_name != 'subscribe':
+            return None
+        if self.repeat:
+            endpoint = f'{BENCH_ENDPOINT}repeat/{next(self.sent) % RESUBSCRIBE_ENDPOINTS}'
+        else:
+            endpoint = f'{BENCH_ENDPOINT}{uuid.uuid4().hex}'
+        return json.dumps({
+            'endpoint': endpoint,
+            'keys': {'p256dh': 'B' + 'A' * 86, 'auth': 'A' * 22},
+            'department': 'CSE', 'semester': 'S3',
+        }).encode()
+
+
+class ClientRunner:
+    """In-process through the test client: no network, and every request's queries are counted."""
+    counts_queries = True
+
+    def __init__(self, author):
+        self.anonymous = Client()
+        self.teacher = Client()
+        self.teacher.force_login(author)
+
+    def request(self, scenario):
+        client = self.teacher if scenario.login else self.anonymous
+        headers = {f'HTTP_{key.upper().replace("-", "_")}': value for key, value in scenario.headers.items()}
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.generic(
+                scenario.method, scenario.url, data=scenario.body() or b'',
+                content_type='application/json', secure=True, **headers,
+            )
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        return time.perf_counter() - started, response.status_code, len(content), len(queries)
+
+
+class HttpRunner:
+    """Against a running server (gunicorn, runserver...), which must use the same database."""
+    counts_queries = False
+
+    def __init__(self, base_url, author, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session_cookie = self.make_session(author)
+
+    def make_session(self, user):
+        # Sign the teacher in the way django.contrib.auth.login would, without a request
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.create()
+        return f'{settings.SESSION_COOKIE_NAME}={store.session_key}'
+
+    def request(self, scenario):
+        headers = dict(scenario.headers)
+        if scenario.login:
+            headers['Cookie'] = self.session_cookie
+        body = scenario.body()
+        if body:
+            headers['Content-Type'] = 'application/json'
+        request = Request(self.base_url + scenario.url, data=body, headers=headers, method=scenario.method)
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                status, size = response.status, len(response.read())
+        except HTTPError as e:
+            status, size = e.code, len(e.read())
+        except (URLError, OSError):
+            # Timed out or refused: counted as an error, with status 0
+            status, size = 0, 0
+        return time.perf_counter() - started, status, size, None
+
+
+class SlowClients:
+    """
+    Connections that send their request a header at a time, like phones on a poor
+    network. Each one occupies a sync gunicorn worker for as long as it lasts;
+    under ASGI they only cost an idle socket.
+    """
+
+    def __init__(self, base_url, count, interval=0.5):
+        url = urlsplit(base_url)
+        self.address = (url.hostname, url.port or 80)
+        self.host = url.netloc
+        self.count = count
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def __enter__(self):
+        for _ in range(self.count):
+            thread = threading.Thread(target=self.trickle, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        time.sleep(self.interval)  # let them all get hold of a connection
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    def trickle(self):
+        while not self.stopping.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=30) as sock:
+                    sock.sendall(f'GET / HTTP/1.1\r\nHost: {self.host}\r\n'.encode())
+                    # Keep the request open until the run is over, then finish it properly
+                    while not self.stopping.wait(self.interval):
+                        sock.sendall(b'X-Slow: 1\r\n')
+                    sock.sendall(b'Connection: close\r\n\r\n')
+                    while sock.recv(65536):
+                        pass
+            except OSError:
+                # The server gave up on us (e.g. a worker timeout); reconnect
+                self.stopping.wait(self.interval)
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every notices URL repeatedly and print latency percentiles, throughput, "
+        "query counts and response sizes as JSON. Seed data first with `manage.py seed_notices`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per URL.")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per URL first.")
+        parser.add_argument('--base-url', help="Benchmark a running server instead of the in-process test client.")
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Parallel requests (only with --base-url).")
+        parser.add_argument('--timeout', type=float, default=30,
+                            help="Seconds before a request counts as failed (only with --base-url).")
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help="Hold this many connections open, trickling headers, during the run (only with --base-url).")
+        parser.add_argument('--only', action='append', default=[],
+                            help="Only URLs whose name or path contains this (repeatable).")
+        parser.add_argument('--no-cache', action='store_true',
+                            help="Disable the page cache (test client only) to time full renders.")
+        parser.add_argument('--no-fragment-cache', action='store_true',
+                            help="Disable the cached notice cards (test client only).")
+        parser.add_argument('--per-page', type=int,
+                            help="Notices per list page (test client only), e.g. 100 to time long pages.")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+        parser.add_argument('--compare', help="A previous report; prints the change per URL to stderr.")
+
+    def handle(self, *args, **options):
+        notice = (
+            Notice.objects.filter(attachments__isnull=False).select_related('posted_by').order_by('-posted_at').first()
+            or Notice.objects.select_related('posted_by').order_by('-posted_at').first()
+        )
+        if notice is None:
+            raise CommandError("No notices to benchmark. Run `manage.py seed_notices` first.")
+        attachment = notice.attachments.first()
+        # Thumbnails and previews only exist for images
+        image = Attachment.objects.filter(preview_status=Attachment.PREVIEW_READY).first()
+
+        scenarios = self.build_scenarios(notice, attachment, image, options['only'])
+        if options['base_url']:
+            runner = HttpRunner(options['base_url'], notice.posted_by, timeout=options['timeout'])
+        else:
+            if options['concurrency'] != 1:
+                raise CommandError("--concurrency needs --base-url; the test client runs one request at a time.")
+            if options['slow_clients']:
+                raise CommandError("--slow-clients needs --base-url.")
+            overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+            if options['no_cache']:
+                overrides['NOTICE_CACHE_ENABLED'] = False
+            if options['no_fragment_cache']:
+                overrides['NOTICE_FRAGMENT_CACHE_TIMEOUT'] = 0
+            if options['per_page']:
+                overrides['NOTICES_PER_PAGE'] = options['per_page']
+            runner = None
+
+        with ExitStack() as stack:
+            # Expected 404s and redirects would otherwise log a line per request
+            request_logger = logging.getLogger('django.request')
+            stack.callback(request_logger.setLevel, request_logger.level)
+            request_logger.setLevel(logging.ERROR)
+            if runner is None:
+                # The test client's host is 'testserver'
+                stack.enter_context(override_settings(**overrides))
+                runner = ClientRunner(notice.posted_by)
+            if options['slow_clients']:
+                stack.enter_context(SlowClients(options['base_url'], options['slow_clients']))
+            try:
+                results = [self.run(runner, scenario, options) for scenario in scenarios]
+            finally:
+                PushSubscription.objects.filter(endpoint__startswith=BENCH_ENDPOINT).delete()
+
+        report = {'meta': self.meta(options, runner), 'results': results}
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def build_scenarios(self, notice, attachment, image, only):
+        scenarios = []
+        for pattern in urlpatterns:
+            name = pattern.name
+            if not name or name in SKIPPED:
+                continue
+            kwargs = {}
+            if 'pk' in pattern.pattern.converters:
+                if name in ('attachment-thumbnail', 'attachment-preview'):
+                    if image is None:
+                        continue
+                    kwargs['pk'] = image.pk
+                elif name.startswith('attachment'):
+                    if attachment is None:
+                        continue
+                    kwargs['pk'] = attachment.pk
+                else:
+                    kwargs['pk'] = notice.pk
+            url = reverse(name, kwargs=kwargs)
+            method = 'POST' if name == 'subscribe' else 'GET'
+            scenarios.append(Scenario(name, url, method=method, login=name in LOGIN_REQUIRED))
+            if name == 'attachment-download':
+                scenarios.append(Scenario(name, url, headers={'Range': 'bytes=0-1023'}))
+            if name == 'subscribe':
+                scenarios.append(Scenario(name, url, method='POST', repeat=True))
+
+        for name, params in VARIANTS:
+            scenarios.append(Scenario(name, f'{reverse(name)}?{urlencode(params)}'))
+
+        if only:
+            scenarios = [s for s in scenarios if any(term in s.url_name or term in s.url for term in only)]
+        return scenarios
+
+    def run(self, runner, scenario, options):
+        for _ in range(options['warmup']):
+            runner.request(scenario)
+
+        started = time.perf_counter()
+        if options['concurrency'] > 1:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                samples = list(pool.map(lambda _: runner.request(scenario), range(options['iterations'])))
+        else:
+            samples = [runner.request(scenario) for _ in range(options['iterations'])]
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        statuses = {}
+        for _, status, _, _ in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        result = {
+            'name': scenario.name,
+            'url_name': scenario.url_name,
+            'requests': len(samples),
+            'statuses': statuses,
+            'errors': sum(1 for sample in samples if not sample[1] or sample[1] >= 500),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'max_ms': round(latencies[-1], 3),
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'bytes': round(sum(sample[2] for sample in samples) / len(samples)),
+        }
+        if runner.counts_queries:
+            queries = [sample[3] for sample in samples]
+            result['queries'] = {'min': min(queries), 'max': max(queries), 'mean': round(sum(queries) / len(queries), 2)}
+        self.stderr.write(
+            f"{scenario.name}: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+            f"{result['throughput_rps']} req/s"
+        )
+        return result
+
+    def meta(self, options, runner):
+        try:
+            revision = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            revision = None
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': revision,
+            'mode': 'http' if isinstance(runner, HttpRunner) else 'client',
+            'base_url': options['base_url'],
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'concurrency': options['concurrency'],
+            'slow_clients': options['slow_clients'],
+            'page_cache': settings.NOTICE_CACHE_ENABLED and not options['no_cache'],
+            'fragment_cache': bool(settings.NOTICE_FRAGMENT_CACHE_TIMEOUT) and not options['no_fragment_cache'],
+            'per_page': options['per_page'] or settings.NOTICES_PER_PAGE,
+            'database': connection.vendor,
+            'notices': Notice.objects.count(),
+            'attachments': Attachment.objects.count(),
+            'subscriptions': PushSubscription.objects.count(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'argv': sys.argv[1:],
+        }
+
+    def compare(self, path, results):
+        with open(path) as f:
+            baseline = {result['name']: result for result in json.load(f)['results']}
+
+        def change(before, after):
+            return f"{before:.1f} -> {after:.1f} ({(after - before) / before * 100:+.0f}%)" if before else f"{after:.1f}"
+
+        self.stderr.write(f"\nCompared with {path}:")
+        for result in results:
+            before = baseline.get(result['name'])
+            if before is None:
+                self.stderr.write(f"  {result['name']}: new")
+                continue
+            line = (
+                f"  {result['name']}: p50 {change(before['p50_ms'], result['p50_ms'])} ms, "
+                f"p95 {change(before['p95_ms'], result['p95_ms'])} ms"
+            )
+            if 'queries' in result and 'queries' in before:
+                line += f", queries {before['queries']['mean']} -> {result['queries']['mean']}"
+            self.stderr.write(line)
@@ -0,0 +1,109 @@
+import csv
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from notices.api import EXPORT_CHUNK_SIZE, EXPORT_FIELDS
+from notices.models import ArchivedAttachment, ArchivedNotice, Attachment, Notice
+from notices.storage import attachment_storage
+
+COLUMNS = [field.replace('posted_by__username', 'posted_by') for field in EXPORT_FIELDS] + ['attachments']
+
+
+class Command(BaseCommand):
+    help = (
+        "Write notices, newest first, as CSV or NDJSON that import_notices reads back. "
+        "Archived notices are included; rows are streamed, so memory use stays flat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="File to write (default: standard output).")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Default: csv for .csv files, otherwise NDJSON (one JSON object per line).")
+        parser.add_argument('--department')
+        parser.add_argument('--semester')
+        parser.add_argument('--files',
+                            help="Also copy the attachments into this directory, as <notice id>/<file name>.")
+        parser.add_argument('--recent-only', action='store_true', help="Leave out archived notices.")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        format = options['format'] or ('csv' if output.lower().endswith('.csv') else 'ndjson')
+        self.files_dir = options['files']
+        filters = {name: options[name] for name in ('department', 'semester') if options[name]}
+        tiers = [(Notice, Attachment)]
+        if not options['recent_only']:
+            tiers.append((ArchivedNotice, ArchivedAttachment))
+
+        file = self.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+        try:
+            write = self.csv_writer(file) if format == 'csv' else self.ndjson_writer(file)
+            count = 0
+            for model, attachment_model in tiers:
+                rows = (
+                    model.objects.filter(**filters).order_by('-posted_at', '-id')
+                    .values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+                )
+                for chunk in self.chunks(rows):
+                    attachments = self.attachment_paths(attachment_model, [row[0] for row in chunk])
+                    for row in chunk:
+                        write(dict(zip(COLUMNS, [*row, attachments.get(row[0], [])])))
+                    count += len(chunk)
+        finally:
+            if file is not self.stdout:
+                file.close()
+        if file is not self.stdout:
+            self.stdout.write(f"Exported {count} notices to {output}")
+
+    def chunks(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= EXPORT_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def attachment_paths(self, model, notice_ids):
+        """{notice id: [path under --files]} for one chunk of notices, copying the files if asked."""
+        paths = {}
+        rows = model.objects.filter(notice_id__in=notice_ids).order_by('id').values_list(
+            'id', 'notice_id', 'file', 'original_filename',
+        )
+        for pk, notice_id, name, original_filename in rows:
+            filename = original_filename or os.path.basename(name)
+            path = f'{notice_id}/{filename}'
+            if path in paths.get(notice_id, []):
+                path = f'{notice_id}/{pk}-{filename}'
+            paths.setdefault(notice_id, []).append(path)
+            if self.files_dir:
+                self.copy_file(name, path)
+        return paths
+
+    def copy_file(self, name, path):
+        target = os.path.join(self.files_dir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            with attachment_storage.open(name, 'rb') as source, open(target, 'wb') as destination:
+                shutil.copyfileobj(source, destination)
+        except FileNotFoundError:
+            self.stderr.write(f"Attachment file {name} is missing; listed but not copied")
+
+    def csv_writer(self, file):
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+
+        def write(record):
+            record['attachments'] = ';'.join(record['attachments'])
+            writer.writerow(record.values())
+        return write
+
+    def ndjson_writer(self, file):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        def write(record):
+            file.write(encoder.encode(record) + '\n')
+        return write
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from notices import cache, search
+from notices.extraction import extract_attachments
+from notices.models import Attachment
+
+
+class Command(BaseCommand):
+    help = "Extract searchable text from attachments that haven't been read yet and reindex their notices."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Read every supported attachment again, e.g. after changing the limits.")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        attachments = Attachment.objects.only('file', 'original_filename', 'sha256', 'notice').order_by('pk')
+        batch, notice_ids = [], set()
+        for attachment in attachments.iterator(chunk_size=options['batch_size']):
+            batch.append(attachment)
+            if len(batch) >= options['batch_size']:
+                notice_ids |= extract_attachments(batch, force=options['force'])
+                batch = []
+        notice_ids |= extract_attachments(batch, force=options['force'])
+
+        if notice_ids:
+            search.index_notices(notice_ids)
+            cache.bump_board_version()
+        self.stdout.write(f"Reindexed {len(notice_ids)} notices with new attachment text")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from notices.imaging import is_previewable
+from notices.models import Attachment
+from notices.previews import PreviewGenerator
+
+
+class Command(BaseCommand):
+    help = "Create thumbnails and WebP previews for image attachments that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Image processes (default: PREVIEW_WORKERS).")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Also try attachments whose previews failed before.")
+        parser.add_argument('--force', action='store_true',
+                            help="Render again even where previews exist, e.g. after changing the sizes.")
+
+    def handle(self, *args, **options):
+        statuses = ['', Attachment.PREVIEW_PENDING]
+        if options['retry_failed']:
+            statuses.append(Attachment.PREVIEW_FAILED)
+        if options['force']:
+            statuses.append(Attachment.PREVIEW_READY)
+
+        # Attachments uploaded before previews existed have no status yet; mark the images pending
+        candidates = Attachment.objects.filter(preview_status__in=statuses).only('file', 'original_filename')
+        ids = [a.pk for a in candidates.iterator(chunk_size=1000) if is_previewable(a.filename())]
+        self.stdout.write(f"{len(ids)} image attachments to process")
+
+        generator = PreviewGenerator(max_workers=options['workers'])
+        ready = failed = 0
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            Attachment.objects.filter(pk__in=chunk).update(preview_status=Attachment.PREVIEW_PENDING)
+            done, errors = generator.backfill(generator.pending().filter(pk__in=chunk), overwrite=options['force'])
+            ready, failed = ready + done, failed + errors
+        self.stdout.write(f"Previews ready for {ready} attachments, {failed} failed")
@@ -0,0 +1,225 @@
+import csv
+import json
+import os
+import sys
+from datetime import datetime, time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from notices import cache, search
+from notices.extraction import extract_attachments
+from notices.imaging import is_previewable
+from notices.models import Attachment, Notice, NoticeEvent
+from notices.previews import generator
+from notices.push import dispatcher
+from notices.storage import attachment_storage, content_digest
+
+# Columns read from each row; `id`, `updated_at` and anything else (as written by export_notices) is ignored
+TEXT_FIELDS = ['title', 'description']
+CHOICE_FIELDS = ['notice_type', 'department', 'semester']
+
+
+def read_records(file, format):
+    """(line number, record) pairs, read one at a time so memory doesn't grow with the file."""
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        # One JSON object per line, as export_notices and /api/notices/export/ write them
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                yield number, line
+
+
+def choice_lookup(field):
+    # Spreadsheets may say "Computer Science and Engineering" where the database says CSE
+    lookup = {}
+    for value, label in Notice._meta.get_field(field).choices:
+        lookup[value.lower()] = value
+        lookup[str(label).lower()] = value
+    return lookup
+
+
+class Command(BaseCommand):
+    help = (
+        "Create notices in bulk from a CSV or NDJSON file, such as the start-of-semester spreadsheet. "
+        "Columns: title, description, notice_type, department, semester, posted_by (a username), "
+        "and optionally posted_at and attachments (paths under --files, separated by ';' in CSV)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The file to read, or - for standard input.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Default: csv for .csv files, otherwise NDJSON (one JSON object per line).")
+        parser.add_argument('--files', help="Directory the attachment paths are relative to.")
+        parser.add_argument('--default-user',
+                            help="Username to post as where posted_by is blank or not a user here.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Notices written per transaction.")
+        parser.add_argument('--notify', action='store_true',
+                            help="Send subscribers a single push summing up the import (no pushes otherwise).")
+        parser.add_argument('--dry-run', action='store_true', help="Check every row without writing anything.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        self.files_dir = options['files']
+        self.dry_run = options['dry_run']
+        self.choices = {field: choice_lookup(field) for field in CHOICE_FIELDS}
+        self.users = {}  # username: id, or None when unknown
+        self.default_user = None
+        if options['default_user']:
+            self.default_user = self.user_id(options['default_user'])
+            if self.default_user is None:
+                raise CommandError(f"No user named {options['default_user']!r}")
+        # (department, semester): (notices, latest id, latest title), for --notify
+        self.summary = {}
+
+        created = skipped = 0
+        batch = []
+        file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            for number, record in read_records(file, format):
+                try:
+                    batch.append(self.build(record))
+                except (ValueError, ValidationError) as e:
+                    message = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+                    self.stderr.write(f"Line {number}: {message}")
+                    skipped += 1
+                    continue
+                if len(batch) >= options['batch_size']:
+                    created += self.save(batch)
+                    batch = []
+            created += self.save(batch)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        verb = "Would import" if self.dry_run else "Imported"
+        self.stdout.write(f"{verb} {created} notices, skipped {skipped} rows")
+        if options['notify'] and created and not self.dry_run:
+            stats = dispatcher.fan_out_summary(self.summary)
+            self.stdout.write(f"Summary push: {stats}")
+
+    def user_id(self, username):
+        if username not in self.users:
+            self.users[username] = User.objects.filter(username=username).values_list('id', flat=True).first()
+        return self.users[username]
+
+    def build(self, record):
+        """(unsaved notice, posted_at or None, attachment paths) for one row; ValueError if it is unusable."""
+        if isinstance(record, str):
+            record = json.loads(record)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+
+        values = {}
+        for field in TEXT_FIELDS:
+            values[field] = str(record.get(field) or '').strip()
+        for field in CHOICE_FIELDS:
+            given = str(record.get(field) or '').strip()
+            if given:
+                if given.lower() not in self.choices[field]:
+                    raise ValueError(f"unknown {field} {given!r}")
+                values[field] = self.choices[field][given.lower()]
+
+        username = str(record.get('posted_by') or '').strip()
+        posted_by = self.user_id(username) if username else None
+        if posted_by is None:
+            posted_by = self.default_user
+        if posted_by is None:
+            raise ValueError(f"no user named {username!r} (see --default-user)" if username else "posted_by is empty")
+
+        notice = Notice(posted_by_id=posted_by, **values)
+        notice.full_clean(exclude=['posted_by'], validate_unique=False, validate_constraints=False)
+        return notice, self.parse_posted_at(record.get('posted_at')), self.attachment_paths(record.get('attachments'))
+
+    def parse_posted_at(self, value):
+        value = str(value or '').strip()
+        if not value:
+            return None
+        posted_at = parse_datetime(value)
+        if posted_at is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"posted_at {value!r} is not a date")
+            posted_at = datetime.combine(day, time())
+        if timezone.is_naive(posted_at):
+            posted_at = timezone.make_aware(posted_at)
+        return posted_at
+
+    def attachment_paths(self, value):
+        if not value:
+            return []
+        paths = value if isinstance(value, list) else str(value).split(';')
+        paths = [str(path).strip() for path in paths if str(path).strip()]
+        if paths and not self.files_dir:
+            raise ValueError("has attachments but no --files directory was given")
+        for path in paths:
+            if not os.path.isfile(os.path.join(self.files_dir, path)):
+                raise ValueError(f"attachment {path!r} not found in {self.files_dir}")
+        return paths
+
+    def store_file(self, path):
+        # Content-addressed: a file that is already stored (or used by several rows) is written once
+        filename = os.path.basename(path)
+        with open(os.path.join(self.files_dir, path), 'rb') as file:
+            content = File(file, name=filename)
+            digest = content_digest(content)
+            name = attachment_storage.save(filename, content)
+        return {
+            'file': name, 'original_filename': filename, 'sha256': digest,
+            'preview_status': Attachment.PREVIEW_PENDING if is_previewable(filename) else '',
+        }
+
+    def save(self, batch):
+        if not batch or self.dry_run:
+            return len(batch)
+        stored = [[self.store_file(path) for path in paths] for _, _, paths in batch]
+
+        with transaction.atomic():
+            notices = Notice.objects.bulk_create([notice for notice, _, _ in batch])
+            # posted_at is auto_now_add, so dates from the file are written afterwards: one UPDATE
+            # per distinct date, as spreadsheet rows tend to share them (and bulk_update's CASE
+            # is quadratic on SQLite)
+            dated = {}
+            for notice, posted_at, _ in batch:
+                if posted_at is not None:
+                    notice.posted_at = notice.updated_at = posted_at
+                    dated.setdefault(posted_at, []).append(notice.pk)
+            for posted_at, ids in dated.items():
+                Notice.objects.filter(pk__in=ids).update(posted_at=posted_at, updated_at=posted_at)
+            attachments = Attachment.objects.bulk_create([
+                Attachment(notice=notice, **fields) for notice, files in zip(notices, stored) for fields in files
+            ])
+            # The live board and /api/sync/ see them as if they had been posted one by one
+            NoticeEvent.objects.bulk_create([
+                NoticeEvent(notice_id=notice.pk, kind=NoticeEvent.CREATED,
+                            department=notice.department, semester=notice.semester)
+                for notice in notices
+            ])
+
+        # bulk_create skips the signals that do the rest
+        extract_attachments(attachments)
+        search.index_notices([notice.pk for notice in notices])
+        images = [
+            attachment.pk for attachment in attachments if attachment.preview_status == Attachment.PREVIEW_PENDING
+        ]
+        if images:
+            generator.backfill(generator.pending().filter(pk__in=images))
+        cache.bump_board_version()
+
+        for notice in notices:
+            key = (notice.department, notice.semester)
+            count, latest_id, latest_title = self.summary.get(key, (0, 0, ''))
+            if notice.pk > latest_id:
+                latest_id, latest_title = notice.pk, notice.title
+            self.summary[key] = (count + 1, latest_id, latest_title)
+        self.stdout.write(f"Imported a batch of {len(notices)} notices")
+        return len(notices)
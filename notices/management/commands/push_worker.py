@@ -0,0 +1,58 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notices import live, outbox
+from notices.push import PushDispatcher
+from notices.push_transport import transport
+
+
+class Command(BaseCommand):
+    help = "Deliver queued push notifications, retrying transient failures and pruning dead subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PUSH_BATCH_SIZE,
+                            help="Deliveries claimed per batch.")
+        parser.add_argument('--concurrency', type=int, default=settings.PUSH_MAX_WORKERS,
+                            help="Parallel sends.")
+        parser.add_argument('--poll-interval', type=float, default=settings.PUSH_WORKER_POLL_INTERVAL,
+                            help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain whatever is due and exit instead of polling.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        dispatcher = PushDispatcher(max_workers=options['concurrency'])
+        last_purge = 0
+
+        self.stdout.write(f"Push worker started ({options['concurrency']} parallel sends)")
+        while not self.stopping:
+            close_old_connections()
+            stats = dispatcher.process_batch(batch_size=options['batch_size'])
+
+            # Sent and failed rows (and live feed events) are only kept for a while; clean up about once an hour
+            if time.monotonic() - last_purge > 3600:
+                purged = outbox.purge_finished()
+                if purged:
+                    self.stdout.write(f"Purged {purged} finished deliveries")
+                purged = live.purge_events()
+                if purged:
+                    self.stdout.write(f"Purged {purged} live feed events")
+                last_purge = time.monotonic()
+
+            if stats is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        transport.close()
+        self.stdout.write("Push worker stopped")
+
+    def stop(self, signum, frame):
+        # Finish the batch in hand; unclaimed rows stay in the outbox for the next start
+        self.stopping = True
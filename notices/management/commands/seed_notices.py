@@ -0,0 +1,178 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from notices import audience, cache, search
+from notices.extraction import extract_attachments
+from notices.models import DEPARTMENTS, NOTICE_TYPES, SEMESTERS, SUBSCRIPTION_DEPARTMENTS, Attachment, Notice, PushSubscription
+from notices.storage import attachment_storage, content_digest
+
+WORDS = (
+    'exam schedule timetable assignment submission deadline lab practical seminar workshop '
+    'holiday fee payment scholarship result revaluation hostel library placement internship '
+    'project viva syllabus attendance sports fest cultural club meeting notice circular hall '
+    'semester department lecture tutorial quiz marks certificate registration'
+).split()
+
+# A few shared files: uploads are stored once per content, so most attachments reuse these
+SAMPLE_FILES = [
+    ('timetable.csv', 'day,slot,subject,room\n' + '\n'.join(
+        f'{day},{slot},{subject},LH-{slot}{day[0]}' for day in ('Mon', 'Tue', 'Wed', 'Thu', 'Fri')
+        for slot, subject in enumerate(('Mathematics', 'Thermodynamics', 'Networks', 'Compilers'), 1))),
+    ('instructions.txt', 'Bring your identity card and admit card. Calculators are not allowed in the examination hall.'),
+    ('syllabus.txt', 'Unit 1: Graph theory. Unit 2: Automata. Unit 3: Turing machines. Unit 4: Complexity classes.'),
+    ('circular.pdf', '%PDF-1.4\n% placeholder circular\n' + 'x' * 4000),
+    ('form.pdf', '%PDF-1.4\n% placeholder registration form\n' + 'y' * 12000),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create synthetic teachers, notices, attachments and push subscriptions for benchmarking. "
+        "Seeded subscriptions point at push.invalid, so don't run this against a live board."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=20)
+        parser.add_argument('--notices', type=int, default=5000)
+        parser.add_argument('--attachments', type=int, default=2,
+                            help="Maximum attachments per notice (each notice gets 0..N).")
+        parser.add_argument('--subscriptions', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=365, help="Spread notices over this many past days.")
+        parser.add_argument('--today', type=int, default=25, help="Notices posted today (the default board).")
+        parser.add_argument('--prefix', default='seed',
+                            help="Username and endpoint prefix, so seeded data can be told apart and removed.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete data seeded earlier with this prefix before creating anything.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['random_seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+
+        if options['clear']:
+            self.clear(prefix)
+
+        with transaction.atomic():
+            teachers = self.create_teachers(prefix, options['teachers'], batch_size)
+            notices = self.create_notices(teachers, options['notices'], options['days'], options['today'], batch_size)
+            attachments = self.create_attachments(notices, options['attachments'], batch_size)
+            subscriptions = self.create_subscriptions(prefix, options['subscriptions'], batch_size)
+
+        # bulk_create skips the signals that keep the search index and caches up to date
+        ids = [notice.pk for notice in notices]
+        for start in range(0, len(ids), batch_size):
+            search.index_notices(ids[start:start + batch_size])
+        cache.bump_board_version()
+        audience.invalidate_segments()
+
+        self.stdout.write(
+            f"Created {options['teachers']} teachers, {len(notices)} notices, {attachments} attachments "
+            f"and {subscriptions} subscriptions (prefix '{prefix}')"
+        )
+
+    def clear(self, prefix):
+        subscriptions, _ = PushSubscription.objects.filter(endpoint__startswith=self.endpoint(prefix, '')).delete()
+        teachers = User.objects.filter(username__startswith=f'{prefix}-teacher')
+        notices = Notice.objects.filter(posted_by__in=teachers)
+        notice_count = notices.count()
+        notices.delete()
+        teachers.delete()
+        cache.bump_board_version()
+        self.stdout.write(f"Removed {notice_count} seeded notices and {subscriptions} subscriptions")
+
+    def create_teachers(self, prefix, count, batch_size):
+        # Hashing a password per user would dominate the run; they all share one
+        password = make_password('seed-password')
+        existing = User.objects.filter(username__startswith=f'{prefix}-teacher').count()
+        users = [
+            User(username=f'{prefix}-teacher{i}', email=f'{prefix}-teacher{i}@college.edu', password=password)
+            for i in range(existing, existing + count)
+        ]
+        User.objects.bulk_create(users, batch_size=batch_size)
+        return list(User.objects.filter(username__startswith=f'{prefix}-teacher'))
+
+    def sentence(self, low, high):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high)))
+
+    def create_notices(self, teachers, count, days, today, batch_size):
+        if not teachers:
+            return []
+        now = timezone.now()
+        notices = []
+        for i in range(count):
+            notices.append(Notice(
+                title=self.sentence(3, 8).capitalize(),
+                description='\n'.join(self.sentence(10, 40).capitalize() + '.' for _ in range(self.rng.randint(1, 4))),
+                posted_by=self.rng.choice(teachers),
+                notice_type=self.rng.choice(NOTICE_TYPES)[0],
+                department=self.rng.choice(DEPARTMENTS)[0],
+                semester=self.rng.choice(SEMESTERS)[0],
+            ))
+        notices = Notice.objects.bulk_create(notices, batch_size=batch_size)
+
+        # posted_at is auto_now_add, so the history is spread out in a second pass
+        for i, notice in enumerate(notices):
+            if i < today:
+                notice.posted_at = now - timedelta(seconds=i)
+            else:
+                notice.posted_at = now - timedelta(days=self.rng.randint(1, max(days, 1)), seconds=self.rng.randint(0, 86399))
+            notice.updated_at = notice.posted_at
+        Notice.objects.bulk_update(notices, ['posted_at', 'updated_at'], batch_size=batch_size)
+        return notices
+
+    def sample_attachments(self):
+        # Write each sample file once (a no-op if it is already stored) and remember its row fields
+        samples = []
+        for filename, text in SAMPLE_FILES:
+            content = ContentFile(text.encode(), name=filename)
+            digest = content_digest(content)
+            samples.append({
+                'file': attachment_storage.save(filename, content),
+                'original_filename': filename,
+                'sha256': digest,
+            })
+        return samples
+
+    def create_attachments(self, notices, per_notice, batch_size):
+        if per_notice <= 0 or not notices:
+            return 0
+        samples = self.sample_attachments()
+        attachments = []
+        for notice in notices:
+            for j in range(self.rng.randint(0, per_notice)):
+                sample = self.rng.choice(samples)
+                attachments.append(Attachment(notice=notice, name=f'Annexure {j + 1}', **sample))
+        Attachment.objects.bulk_create(attachments, batch_size=batch_size)
+        # One row per sample content is enough: extracted text is shared by hash
+        seen = {}
+        for attachment in attachments:
+            seen.setdefault(attachment.sha256, attachment)
+        extract_attachments(seen.values())
+        return len(attachments)
+
+    def endpoint(self, prefix, n):
+        return f'https://push.invalid/{prefix}/{n}'
+
+    def create_subscriptions(self, prefix, count, batch_size):
+        existing = PushSubscription.objects.filter(endpoint__startswith=self.endpoint(prefix, '')).count()
+        subscriptions = [
+            PushSubscription(
+                endpoint=self.endpoint(prefix, n),
+                p256dh_key='B' + 'A' * 86,
+                auth_key='A' * 22,
+                department=self.rng.choice(SUBSCRIPTION_DEPARTMENTS)[0],
+                semester=self.rng.choice(SEMESTERS)[0],
+            )
+            for n in range(existing, existing + count)
+        ]
+        PushSubscription.objects.bulk_create(subscriptions, batch_size=batch_size)
+        return len(subscriptions)
@@ -0,0 +1,38 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notices import storage
+
+
+class Command(BaseCommand):
+    help = ("Delete stored attachment files that no attachment refers to any more. Run it where MEDIA_ROOT "
+            "is mounted; gunicorn.conf.py starts it next to the web workers.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep running and sweep every this many seconds instead of once.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while True:
+            close_old_connections()
+            deleted = storage.sweep_blobs()
+            if deleted or not options['every']:
+                self.stdout.write(f"Deleted {deleted} unused attachment files")
+            if not options['every']:
+                break
+            # Sleep in short steps so a stop signal is acted on promptly
+            wake_at = time.monotonic() + options['every']
+            while not self.stopping and time.monotonic() < wake_at:
+                time.sleep(min(1.0, wake_at - time.monotonic()))
+            if self.stopping:
+                break
+
+    def stop(self, signum, frame):
+        self.stopping = True
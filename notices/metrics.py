@@ -0,0 +1,268 @@
+# notices/metrics.py
+#
+# Request and push metrics in the Prometheus text format, without a client library.
+#
+# Every process (each gunicorn worker, the push worker) counts in memory and,
+# at most once per METRICS_FLUSH_INTERVAL, writes its totals to its own file in
+# METRICS_DIR. A file only ever has one writer and is replaced atomically, so
+# no locking between processes is needed; /metrics adds all the files up.
+# The files of processes that have exited (gunicorn recycles its workers) are
+# folded into one EXITED_FILE as /metrics finds them, so counters never go
+# backwards and the directory doesn't grow with every worker ever started.
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.files import locks
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Totals of processes that have exited, and which of their files are in them
+EXITED_FILE = 'exited.json'
+LOCK_FILE = '.lock'
+
+# name: (type, help, buckets)
+METRICS = {
+    'notices_http_requests_total': ('counter', "Requests handled, by view, method and status.", None),
+    'notices_http_request_duration_seconds': ('histogram', "Time to produce a response, by view.", LATENCY_BUCKETS),
+    'notices_http_response_bytes': ('histogram', "Response body size, by view.", SIZE_BUCKETS),
+    'notices_db_queries_per_request': ('histogram', "SQL queries run per request, by view.", QUERY_COUNT_BUCKETS),
+    'notices_db_query_duration_seconds_total': ('counter', "Time spent in SQL queries, by view.", None),
+    'notices_template_render_duration_seconds': ('histogram', "Time spent rendering templates, by view.", LATENCY_BUCKETS),
+    'notices_push_sent_total': ('counter', "Push notifications delivered.", None),
+    'notices_push_retrying_total': ('counter', "Push sends that failed and will be retried.", None),
+    'notices_push_failed_total': ('counter', "Push sends that failed for good.", None),
+    'notices_push_deferred_total': ('counter', "Push sends put off because their push service asked us to wait, by origin.", None),
+    'notices_push_pruned_total': ('counter', "Subscriptions removed because the push service reported them gone.", None),
+    'notices_push_fanout_duration_seconds': ('histogram', "Time to deliver one notice to its audience.", LATENCY_BUCKETS),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        # One file per process lifetime: a later process that reuses the pid mustn't overwrite it
+        self.path_name = f'{self.pid}-{time.time_ns()}.json'
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0
+
+    def _check_fork(self):
+        # Inherited across a fork (gunicorn --preload): the parent's numbers belong to the parent
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, tuple(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            key = (name, tuple(labels))
+            counts, total, count = self.histograms.get(key, ([0] * len(buckets), 0, 0))
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.histograms[key] = (counts, total + value, count + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), list(counts), total, count]
+                    for (name, labels), (counts, total, count) in self.histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        if not settings.METRICS_ENABLED:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.last_flush = now
+        directory = settings.METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        write(os.path.join(directory, self.path_name), self.snapshot())
+
+
+def write(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+registry = Registry()
+atexit.register(lambda: registry.flush(force=True))
+
+
+def inc(name, labels=(), value=1):
+    if settings.METRICS_ENABLED:
+        registry.inc(name, labels, value)
+
+
+def observe(name, value, labels=()):
+    if settings.METRICS_ENABLED:
+        registry.observe(name, value, labels)
+
+
+def read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # removed or replaced while we were reading; its writer will flush again
+
+
+def add(data, counters, histograms):
+    for name, labels, value in data['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts, total, count in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        previous = histograms.get(key, ([0] * len(counts), 0, 0))
+        histograms[key] = ([a + b for a, b in zip(previous[0], counts)], previous[1] + total, previous[2] + count)
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # running, as another user
+    return True
+
+
+def exited_files(filenames):
+    """
+    The files, named '<pid>-<start time>.json' by Registry, whose process has exited: its pid
+    is no longer running, or a newer file has the same pid (the pid was reused).
+    """
+    pids, newest = {}, {}
+    for filename in filenames:
+        try:
+            pid, started = map(int, filename[:-len('.json')].split('-'))
+        except ValueError:
+            continue
+        pids[filename] = pid
+        newest[pid] = max(newest.get(pid, (started, filename)), (started, filename))
+    return [
+        filename for filename, pid in pids.items()
+        if filename != registry.path_name and (filename != newest[pid][1] or not is_running(pid))
+    ]
+
+
+def merge_exited(directory, filenames):
+    """Add the files of exited processes to EXITED_FILE and delete them. Returns the files left."""
+    path = os.path.join(directory, EXITED_FILE)
+    merged = read(path) or {'counters': [], 'histograms': [], 'files': []}
+    # A file can outlive its merge if we were stopped before deleting it
+    done = set(merged['files'])
+    exited = [filename for filename in exited_files(filenames) if filename not in done]
+    if exited:
+        counters, histograms = {}, {}
+        add(merged, counters, histograms)
+        for filename in exited:
+            data = read(os.path.join(directory, filename))
+            if data is not None:
+                add(data, counters, histograms)
+        merged = {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [
+                [name, list(labels), counts, total, count]
+                for (name, labels), (counts, total, count) in histograms.items()
+            ],
+            'files': sorted(done | set(exited)),
+        }
+        write(path, merged)
+    for filename in merged['files']:
+        try:
+            os.remove(os.path.join(directory, filename))
+        except FileNotFoundError:
+            pass
+    if merged['files']:
+        merged['files'] = []
+        write(path, merged)
+    return [filename for filename in filenames if filename not in done | set(exited)]
+
+
+def collect():
+    """Totals across every process that has written to METRICS_DIR."""
+    registry.flush(force=True)
+    counters, histograms = {}, {}
+    directory = settings.METRICS_DIR
+    if not os.path.isdir(directory):
+        return counters, histograms
+    # One /metrics request at a time reads and merges the files
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            filenames = sorted(
+                filename for filename in os.listdir(directory)
+                if filename.endswith('.json') and filename != EXITED_FILE
+            )
+            filenames = merge_exited(directory, filenames)
+            for filename in [EXITED_FILE, *filenames]:
+                data = read(os.path.join(directory, filename))
+                if data is not None:
+                    add(data, counters, histograms)
+        finally:
+            locks.unlock(lock)
+    return counters, histograms
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+            continue
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", format_number(float(bound)))])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_number(float(total))}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,154 @@
+# notices/middleware.py
+
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+# The QueryTimer of the request being handled. A context variable rather than a wrapper
+# installed per request, because under ASGI the queries of an async view run on a
+# worker thread (sync_to_async), which sees the request's context but not its connection.
+current_queries = contextvars.ContextVar('notices_current_queries', default=None)
+
+
+class QueryTimer:
+    """Counts and times the queries of one request (see time_queries)."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def time_queries(execute, sql, params, many, context):
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.duration += time.perf_counter() - started
+        queries.count += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+connection_created.connect(install_query_timer)
+
+
+class MetricsMiddleware:
+    """Record latency, SQL, template render time and response size per view (see notices/metrics.py)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        # This thread's connection may predate the connection_created receiver
+        install_query_timer(connection)
+        queries, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        return self.finish(request, response, queries, started)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        queries, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        return self.finish(request, response, queries, started)
+
+    def start(self, request):
+        request._metrics_render_time = 0.0
+        queries = QueryTimer()
+        return queries, current_queries.set(queries), time.perf_counter()
+
+    def finish(self, request, response, queries, started):
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        labels = (('view', view),)
+        metrics.inc('notices_http_requests_total', labels + (('method', request.method), ('status', response.status_code)))
+        metrics.observe('notices_http_request_duration_seconds', duration, labels)
+        metrics.observe('notices_db_queries_per_request', queries.count, labels)
+        metrics.inc('notices_db_query_duration_seconds_total', labels, queries.duration)
+        if request._metrics_render_time:
+            metrics.observe('notices_template_render_duration_seconds', request._metrics_render_time, labels)
+        size = self.response_size(response)
+        if size is not None:
+            metrics.observe('notices_http_response_bytes', size, labels)
+        metrics.registry.flush()
+        return response
+
+    def process_template_response(self, request, response):
+        if not hasattr(request, '_metrics_render_time'):
+            return response
+        # Runs just before the response is rendered; the callback runs just after
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_time += time.perf_counter() - started
+        response.add_post_render_callback(rendered)
+        return response
+
+    def response_size(self, response):
+        if not response.streaming:
+            return len(response.content)
+        length = response.get('Content-Length')
+        return int(length) if length else None
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can sit in an async middleware chain.
+
+    Stock WhiteNoiseMiddleware is sync-only, so under ASGI Django would run every
+    request (not just static files) through a thread to get past it. Serving a
+    static file only stats and opens it, which is fine to do on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
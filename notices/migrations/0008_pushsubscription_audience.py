@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0007_pushdelivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pushsubscription',
+            name='department',
+            field=models.CharField(choices=[('ALL', 'All Departments'), ('CSE', 'Computer Science and Engineering'), ('EE', 'Electrical Engineering'), ('ME', 'Mechanical Engineering'), ('CE', 'Civil Engineering')], default='ALL', max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name='pushsubscription',
+            index=models.Index(fields=['department', 'semester'], name='push_sub_audience_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:33
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0008_pushsubscription_audience'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoticeSearchIndex',
+            fields=[
+                ('notice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='notices.notice')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+            ],
+        ),
+    ]
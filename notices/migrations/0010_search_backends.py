@@ -0,0 +1,84 @@
+import os
+
+from django.db import DatabaseError, migrations
+
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE notices_search_fts USING fts5("
+    "title, body, content='notices_noticesearchindex', content_rowid='notice_id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    # Keep the FTS table in step with notices_noticesearchindex
+    "CREATE TRIGGER notices_search_fts_ai AFTER INSERT ON notices_noticesearchindex BEGIN "
+    "INSERT INTO notices_search_fts(rowid, title, body) VALUES (new.notice_id, new.title, new.body); END",
+    "CREATE TRIGGER notices_search_fts_ad AFTER DELETE ON notices_noticesearchindex BEGIN "
+    "INSERT INTO notices_search_fts(notices_search_fts, rowid, title, body) "
+    "VALUES ('delete', old.notice_id, old.title, old.body); END",
+    "CREATE TRIGGER notices_search_fts_au AFTER UPDATE ON notices_noticesearchindex BEGIN "
+    "INSERT INTO notices_search_fts(notices_search_fts, rowid, title, body) "
+    "VALUES ('delete', old.notice_id, old.title, old.body); "
+    "INSERT INTO notices_search_fts(rowid, title, body) VALUES (new.notice_id, new.title, new.body); END",
+]
+
+FTS_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS notices_search_fts_au",
+    "DROP TRIGGER IF EXISTS notices_search_fts_ad",
+    "DROP TRIGGER IF EXISTS notices_search_fts_ai",
+    "DROP TABLE IF EXISTS notices_search_fts",
+]
+
+GIN_SQL = "CREATE INDEX notices_search_vector_gin ON notices_noticesearchindex USING gin (vector)"
+GIN_DROP_SQL = "DROP INDEX IF EXISTS notices_search_vector_gin"
+
+
+def create_search_structures(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(GIN_SQL)
+    elif vendor == 'sqlite':
+        try:
+            for sql in FTS_SQL:
+                schema_editor.execute(sql)
+        except DatabaseError:
+            # SQLite built without FTS5: notices.search falls back to plain matching
+            for sql in FTS_DROP_SQL:
+                schema_editor.execute(sql)
+
+
+def drop_search_structures(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(GIN_DROP_SQL)
+    elif vendor == 'sqlite':
+        for sql in FTS_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+def index_existing_notices(apps, schema_editor):
+    Notice = apps.get_model('notices', 'Notice')
+    NoticeSearchIndex = apps.get_model('notices', 'NoticeSearchIndex')
+
+    rows = []
+    for notice in Notice.objects.select_related('posted_by').prefetch_related('attachments').iterator(chunk_size=500):
+        parts = [notice.description, notice.posted_by.username]
+        for attachment in notice.attachments.all():
+            parts += [attachment.name, os.path.basename(attachment.file.name)]
+        rows.append(NoticeSearchIndex(notice_id=notice.pk, title=notice.title, body='\n'.join(p for p in parts if p)))
+    NoticeSearchIndex.objects.bulk_create(rows, batch_size=500)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchVector
+        NoticeSearchIndex.objects.update(
+            vector=SearchVector('title', weight='A', config='english') +
+                   SearchVector('body', weight='B', config='english')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0009_noticesearchindex'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_structures, drop_search_structures),
+        migrations.RunPython(index_existing_notices, migrations.RunPython.noop),
+    ]
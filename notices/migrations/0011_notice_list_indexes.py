@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0010_search_backends'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['-posted_at', '-id'], name='notice_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['department', 'semester', '-posted_at', '-id'], name='notice_dept_sem_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['department', '-posted_at', '-id'], name='notice_dept_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['semester', '-posted_at', '-id'], name='notice_sem_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notice',
+            index=models.Index(fields=['posted_by', '-posted_at', '-id'], name='notice_author_posted_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+def copy_posted_at(apps, schema_editor):
+    # Existing notices were last changed, as far as we know, when they were posted
+    Notice = apps.get_model('notices', 'Notice')
+    Notice.objects.update(updated_at=models.F('posted_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0011_notice_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notice',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(copy_posted_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:40
+
+import notices.storage
+import os
+
+from django.db import migrations, models
+
+
+def fill_original_filenames(apps, schema_editor):
+    Attachment = apps.get_model('notices', 'Attachment')
+    for attachment in Attachment.objects.only('id', 'file').iterator(chunk_size=500):
+        Attachment.objects.filter(pk=attachment.pk).update(original_filename=os.path.basename(attachment.file.name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0012_notice_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='original_filename',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(storage=notices.storage.get_attachment_storage, upload_to='notice_attachments/multiple/'),
+        ),
+        migrations.RunPython(fill_original_filenames, migrations.RunPython.noop),
+    ]
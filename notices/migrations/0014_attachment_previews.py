@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:45
+
+import notices.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0013_attachment_content_addressing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='preview',
+            field=models.FileField(blank=True, editable=False, storage=notices.storage.get_preview_storage, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='preview_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, storage=notices.storage.get_preview_storage, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnail_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnail_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,128 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:28
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+import django.utils.timezone
+import notices.storage
+from django.conf import settings
+from django.db import DatabaseError, migrations, models
+
+# The archive's own search structures, as 0010 made for notices_noticesearchindex
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE notices_archive_fts USING fts5("
+    "title, body, content='notices_archivednoticesearchindex', content_rowid='notice_id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER notices_archive_fts_ai AFTER INSERT ON notices_archivednoticesearchindex BEGIN "
+    "INSERT INTO notices_archive_fts(rowid, title, body) VALUES (new.notice_id, new.title, new.body); END",
+    "CREATE TRIGGER notices_archive_fts_ad AFTER DELETE ON notices_archivednoticesearchindex BEGIN "
+    "INSERT INTO notices_archive_fts(notices_archive_fts, rowid, title, body) "
+    "VALUES ('delete', old.notice_id, old.title, old.body); END",
+    "CREATE TRIGGER notices_archive_fts_au AFTER UPDATE ON notices_archivednoticesearchindex BEGIN "
+    "INSERT INTO notices_archive_fts(notices_archive_fts, rowid, title, body) "
+    "VALUES ('delete', old.notice_id, old.title, old.body); "
+    "INSERT INTO notices_archive_fts(rowid, title, body) VALUES (new.notice_id, new.title, new.body); END",
+]
+
+FTS_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS notices_archive_fts_au",
+    "DROP TRIGGER IF EXISTS notices_archive_fts_ad",
+    "DROP TRIGGER IF EXISTS notices_archive_fts_ai",
+    "DROP TABLE IF EXISTS notices_archive_fts",
+]
+
+GIN_SQL = "CREATE INDEX notices_archive_vector_gin ON notices_archivednoticesearchindex USING gin (vector)"
+GIN_DROP_SQL = "DROP INDEX IF EXISTS notices_archive_vector_gin"
+
+
+def create_search_structures(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(GIN_SQL)
+    elif vendor == 'sqlite':
+        try:
+            for sql in FTS_SQL:
+                schema_editor.execute(sql)
+        except DatabaseError:
+            # SQLite built without FTS5: notices.search falls back to plain matching
+            for sql in FTS_DROP_SQL:
+                schema_editor.execute(sql)
+
+
+def drop_search_structures(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(GIN_DROP_SQL)
+    elif vendor == 'sqlite':
+        for sql in FTS_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0016_noticeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('posted_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('notice_type', models.CharField(choices=[('Common', 'Common'), ('Examinations', 'Examinations'), ('Assignments', 'Assignments'), ('Notes', 'Notes'), ('Events', 'Events'), ('Backs', 'Backs'), ('Urgent', 'Urgent')], default='Common', max_length=50)),
+                ('department', models.CharField(choices=[('CSE', 'Computer Science and Engineering'), ('EE', 'Electrical Engineering'), ('ME', 'Mechanical Engineering'), ('CE', 'Civil Engineering')], default='CSE', max_length=50)),
+                ('semester', models.CharField(choices=[('S1', 'Semester 1'), ('S2', 'Semester 2'), ('S3', 'Semester 3'), ('S4', 'Semester 4'), ('S5', 'Semester 5'), ('S6', 'Semester 6'), ('S7', 'Semester 7'), ('S8', 'Semester 8'), ('ALL', 'All Semesters')], default='ALL', max_length=50)),
+                ('description', models.TextField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('posted_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notices', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-posted_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedNoticeSearchIndex',
+            fields=[
+                ('notice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='notices.archivednotice')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttachment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('file', models.FileField(storage=notices.storage.get_attachment_storage, upload_to='notice_attachments/multiple/')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('original_filename', models.CharField(blank=True, max_length=255)),
+                ('sha256', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('preview_status', models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10)),
+                ('thumbnail', models.FileField(blank=True, editable=False, storage=notices.storage.get_preview_storage, upload_to='')),
+                ('thumbnail_width', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('thumbnail_height', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+                ('preview', models.FileField(blank=True, editable=False, storage=notices.storage.get_preview_storage, upload_to='')),
+                ('notice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='notices.archivednotice')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivednotice',
+            index=models.Index(fields=['-posted_at', '-id'], name='archived_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivednotice',
+            index=models.Index(fields=['department', 'semester', '-posted_at', '-id'], name='archived_dept_sem_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivednotice',
+            index=models.Index(fields=['department', '-posted_at', '-id'], name='archived_dept_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivednotice',
+            index=models.Index(fields=['semester', '-posted_at', '-id'], name='archived_sem_posted_idx'),
+        ),
+        migrations.RunPython(create_search_structures, drop_search_structures),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0017_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushdelivery',
+            name='payload',
+            field=models.TextField(blank=True),
+        ),
+    ]
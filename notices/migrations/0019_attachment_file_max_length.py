@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:22
+
+import notices.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notices', '0018_pushdelivery_payload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedattachment',
+            name='file',
+            field=models.FileField(max_length=255, storage=notices.storage.get_attachment_storage, upload_to='notice_attachments/multiple/'),
+        ),
+        migrations.AlterField(
+            model_name='archivedattachment',
+            name='preview',
+            field=models.FileField(blank=True, editable=False, max_length=255, storage=notices.storage.get_preview_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='archivedattachment',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, max_length=255, storage=notices.storage.get_preview_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(max_length=255, storage=notices.storage.get_attachment_storage, upload_to='notice_attachments/multiple/'),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='preview',
+            field=models.FileField(blank=True, editable=False, max_length=255, storage=notices.storage.get_preview_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, max_length=255, storage=notices.storage.get_preview_storage, upload_to=''),
+        ),
+    ]
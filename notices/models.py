@@ -1,6 +1,13 @@
 import os
-from django.db import models
+import zlib
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+
+from .imaging import is_previewable
+from .storage import content_digest, get_attachment_storage, get_preview_storage, release_blob, release_previews
 # Create your models here.
 
 NOTICE_TYPES = [
@@ -32,11 +39,16 @@ SEMESTERS=[
     ('ALL', 'All Semesters'),
 ]
 
+# Students can subscribe to every department at once
+SUBSCRIPTION_DEPARTMENTS = [('ALL', 'All Departments')] + DEPARTMENTS
+
 class Notice(models.Model):
     title = models.CharField(max_length=200)
 
     posted_by = models.ForeignKey(User, on_delete=models.CASCADE)
     posted_at = models.DateTimeField(auto_now_add=True)
+    # Changes on every save (including edits through NoticeUpdateView); feeds ETag/Last-Modified
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     notice_type = models.CharField(max_length=50, choices=NOTICE_TYPES, default='Common')
 
@@ -45,6 +57,9 @@ class Notice(models.Model):
 
     description = models.TextField()
 
+    # ArchivedNotice says True; templates hide the edit controls on archived notices
+    archived = False
+
     def filename(self):
         # This method is no longer needed since we use the Attachment model
         # for file attachments. Keeping for backward compatibility.
@@ -52,13 +67,21 @@ class Notice(models.Model):
     
     class Meta:
         ordering = ['-posted_at']
+        # Match the list filters; each ends in (posted_at, id) for the newest-first keyset pages
+        indexes = [
+            models.Index(fields=['-posted_at', '-id'], name='notice_posted_idx'),
+            models.Index(fields=['department', 'semester', '-posted_at', '-id'], name='notice_dept_sem_posted_idx'),
+            models.Index(fields=['department', '-posted_at', '-id'], name='notice_dept_posted_idx'),
+            models.Index(fields=['semester', '-posted_at', '-id'], name='notice_sem_posted_idx'),
+            models.Index(fields=['posted_by', '-posted_at', '-id'], name='notice_author_posted_idx'),
+        ]
 
     def __str__(self):
         return self.title
     
 class Attachment(models.Model):
-    # The file itself
-    file = models.FileField(upload_to='notice_attachments/multiple/')
+    # The file itself, stored once per distinct content (see notices/storage.py)
+    file = models.FileField(upload_to='notice_attachments/multiple/', storage=get_attachment_storage, max_length=255)
     
     # The link back to the parent notice (ForeignKey)
     notice = models.ForeignKey(Notice, related_name='attachments', on_delete=models.CASCADE)
@@ -66,13 +89,105 @@ class Attachment(models.Model):
     # Optional: A user-friendly name for the file
     name = models.CharField(max_length=100, blank=True) 
 
+    # Stored names are content hashes, so keep what the teacher uploaded for display
+    original_filename = models.CharField(max_length=255, blank=True)
+    # SHA-256 of the content; the blob is deleted when no attachment references it any more
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+
+    # WebP thumbnail and preview for image attachments, made in the background (notices/previews.py)
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_READY = 'ready'
+    PREVIEW_FAILED = 'failed'
+    PREVIEW_STATUSES = [
+        (PREVIEW_PENDING, 'Pending'),
+        (PREVIEW_READY, 'Ready'),
+        (PREVIEW_FAILED, 'Failed'),
+    ]
+    preview_status = models.CharField(max_length=10, choices=PREVIEW_STATUSES, blank=True)  # blank: not an image
+    thumbnail = models.FileField(storage=get_preview_storage, blank=True, editable=False, max_length=255)
+    thumbnail_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnail_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    preview = models.FileField(storage=get_preview_storage, blank=True, editable=False, max_length=255)
+
     def filename(self):
-        import os
-        return os.path.basename(self.file.name)
+        return self.original_filename or os.path.basename(self.file.name)
+
+    def version(self):
+        return self.sha256[:16]
+
+    def _versioned_url(self, url_name):
+        # Versioned by content so the download view can mark it immutable
+        url = reverse(url_name, kwargs={'pk': self.pk})
+        return f'{url}?v={self.version()}' if self.sha256 else url
+
+    def download_url(self):
+        return self._versioned_url('attachment-download')
+
+    def thumbnail_url(self):
+        return self._versioned_url('attachment-thumbnail')
+
+    def preview_url(self):
+        return self._versioned_url('attachment-preview')
+
+    def has_preview(self):
+        return self.preview_status == self.PREVIEW_READY
+
+    def save(self, *args, **kwargs):
+        replaced = None
+        if self.file and not self.file._committed:
+            # A fresh upload: remember its name and hash before the storage renames it
+            self.original_filename = os.path.basename(self.file.name)
+            self.sha256 = content_digest(self.file.file)
+            # Previews of the old file no longer apply; images get new ones after the commit
+            self.preview_status = self.PREVIEW_PENDING if is_previewable(self.original_filename) else ''
+            self.thumbnail = self.preview = ''
+            self.thumbnail_width = self.thumbnail_height = None
+            if self.pk:
+                replaced = Attachment.objects.filter(pk=self.pk).values_list(
+                    'file', 'sha256', 'thumbnail', 'preview').first()
+        super().save(*args, **kwargs)
+        if replaced and replaced[1] != self.sha256:
+            file_name, sha256, thumbnail, preview = replaced
+
+            def release():
+                release_blob(file_name, sha256)
+                release_previews(thumbnail, preview)
+            transaction.on_commit(release)
     
     def __str__(self):
         return f"{self.name or self.filename()} attached to {self.notice.title}"
     
+class AttachmentText(models.Model):
+    # Text pulled out of an attachment's content (see notices/extraction.py), once per distinct
+    # file: keyed by the same SHA-256 as the stored blob, zlib-compressed.
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    content = models.BinaryField()
+    chars = models.PositiveIntegerField(default=0)
+    # Set when the file couldn't be read, so it isn't retried on every run
+    error = models.CharField(max_length=200, blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def texts_for(cls, digests):
+        """{sha256: text} for the given digests that have any text."""
+        rows = cls.objects.filter(sha256__in=set(digests), chars__gt=0).values_list('sha256', 'content')
+        return {digest: zlib.decompress(content).decode() for digest, content in rows}
+
+    def __str__(self):
+        return f"Text of {self.sha256[:12]} ({self.chars} characters)"
+
+class NoticeSearchIndex(models.Model):
+    # Denormalised text for full-text search, one row per notice (see notices.search).
+    # On SQLite an FTS5 table mirrors title/body; on PostgreSQL `vector` holds the tsvector.
+    notice = models.OneToOneField(Notice, primary_key=True, related_name='search_index', on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    # Description, author, attachment names and the text inside attachments
+    body = models.TextField(blank=True)
+    vector = SearchVectorField(null=True, editable=False)
+
+    def __str__(self):
+        return f"Search index for {self.title}"
+
 class PushSubscription(models.Model):
     # The unique URL/identifier for the browser's service worker
     endpoint = models.URLField(max_length=500, unique=True)
@@ -86,7 +201,7 @@ class PushSubscription(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     
     # Filtering preferences (so we only notify on relevant notices)
-    department = models.CharField(max_length=3, choices=DEPARTMENTS, default='ALL')
+    department = models.CharField(max_length=3, choices=SUBSCRIPTION_DEPARTMENTS, default='ALL')
     semester = models.CharField(max_length=3, choices=SEMESTERS, default='ALL')
     
     subscribed_at = models.DateTimeField(auto_now_add=True)
@@ -97,4 +212,150 @@ class PushSubscription(models.Model):
     class Meta:
         verbose_name = "Push Subscription"
         verbose_name_plural = "Push Subscriptions"
+        indexes = [
+            # Audience lookups filter on both columns (see notices.audience)
+            models.Index(fields=['department', 'semester'], name='push_sub_audience_idx'),
+        ]
+
+
+
+class PushDelivery(models.Model):
+    # One row per (notice, subscription) push; the outbox the push worker drains
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    notice = models.ForeignKey(Notice, related_name='push_deliveries', on_delete=models.CASCADE)
+    subscription = models.ForeignKey(PushSubscription, related_name='deliveries', on_delete=models.CASCADE)
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    # Set when a worker claims the row; a lease that runs out lets another worker pick it up
+    claim_token = models.UUIDField(null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set for the summary pushed after a bulk import (notices.push.build_summary_payload);
+    # otherwise the payload is built from the notice when it is sent
+    payload = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Push of '{self.notice}' to {self.subscription.endpoint[:30]}... ({self.status})"
+
+    class Meta:
+        verbose_name = "Push Delivery"
+        verbose_name_plural = "Push Deliveries"
+        constraints = [
+            models.UniqueConstraint(fields=['notice', 'subscription'], name='unique_push_delivery'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='push_delivery_due_idx'),
+        ]
+
+
+class NoticeEvent(models.Model):
+    # One change to a notice, for the live feed (notices/live.py). Every worker's feed reads
+    # these, so a notice posted through one worker reaches screens connected to all of them.
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    KINDS = [
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (DELETED, 'Deleted'),
+    ]
+
+    # Not a foreign key: the event of a deletion outlives its notice
+    notice_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KINDS)
+    # Where the notice is shown, so screens can filter without loading it
+    department = models.CharField(max_length=50)
+    semester = models.CharField(max_length=50)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Notice {self.notice_id} {self.kind}"
+
+
+# The archive: notices older than NOTICE_ARCHIVE_AFTER_DAYS, moved out of the tables above by
+# `manage.py archive_notices` (see notices/archive.py) so those only hold what the board needs.
+# Rows keep their ids, and are read-only once here.
 
+class ArchivedNotice(models.Model):
+    # Same columns as Notice, but the dates are copied over rather than set on save
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    posted_by = models.ForeignKey(User, related_name='archived_notices', on_delete=models.CASCADE)
+    posted_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    notice_type = models.CharField(max_length=50, choices=NOTICE_TYPES, default='Common')
+    department = models.CharField(max_length=50, choices=DEPARTMENTS, default='CSE')
+    semester = models.CharField(max_length=50, choices=SEMESTERS, default='ALL')
+    description = models.TextField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    archived = True
+
+    class Meta:
+        ordering = ['-posted_at']
+        # The archive page's filters, like Notice's; no author index, My Notices only lists hot notices
+        indexes = [
+            models.Index(fields=['-posted_at', '-id'], name='archived_posted_idx'),
+            models.Index(fields=['department', 'semester', '-posted_at', '-id'], name='archived_dept_sem_posted_idx'),
+            models.Index(fields=['department', '-posted_at', '-id'], name='archived_dept_posted_idx'),
+            models.Index(fields=['semester', '-posted_at', '-id'], name='archived_sem_posted_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedAttachment(models.Model):
+    # An Attachment of an archived notice. It still refers to the same stored blob and previews,
+    # which release_blob()/release_previews() count as in use.
+    id = models.BigIntegerField(primary_key=True)
+    file = models.FileField(upload_to='notice_attachments/multiple/', storage=get_attachment_storage, max_length=255)
+    notice = models.ForeignKey(ArchivedNotice, related_name='attachments', on_delete=models.CASCADE)
+    name = models.CharField(max_length=100, blank=True)
+    original_filename = models.CharField(max_length=255, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    preview_status = models.CharField(max_length=10, choices=Attachment.PREVIEW_STATUSES, blank=True)
+    thumbnail = models.FileField(storage=get_preview_storage, blank=True, editable=False, max_length=255)
+    thumbnail_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnail_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    preview = models.FileField(storage=get_preview_storage, blank=True, editable=False, max_length=255)
+
+    # Shown and downloaded like any attachment: the download URLs fall back to this table
+    PREVIEW_READY = Attachment.PREVIEW_READY
+    filename = Attachment.filename
+    version = Attachment.version
+    _versioned_url = Attachment._versioned_url
+    download_url = Attachment.download_url
+    thumbnail_url = Attachment.thumbnail_url
+    preview_url = Attachment.preview_url
+    has_preview = Attachment.has_preview
+
+    def __str__(self):
+        return f"{self.name or self.filename()} attached to {self.notice.title}"
+
+
+class ArchivedNoticeSearchIndex(models.Model):
+    # NoticeSearchIndex rows of archived notices, with their own FTS5 table (SQLite)
+    # or GIN index (PostgreSQL), so archive searches don't weigh on the board's
+    notice = models.OneToOneField(ArchivedNotice, primary_key=True, related_name='search_index', on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+    vector = SearchVectorField(null=True, editable=False)
+
+    def __str__(self):
+        return f"Search index for {self.title}"
@@ -0,0 +1,154 @@
+# notices/outbox.py
+
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import audience
+from .models import PushDelivery, PushSubscription
+
+
+def enqueue_notice(notice, chunk_size=1000):
+    """Write one pending delivery per subscriber of the notice. Returns how many were queued."""
+    queued = 0
+    for chunk in audience.audience_chunks(notice, fields=('id',), chunk_size=chunk_size):
+        PushDelivery.objects.bulk_create(
+            [PushDelivery(notice_id=notice.pk, subscription_id=row[0]) for row in chunk],
+            ignore_conflicts=True,
+        )
+        queued += len(chunk)
+    return queued
+
+
+def enqueue_segment(notice_id, department, semester, payload, chunk_size=1000):
+    """
+    Queue `payload` for every subscription to exactly this department and semester,
+    as a delivery of `notice_id`. Returns how many were queued.
+    """
+    rows = (
+        PushSubscription.objects.filter(department=department, semester=semester)
+        .order_by().values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    )
+    queued = 0
+    chunk = []
+    for subscription_id in rows:
+        chunk.append(PushDelivery(notice_id=notice_id, subscription_id=subscription_id, payload=payload))
+        if len(chunk) >= chunk_size:
+            queued += len(PushDelivery.objects.bulk_create(chunk, ignore_conflicts=True))
+            chunk = []
+    if chunk:
+        queued += len(PushDelivery.objects.bulk_create(chunk, ignore_conflicts=True))
+    return queued
+
+
+def _due(now):
+    # Pending rows whose backoff has passed, plus rows whose worker died mid-lease
+    return (
+        Q(status=PushDelivery.PENDING, next_attempt_at__lte=now) |
+        Q(status=PushDelivery.SENDING, claimed_until__lt=now)
+    )
+
+
+def claim_batch(batch_size=None, notice_id=None):
+    """
+    Claim up to batch_size due deliveries for this worker.
+
+    The claim is a conditional UPDATE, so two workers racing for the same rows
+    can never both win them, whichever database is underneath.
+    """
+    now = timezone.now()
+    due = PushDelivery.objects.filter(_due(now))
+    if notice_id is not None:
+        due = due.filter(notice_id=notice_id)
+    candidates = list(
+        due.order_by('next_attempt_at').values_list('id', flat=True)[:batch_size or settings.PUSH_BATCH_SIZE]
+    )
+    if not candidates:
+        return []
+
+    token = uuid.uuid4()
+    PushDelivery.objects.filter(_due(now), pk__in=candidates).update(
+        status=PushDelivery.SENDING,
+        claim_token=token,
+        claimed_until=now + timedelta(seconds=settings.PUSH_CLAIM_LEASE),
+    )
+    return list(
+        PushDelivery.objects.filter(claim_token=token, status=PushDelivery.SENDING)
+        .select_related('notice', 'subscription')
+        .only(
+            'id', 'attempts', 'notice_id', 'subscription_id', 'payload',
+            'notice__id', 'notice__title', 'notice__department',
+            'subscription__endpoint', 'subscription__p256dh_key', 'subscription__auth_key',
+        )
+    )
+
+
+def retry_delay(attempts):
+    # Exponential backoff with a little jitter so retries from one fan-out don't arrive together
+    delay = min(settings.PUSH_RETRY_BASE_DELAY * (2 ** (attempts - 1)), settings.PUSH_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def mark_sent(deliveries):
+    # next_attempt_at doubles as the completion time for finished rows
+    PushDelivery.objects.filter(pk__in=[d.pk for d in deliveries]).update(
+        status=PushDelivery.SENT,
+        attempts=F('attempts') + 1,
+        next_attempt_at=timezone.now(),
+        claim_token=None,
+        claimed_until=None,
+    )
+
+
+def mark_failed(delivery, error, transient=True, retry_after=None):
+    """
+    Schedule a retry for a transient error, or give up after PUSH_MAX_ATTEMPTS.
+    The retry waits at least retry_after seconds when the push service asked for that.
+    """
+    attempts = delivery.attempts + 1
+    if transient and attempts < settings.PUSH_MAX_ATTEMPTS:
+        status = PushDelivery.PENDING
+        next_attempt_at = timezone.now() + max(retry_delay(attempts), timedelta(seconds=retry_after or 0))
+    else:
+        status = PushDelivery.FAILED
+        next_attempt_at = timezone.now()
+    PushDelivery.objects.filter(pk=delivery.pk).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=next_attempt_at,
+        last_error=str(error)[:255],
+        claim_token=None,
+        claimed_until=None,
+    )
+    return status
+
+
+def defer(deliveries, delay):
+    # Never sent (their push service is rate limited), so this isn't an attempt
+    PushDelivery.objects.filter(pk__in=[d.pk for d in deliveries]).update(
+        status=PushDelivery.PENDING,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        claim_token=None,
+        claimed_until=None,
+    )
+
+
+def prune_subscriptions(deliveries):
+    # The push service says the endpoint is gone: drop it (and, by cascade, its deliveries)
+    subscription_ids = {d.subscription_id for d in deliveries}
+    PushSubscription.objects.filter(pk__in=subscription_ids).delete()
+    return len(subscription_ids)
+
+
+def purge_finished(older_than_days=None):
+    """Delete sent and failed deliveries older than the retention window."""
+    days = settings.PUSH_DELIVERY_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = PushDelivery.objects.filter(
+        status__in=[PushDelivery.SENT, PushDelivery.FAILED], next_attempt_at__lt=cutoff,
+    ).delete()
+    return deleted
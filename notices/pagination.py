@@ -0,0 +1,143 @@
+# notices/pagination.py
+
+import base64
+import json
+from datetime import datetime
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.urls import reverse
+
+
+def encode_cursor(values):
+    # Full isoformat: DjangoJSONEncoder would cut datetimes to milliseconds and skip rows
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def after_filter(fields, values):
+    """
+    Rows that sort after `values` when ordering by `fields`, all descending.
+
+    For (posted_at, id) this is: posted_at < v0 OR (posted_at = v0 AND id < v1),
+    which the (…, posted_at, id) indexes can answer without scanning earlier pages.
+    """
+    clauses = []
+    for i, field in enumerate(fields):
+        equal = {fields[j]: values[j] for j in range(i)}
+        clauses.append(Q(**equal, **{f'{field}__lt': values[i]}))
+    return reduce(lambda a, b: a | b, clauses)
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for notice ListViews, ordered newest first by (posted_at, id).
+
+    The cursor is the sort key of the last row on the page, carried in the
+    `after` query parameter next to the page's other filters, so every page
+    costs the same however deep it is. Views created with fragment=True render
+    only `fragment_template_name` (the cards plus the next "load more" link).
+    """
+    paginate_by = None
+    cursor_param = 'after'
+    fragment = False
+    fragment_template_name = None
+    page_url_name = None
+    fragment_url_name = None
+    keyset_page = None
+
+    def get_page_size(self):
+        return self.paginate_by or settings.NOTICES_PER_PAGE
+
+    def get_keyset_fields(self, queryset):
+        # Ranked search results keep their relevance order
+        if 'rank' in queryset.query.annotations:
+            return ('rank', 'posted_at', 'id')
+        return ('posted_at', 'id')
+
+    def get_cursor_values(self, queryset, fields):
+        return self.parse_cursor(queryset, fields, decode_cursor(self.request.GET.get(self.cursor_param, '')))
+
+    def parse_cursor(self, queryset, fields, values):
+        if values is None or len(values) != len(fields):
+            return None
+        converted = []
+        for name, value in zip(fields, values):
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations such as rank: every search backend ranks with whole numbers
+                field = queryset.query.annotations[name].output_field
+            try:
+                value = field.to_python(value)
+            except Exception:
+                return None
+            if value is None:
+                return None
+            converted.append(value)
+        return converted
+
+    def page_queryset(self, queryset):
+        """(the page's rows plus one, as an unevaluated queryset; the keyset fields)"""
+        fields = self.get_keyset_fields(queryset)
+        values = self.get_cursor_values(queryset, fields)
+        if values is not None:
+            queryset = queryset.filter(after_filter(fields, values))
+        queryset = queryset.order_by(*[f'-{field}' for field in fields])
+        return queryset[:self.get_page_size() + 1], fields
+
+    def split_page(self, rows, fields):
+        # The extra row only tells us there is a next page
+        page_size = self.get_page_size()
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        return rows, self.row_cursor(rows[-1], fields)
+
+    def row_cursor(self, row, fields):
+        return encode_cursor([getattr(row, field) for field in fields])
+
+    def paginate_keyset(self, queryset):
+        queryset, fields = self.page_queryset(queryset)
+        return self.split_page(list(queryset), fields)
+
+    async def apaginate_keyset(self, queryset):
+        queryset, fields = self.page_queryset(queryset)
+        return self.split_page([row async for row in queryset], fields)
+
+    def page_url(self, base_url, cursor):
+        params = self.request.GET.copy()
+        params[self.cursor_param] = cursor
+        return f'{base_url}?{params.urlencode()}'
+
+    def get_context_data(self, **kwargs):
+        # Async views fetch the page beforehand (apaginate_keyset), sync ones here
+        if self.keyset_page is None:
+            self.keyset_page = self.paginate_keyset(self.object_list)
+        rows, next_cursor = self.keyset_page
+        context = super().get_context_data(object_list=rows, **kwargs)
+        context['next_page_url'] = None
+        context['more_url'] = None
+        if next_cursor:
+            # The plain link works without JavaScript; base.html swaps in the fragment instead
+            context['next_page_url'] = self.page_url(reverse(self.page_url_name), next_cursor)
+            context['more_url'] = self.page_url(reverse(self.fragment_url_name), next_cursor)
+        return context
+
+    def get_template_names(self):
+        if self.fragment:
+            return [self.fragment_template_name]
+        return super().get_template_names()
@@ -0,0 +1,156 @@
+# notices/previews.py
+#
+# Thumbnails and WebP previews for image attachments, so students on mobile data
+# can see what a photo of a notice is before downloading the original.
+#
+# Decoding and resizing is CPU-bound, so it runs in a small process pool rather
+# than on request threads (or threads at all: the GIL would serialise it). The
+# children only run notices.imaging.render_derivatives; reading rows and saving
+# files stays in this process.
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import cache
+from .imaging import render_derivatives
+from .models import Attachment, Notice
+from .storage import content_digest, preview_name, preview_storage, release_previews
+
+logger = logging.getLogger(__name__)
+
+
+def preview_sizes():
+    return {'thumbnail': settings.PREVIEW_THUMBNAIL_SIZE, 'preview': settings.PREVIEW_SIZE}
+
+
+def render_args(attachment):
+    return (attachment.file.path, preview_sizes(), settings.PREVIEW_WEBP_QUALITY, settings.PREVIEW_MAX_PIXELS)
+
+
+class PreviewGenerator:
+    """
+    Makes previews for attachments whose preview_status is pending.
+
+    New uploads are scheduled from a post_save signal once their transaction commits;
+    a single coordinator thread hands them to the process pool and stores the results.
+    `manage.py generate_previews` uses the same generator to backfill older attachments.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._coordinator = None
+        self._processes = None
+
+    def _start(self):
+        # Lazy, so each gunicorn worker gets its own pools after the fork. Children come from
+        # a forkserver: forking a process that already runs threads can copy held locks.
+        with self._lock:
+            if self._coordinator is None:
+                workers = self.max_workers or settings.PREVIEW_WORKERS
+                self._coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix='previews')
+                self._processes = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('forkserver'),
+                )
+                self.max_workers = workers
+
+    def schedule(self, attachment_id):
+        if not settings.PREVIEWS_ASYNC:
+            return self.generate(attachment_id)
+        self._start()
+        return self._coordinator.submit(self._generate_in_thread, attachment_id)
+
+    def _generate_in_thread(self, attachment_id):
+        close_old_connections()
+        try:
+            return self.generate(attachment_id)
+        except Exception:
+            logger.exception("Preview generation for attachment %s crashed", attachment_id)
+        finally:
+            close_old_connections()
+
+    def pending(self):
+        return Attachment.objects.filter(preview_status=Attachment.PREVIEW_PENDING)
+
+    def generate(self, attachment_id):
+        attachment = self.pending().filter(pk=attachment_id).first()
+        if attachment is None:
+            return None  # deleted, replaced by a non-image, or already done
+        try:
+            if settings.PREVIEWS_ASYNC:
+                rendered = self._processes.submit(render_derivatives, *render_args(attachment)).result()
+            else:
+                rendered = render_derivatives(*render_args(attachment))
+        except Exception as e:
+            return self.store_failure(attachment, e)
+        return self.store(attachment, rendered)
+
+    def backfill(self, attachments, overwrite=False):
+        """Render previews for pending attachments in parallel. Returns (ready, failed) counts."""
+        self._start()
+        ready = failed = 0
+        futures = {}
+        for attachment in attachments:
+            futures[self._processes.submit(render_derivatives, *render_args(attachment))] = attachment
+            # Keep a bounded number of images in flight
+            if len(futures) >= self.max_workers * 4:
+                done = next(as_completed(futures))
+                ok = self._collect(futures.pop(done), done, overwrite)
+                ready, failed = ready + ok, failed + (not ok)
+        for done in as_completed(futures):
+            ok = self._collect(futures[done], done, overwrite)
+            ready, failed = ready + ok, failed + (not ok)
+        return ready, failed
+
+    def _collect(self, attachment, future, overwrite):
+        try:
+            rendered = future.result()
+        except Exception as e:
+            self.store_failure(attachment, e)
+            return False
+        return self.store(attachment, rendered, overwrite) is not None
+
+    def store(self, attachment, rendered, overwrite=False):
+        # Same image, same previews: files already written for another attachment are reused
+        digest = attachment.sha256 or content_digest(attachment.file)
+        names = {}
+        for variant, (data, *_) in rendered.items():
+            name = preview_name(digest, variant)
+            if overwrite:
+                preview_storage.delete(name)
+            if not preview_storage.exists(name):
+                name = preview_storage.save(name, ContentFile(data))
+            names[variant] = name
+        width, height = rendered['thumbnail'][1:]
+        if not self._finish(attachment, preview_status=Attachment.PREVIEW_READY, thumbnail_width=width,
+                            thumbnail_height=height, **names):
+            release_previews(*names.values())
+            return None
+        logger.info("Previews ready for attachment %s", attachment.pk)
+        return names
+
+    def store_failure(self, attachment, error):
+        logger.warning("No preview for attachment %s (%s): %s", attachment.pk, attachment.filename(), error)
+        self._finish(attachment, preview_status=Attachment.PREVIEW_FAILED)
+        return None
+
+    def _finish(self, attachment, **fields):
+        # Only if the row still holds the file we rendered; it may have been replaced or deleted meanwhile
+        updated = Attachment.objects.filter(
+            pk=attachment.pk, file=attachment.file.name, preview_status=Attachment.PREVIEW_PENDING,
+        ).update(**fields)
+        if updated:
+            # The notice page shows the previews now: move its ETag on and drop cached pages
+            Notice.objects.filter(pk=attachment.notice_id).update(updated_at=timezone.now())
+            cache.bump_board_version()
+        return updated
+
+
+generator = PreviewGenerator()
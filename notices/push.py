@@ -0,0 +1,284 @@
+# notices/push.py
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain, zip_longest
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from . import audience, metrics, outbox
+from .models import SUBSCRIPTION_DEPARTMENTS, Notice, PushDelivery, PushSubscription
+from .push_transport import Deferred, endpoint_origin, error_retry_after, transport
+
+logger = logging.getLogger(__name__)
+
+
+def build_payload(notice):
+    # What the student's browser will display
+    return json.dumps({
+        "title": f"New Notice: {notice.get_department_display()}",
+        "body": notice.title,
+        "url": reverse('notice-detail', kwargs={'pk': notice.pk}),
+    })
+
+
+def build_summary_payload(count, latest_title, department, semester):
+    # One push for a whole import: how many notices there are, and the archive filtered to them
+    params = {name: value for name, value in (('department', department), ('semester', semester)) if value != 'ALL'}
+    url = reverse('notice-archive')
+    title = f"{count} New Notices"
+    if params:
+        url = f"{url}?{urlencode(params)}"
+    if department != 'ALL':
+        title = f"{title}: {dict(SUBSCRIPTION_DEPARTMENTS)[department]}"
+    return json.dumps({"title": title, "body": f"Latest: {latest_title}", "url": url})
+
+
+# Push service answers that mean the subscription no longer exists
+GONE_STATUSES = {404, 410}
+
+
+def response_status(error):
+    # requests responses have status_code, aiohttp ones status
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    return getattr(response, 'status_code', getattr(response, 'status', None))
+
+
+def is_transient(error):
+    # No response (network trouble), rate limiting and server errors are worth retrying
+    status = response_status(error)
+    if status is None:
+        return True
+    return status == 429 or status >= 500
+
+
+def is_gone(error):
+    return response_status(error) in GONE_STATUSES
+
+
+def interleave_origins(jobs):
+    """
+    The jobs taking turns between push services, so a slow or rate limited service
+    holds up its own sends rather than the whole pool.
+    """
+    by_origin = {}
+    for job in jobs:
+        by_origin.setdefault(endpoint_origin(job[0].subscription.endpoint), []).append(job)
+    return [job for job in chain.from_iterable(zip_longest(*by_origin.values())) if job is not None]
+
+
+class PushDispatcher:
+    """
+    Delivers queued pushes (see notices.outbox) off the request thread.
+
+    New notices are written to the outbox and, unless PUSH_INLINE_DRAIN is off,
+    drained straight away on a background coordinator thread. Each claimed batch
+    is sent through a pool of at most PUSH_MAX_WORKERS threads or, with
+    PUSH_SENDER = 'asyncio', on an event loop in the coordinator thread with at
+    most PUSH_MAX_WORKERS requests in flight. Connections, VAPID headers and
+    rate limits are kept per push service by notices.push_transport. The push_worker
+    command uses the same dispatcher to pick up retries and anything left behind
+    by a restart.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._coordinator = None
+        self._senders = None
+
+    def _start(self):
+        # Pools are created lazily so each gunicorn worker gets its own after the fork
+        with self._lock:
+            if self._coordinator is None:
+                workers = self.max_workers or settings.PUSH_MAX_WORKERS
+                self._coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix='push-fanout')
+                self._senders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='push-send')
+                self.max_workers = workers
+
+    def dispatch(self, notice_id):
+        if not settings.PUSH_ASYNC:
+            return self.fan_out(notice_id)
+        self._start()
+        return self._coordinator.submit(self._fan_out_in_thread, notice_id)
+
+    def _fan_out_in_thread(self, notice_id):
+        close_old_connections()
+        try:
+            return self.fan_out(notice_id)
+        except Exception:
+            logger.exception("Push fan-out for notice %s crashed", notice_id)
+        finally:
+            close_old_connections()
+
+    def fan_out(self, notice_id):
+        notice = Notice.objects.filter(pk=notice_id).first()
+        if notice is None:
+            return None
+        queued = outbox.enqueue_notice(notice)
+        logger.info(
+            "Queued %d pushes for notice %s (%s/%s segment: %d subscribers)",
+            queued, notice.pk, notice.department, notice.semester,
+            audience.segment_size(notice.department, notice.semester),
+        )
+        if not settings.PUSH_INLINE_DRAIN:
+            return {'queued': queued}
+        return self.drain(notice_id=notice.pk)
+
+    def fan_out_summary(self, groups):
+        """
+        Queue a single push per subscriber for many notices posted at once (import_notices)
+        instead of one per notice, then send like fan_out. `groups` maps each (department,
+        semester) posted to onto (number of notices, id and title of the latest one).
+        """
+        queued = 0
+        segments = PushSubscription.objects.order_by().values_list('department', 'semester').distinct()
+        for department, semester in segments:
+            matching = [
+                group for (notice_department, notice_semester), group in groups.items()
+                if audience.reaches(department, semester, notice_department, notice_semester)
+            ]
+            if not matching:
+                continue
+            count = sum(group[0] for group in matching)
+            latest_id, latest_title = max((group[1], group[2]) for group in matching)
+            # A single notice gets its usual push
+            payload = build_summary_payload(count, latest_title, department, semester) if count > 1 else ''
+            queued += outbox.enqueue_segment(latest_id, department, semester, payload)
+        logger.info("Queued %d summary pushes for %d notices", queued, sum(group[0] for group in groups.values()))
+        if not settings.PUSH_INLINE_DRAIN:
+            return {'queued': queued}
+        return self.drain()
+
+    def drain(self, notice_id=None, batch_size=None):
+        """Process batches until nothing is due. Returns the summed batch stats."""
+        started = time.monotonic()
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0, 'pruned': 0}
+        while True:
+            stats = self.process_batch(notice_id=notice_id, batch_size=batch_size)
+            if stats is None:
+                break
+            for key in totals:
+                totals[key] += stats[key]
+        totals['duration'] = time.monotonic() - started
+        if notice_id is not None:
+            metrics.observe('notices_push_fanout_duration_seconds', totals['duration'])
+            logger.info(
+                "Push fan-out for notice %s: %d sent, %d retrying, %d failed, %d pruned in %.2fs",
+                notice_id, totals['sent'], totals['retrying'], totals['failed'], totals['pruned'],
+                totals['duration'],
+            )
+        return totals
+
+    def process_batch(self, notice_id=None, batch_size=None):
+        """Claim and send one batch. Returns None when there was nothing to claim."""
+        deliveries = outbox.claim_batch(batch_size=batch_size, notice_id=notice_id)
+        if not deliveries:
+            return None
+        self._start()
+        started = time.monotonic()
+
+        payloads = {}
+        jobs = []
+        for delivery in deliveries:
+            if delivery.payload:
+                jobs.append((delivery, delivery.payload))
+                continue
+            if delivery.notice_id not in payloads:
+                payloads[delivery.notice_id] = build_payload(delivery.notice)
+            jobs.append((delivery, payloads[delivery.notice_id]))
+
+        sent, gone, latencies = [], [], []
+        deferred = {}
+        retrying = failed = 0
+        for delivery, result in self.send_all(jobs):
+            if not isinstance(result, Exception):
+                latencies.append(result)
+                sent.append(delivery)
+                continue
+            if isinstance(result, Deferred):
+                delay, waiting = deferred.get(result.origin, (0, []))
+                deferred[result.origin] = (max(delay, result.delay), waiting + [delivery])
+                continue
+            if is_gone(result):
+                gone.append(delivery)
+                continue
+            logger.warning("Push to %s... failed: %s", delivery.subscription.endpoint[:40], result)
+            status = outbox.mark_failed(
+                delivery, result, transient=is_transient(result), retry_after=error_retry_after(result),
+            )
+            if status == PushDelivery.PENDING:
+                retrying += 1
+            else:
+                failed += 1
+
+        outbox.mark_sent(sent)
+        pruned = outbox.prune_subscriptions(gone) if gone else 0
+        for origin, (delay, waiting) in deferred.items():
+            logger.info("Push service %s is rate limited: %d sends put off for %.0fs", origin, len(waiting), delay)
+            outbox.defer(waiting, delay)
+            metrics.inc('notices_push_deferred_total', (('origin', origin),), len(waiting))
+
+        metrics.inc('notices_push_sent_total', value=len(sent))
+        metrics.inc('notices_push_retrying_total', value=retrying)
+        metrics.inc('notices_push_failed_total', value=failed)
+        metrics.inc('notices_push_pruned_total', value=pruned)
+        # Fan-out runs outside any request (and in the push worker), so write the numbers out here
+        metrics.registry.flush()
+
+        latencies.sort()
+        logger.info(
+            "Push batch: %d sent, %d retrying, %d failed, %d pruned in %.2fs (median send %.0f ms)",
+            len(sent), retrying, failed, pruned, time.monotonic() - started,
+            latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        )
+        return {'sent': len(sent), 'retrying': retrying, 'failed': failed, 'pruned': pruned}
+
+    def send_all(self, jobs):
+        """Send (delivery, payload) pairs. Returns (delivery, latency or the exception raised) pairs."""
+        jobs = interleave_origins(jobs)
+        if settings.PUSH_SENDER == 'asyncio':
+            return transport.run(self.send_all_async(jobs))
+
+        futures = {}
+        for delivery, payload in jobs:
+            subscription = delivery.subscription
+            future = self._senders.submit(
+                transport.send, subscription.endpoint, subscription.p256dh_key, subscription.auth_key, payload,
+            )
+            futures[future] = delivery
+        results = []
+        for future in wait(futures).done:
+            try:
+                results.append((futures[future], future.result()))
+            except Exception as e:
+                results.append((futures[future], e))
+        return results
+
+    async def send_all_async(self, jobs):
+        # Up to max_workers sends in flight on one thread, instead of a thread per send
+        limit = asyncio.Semaphore(self.max_workers)
+
+        async def send(delivery, payload):
+            subscription = delivery.subscription
+            async with limit:
+                try:
+                    return delivery, await transport.send_async(
+                        subscription.endpoint, subscription.p256dh_key, subscription.auth_key, payload,
+                    )
+                except Exception as e:
+                    return delivery, e
+
+        return await asyncio.gather(*(send(delivery, payload) for delivery, payload in jobs))
+
+
+dispatcher = PushDispatcher()
@@ -0,0 +1,226 @@
+# notices/push_transport.py
+#
+# How pushes reach the push services. Nearly every subscription lives on one of
+# a handful of services (FCM, Mozilla autopush, Apple), so everything here is
+# kept per origin (scheme://host of the endpoint) for the life of the process:
+#
+# - a keep-alive connection pool (a requests session for the threads sender,
+#   an aiohttp session per event loop for the asyncio one), with at most
+#   PUSH_ORIGIN_CONCURRENCY connections to any one service;
+# - the signed VAPID header, which is only valid for that origin and is reused
+#   until shortly before it expires instead of being signed for every send;
+# - rate limiting: sends are spaced to PUSH_ORIGIN_RATE per second, and after a
+#   429 or 503 with Retry-After nothing more goes to that service until the
+#   time is up. Sends that would have to wait longer than PUSH_ORIGIN_MAX_WAIT
+#   raise Deferred instead, and the outbox puts them back without counting an
+#   attempt.
+
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from django.conf import settings
+from django.utils.http import parse_http_date_safe
+from py_vapid import Vapid
+from pywebpush import WebPusher, WebPushException
+from requests.adapters import HTTPAdapter
+
+# Answers that mean "slow down" when they come with a Retry-After
+THROTTLE_STATUSES = {429, 503}
+# Sign a fresh VAPID header once the cached one has less than this many seconds left
+VAPID_REFRESH_MARGIN = 3600
+
+
+class Deferred(Exception):
+    """Not sent: the push service at `origin` asked us to wait `delay` seconds."""
+
+    def __init__(self, origin, delay):
+        super().__init__(f"{origin} is rate limited for another {delay:.0f}s")
+        self.origin = origin
+        self.delay = delay
+
+
+def endpoint_origin(endpoint):
+    parts = urlsplit(endpoint)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    timestamp = parse_http_date_safe(value)
+    if timestamp is None:
+        return None
+    return max(timestamp - time.time(), 0)
+
+
+def error_retry_after(error):
+    """The Retry-After of a failed send, if the push service gave one."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    return retry_after_seconds(headers.get('Retry-After'))
+
+
+class Origin:
+    """What the transport keeps about one push service."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.blocked_until = 0.0  # time.monotonic()
+        self.next_send = 0.0  # time.monotonic()
+        self.vapid_header = None
+        self.vapid_expires = 0  # time.time()
+        self.session = None
+
+    def reserve(self):
+        """Seconds to wait before sending to this origin. Raises Deferred if that is too long."""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.blocked_until)
+            if settings.PUSH_ORIGIN_RATE:
+                start = max(start, self.next_send)
+            wait = start - now
+            if wait > settings.PUSH_ORIGIN_MAX_WAIT:
+                raise Deferred(self.name, wait)
+            if settings.PUSH_ORIGIN_RATE:
+                self.next_send = start + 1 / settings.PUSH_ORIGIN_RATE
+            return wait
+
+    def block(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def requests_session(self):
+        with self.lock:
+            if self.session is None:
+                # pool_block: threads wait for one of the origin's connections rather than opening more
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=settings.PUSH_ORIGIN_CONCURRENCY, pool_block=True,
+                )
+                self.session = requests.Session()
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+            return self.session
+
+
+class PushTransport:
+    """Sends encrypted pushes with pooled connections, cached VAPID headers and per-origin rate limits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origins = {}
+        self._vapid = None
+        # Event loops are per sending thread and kept between batches, so their connections stay open
+        self._local = threading.local()
+        self._loops = []
+
+    def origin(self, endpoint):
+        name = endpoint_origin(endpoint)
+        with self._lock:
+            if name not in self._origins:
+                self._origins[name] = Origin(name)
+            return self._origins[name]
+
+    def vapid_headers(self, origin):
+        webpush_settings = getattr(settings, 'WEBPUSH_SETTINGS', {})
+        private_key = webpush_settings.get('VAPID_PRIVATE_KEY')
+        if not private_key:
+            return {}
+        with origin.lock:
+            if origin.vapid_expires - time.time() < VAPID_REFRESH_MARGIN:
+                if self._vapid is None or self._vapid[0] != private_key:
+                    self._vapid = (private_key, Vapid.from_string(private_key=private_key))
+                expires = int(time.time()) + settings.PUSH_VAPID_TTL
+                origin.vapid_header = self._vapid[1].sign({
+                    'sub': f"mailto:{webpush_settings.get('VAPID_ADMIN_EMAIL')}",
+                    'aud': origin.name,
+                    'exp': expires,
+                })
+                origin.vapid_expires = expires
+            return dict(origin.vapid_header)
+
+    def check(self, origin, status, reason, headers, response):
+        if status <= 202:
+            return
+        if status in THROTTLE_STATUSES:
+            delay = retry_after_seconds(headers.get('Retry-After'))
+            if delay is None and status == 429:
+                delay = settings.PUSH_RETRY_BASE_DELAY
+            if delay:
+                origin.block(delay)
+        raise WebPushException(f"Push failed: {status} {reason}", response=response)
+
+    def send(self, endpoint, p256dh, auth, payload):
+        """Send one notification. Returns the latency in seconds; raises WebPushException or Deferred."""
+        origin = self.origin(endpoint)
+        time.sleep(origin.reserve())
+        started = time.monotonic()
+        pusher = WebPusher(
+            {'endpoint': endpoint, 'keys': {'p256dh': p256dh, 'auth': auth}},
+            requests_session=origin.requests_session(),
+        )
+        response = pusher.send(
+            payload, self.vapid_headers(origin), ttl=settings.PUSH_TTL, timeout=settings.PUSH_TIMEOUT,
+        )
+        self.check(origin, response.status_code, response.reason, response.headers, response)
+        return time.monotonic() - started
+
+    async def send_async(self, endpoint, p256dh, auth, payload):
+        """send() for the event loop run by run()."""
+        origin = self.origin(endpoint)
+        await asyncio.sleep(origin.reserve())
+        started = time.monotonic()
+        pusher = WebPusher(
+            {'endpoint': endpoint, 'keys': {'p256dh': p256dh, 'auth': auth}},
+            aiohttp_session=self.aiohttp_session(origin),
+        )
+        response = await pusher.send_async(
+            payload, self.vapid_headers(origin), ttl=settings.PUSH_TTL,
+            timeout=aiohttp.ClientTimeout(total=settings.PUSH_TIMEOUT),
+        )
+        self.check(origin, response.status, response.reason, response.headers, response)
+        return time.monotonic() - started
+
+    def aiohttp_session(self, origin):
+        sessions = self._local.sessions
+        if origin.name not in sessions:
+            connector = aiohttp.TCPConnector(limit=settings.PUSH_ORIGIN_CONCURRENCY)
+            sessions[origin.name] = aiohttp.ClientSession(connector=connector)
+        return sessions[origin.name]
+
+    def run(self, coroutine):
+        """Run a coroutine that uses send_async on this thread's event loop."""
+        loop = getattr(self._local, 'loop', None)
+        if loop is None or loop.is_closed():
+            loop = self._local.loop = asyncio.new_event_loop()
+            self._local.sessions = {}
+            with self._lock:
+                self._loops.append((loop, self._local.sessions))
+        return loop.run_until_complete(coroutine)
+
+    def close(self):
+        """Close every pooled connection (the next send opens new ones)."""
+        with self._lock:
+            origins, self._origins = list(self._origins.values()), {}
+            loops, self._loops = self._loops, []
+        for origin in origins:
+            if origin.session is not None:
+                origin.session.close()
+        for loop, sessions in loops:
+            if loop.is_running() or loop.is_closed():
+                continue
+            for session in sessions.values():
+                loop.run_until_complete(session.close())
+            loop.close()
+        self._local = threading.local()
+
+
+transport = PushTransport()
@@ -0,0 +1,158 @@
+# notices/replicas.py
+#
+# Optional read replica. With REPLICA_DATABASE_URL set, settings add a 'replica'
+# database and READ_REPLICA names it: ReplicaMiddleware marks GET and HEAD
+# requests, and ReplicaRouter sends their reads there, so the public board,
+# archive and notice pages stop competing with teacher writes and push
+# subscriptions on the primary. Everything else reads the primary: other
+# methods, background threads and management commands, and every write.
+#
+# A replica runs a little behind, so a request reads the primary instead when
+#  - its browser wrote something (any POST, signing in included) less than
+#    REPLICA_STICKY_SECONDS ago: a cookie set on the response says so, and a
+#    teacher sees their new notice, and their session, straight away;
+#  - any notice changed in that time (see note_board_write): cached pages and
+#    board state are stored under the new board version, and must not be
+#    rendered from a replica that hasn't caught up with the change yet;
+#  - the replica failed its last health check. It is checked at most every
+#    REPLICA_HEALTH_CHECK_INTERVAL seconds per process; on PostgreSQL a standby
+#    more than REPLICA_MAX_LAG seconds behind counts as unhealthy too.
+
+import contextvars
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# The alias this request's reads go to, if not the primary
+read_from = contextvars.ContextVar('notices_read_from', default=None)
+
+STICKY_COOKIE = 'read_primary'
+BOARD_WRITE_KEY = 'notices:board-written-at'
+SAFE_METHODS = {'GET', 'HEAD'}
+
+# How far a PostgreSQL standby is behind: 0 when it has replayed all it received (the
+# last replay timestamp alone keeps growing while the primary is idle), None on a primary
+PG_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+# alias: (healthy, monotonic time of the check), per process
+health = {}
+
+
+def note_board_write():
+    """Called on every board change (cache.bump_board_version): reads use the primary for a while."""
+    if settings.READ_REPLICA and settings.REPLICA_STICKY_SECONDS:
+        cache.set(BOARD_WRITE_KEY, time.time(), settings.REPLICA_STICKY_SECONDS)
+
+
+def check(alias):
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(PG_LAG_SQL)
+                lag = cursor.fetchone()[0]
+            else:
+                cursor.execute('SELECT 1')
+                lag = None
+    except DatabaseError as e:
+        logger.warning("Read replica %r is unavailable, reading from the primary: %s", alias, e)
+        return False
+    if lag is not None and lag > settings.REPLICA_MAX_LAG:
+        logger.warning("Read replica %r is %.0fs behind, reading from the primary", alias, lag)
+        return False
+    return True
+
+
+def due(alias):
+    checked_at = health.get(alias, (False, None))[1]
+    return checked_at is None or time.monotonic() - checked_at >= settings.REPLICA_HEALTH_CHECK_INTERVAL
+
+
+def record(alias, healthy):
+    health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def wants_replica(request, written_at):
+    if request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES:
+        return False
+    return written_at is None or time.time() - written_at >= settings.REPLICA_STICKY_SECONDS
+
+
+class ReplicaMiddleware:
+    """Send the reads of GET and HEAD requests to READ_REPLICA (see ReplicaRouter)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        alias = settings.READ_REPLICA
+        if not alias:
+            return self.get_response(request)
+
+        use_replica = wants_replica(request, cache.get(BOARD_WRITE_KEY))
+        if use_replica:
+            use_replica = record(alias, check(alias)) if due(alias) else health[alias][0]
+        token = read_from.set(alias if use_replica else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        alias = settings.READ_REPLICA
+        if not alias:
+            return await self.get_response(request)
+
+        use_replica = wants_replica(request, await cache.aget(BOARD_WRITE_KEY))
+        if use_replica:
+            use_replica = record(alias, await sync_to_async(check)(alias)) if due(alias) else health[alias][0]
+        token = read_from.set(alias if use_replica else None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_from.reset(token)
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        if request.method not in SAFE_METHODS and settings.REPLICA_STICKY_SECONDS:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+                secure=request.is_secure(),
+            )
+        return response
+
+
+class ReplicaRouter:
+    """Reads go where ReplicaMiddleware says; writes always go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return read_from.get()
+
+    def db_for_write(self, model, **hints):
+        # Even for objects that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The same data either way
+        aliases = {DEFAULT_DB_ALIAS, settings.READ_REPLICA}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
@@ -0,0 +1,159 @@
+# notices/search.py
+#
+# Full-text search over notices. Each notice has a NoticeSearchIndex row holding
+# its title and a text body (description, author, attachment names and the text
+# extracted from attachments by notices/extraction.py) that is kept in sync by
+# the signals in notices/signals.py. The backend decides how that row
+# is queried:
+#
+#   PostgresSearchBackend  tsvector column with a GIN index, ranked with ts_rank
+#   SqliteSearchBackend    FTS5 table mirrored from the index rows, ranked with bm25
+#   BasicSearchBackend     icontains on the index row (no join, no DISTINCT)
+#
+# NOTICE_SEARCH_BACKEND picks one by dotted path; 'auto' chooses from the database vendor.
+#
+# Archived notices (notices/archive.py) keep their rows in ArchivedNoticeSearchIndex,
+# reached by the same `search_index` relation, with an FTS5 table of their own.
+
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.db.models import CharField, ExpressionWrapper, F, IntegerField, Q, Value
+from django.db.models.functions import Cast, Concat, StrIndex
+from django.utils.module_loading import import_string
+
+from .models import ArchivedNotice, AttachmentText, Notice, NoticeSearchIndex
+
+FTS_TABLE = 'notices_search_fts'
+ARCHIVE_FTS_TABLE = 'notices_archive_fts'
+
+
+def build_document(notice, texts=None):
+    """The (title, body) pair indexed for a notice. `texts` maps sha256 to attachment text."""
+    texts = texts or {}
+    parts = [notice.description, notice.posted_by.username]
+    for attachment in notice.attachments.all():
+        parts.append(attachment.name)
+        parts.append(attachment.filename())
+        parts.append(texts.get(attachment.sha256))
+    return notice.title, '\n'.join(part for part in parts if part)
+
+
+class BasicSearchBackend:
+    def update_vectors(self, notice_ids):
+        pass
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(search_index__title__icontains=query) | Q(search_index__body__icontains=query)
+        ).annotate(rank=Value(0, output_field=IntegerField())).order_by('-posted_at')
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    config = 'english'
+    # ts_rank is a float4. Scaled to a whole number, the rank a page ends on goes into the
+    # keyset cursor (notices/pagination.py) and comes back exactly, so equal ranks still
+    # compare equal on the next page rather than skipping or repeating rows
+    rank_scale = 1000000
+
+    def update_vectors(self, notice_ids):
+        NoticeSearchIndex.objects.filter(notice_id__in=notice_ids).update(
+            vector=SearchVector('title', weight='A', config=self.config) +
+                   SearchVector('body', weight='B', config=self.config)
+        )
+
+    def search(self, queryset, query):
+        search_query = SearchQuery(query, search_type='websearch', config=self.config)
+        return queryset.filter(search_index__vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_index__vector'), search_query) * self.rank_scale, IntegerField())
+        ).order_by('-rank', '-posted_at')
+
+
+class SqliteSearchBackend(BasicSearchBackend):
+    # Title matches weigh ten times more than body matches
+    weights = '10.0, 1.0'
+    tables = {Notice: FTS_TABLE, ArchivedNotice: ARCHIVE_FTS_TABLE}
+
+    def match_expression(self, query):
+        # Quote every word so user input can't inject FTS5 syntax; the trailing * allows prefixes
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        # Restrict the FTS query to the already-filtered notices so the LIMIT applies after filtering.
+        # The unary + keeps FTS5 from using the IN list as a rowid constraint, which would run
+        # the MATCH once per candidate notice (seconds on a few thousand notices).
+        scope_sql, scope_params = queryset.order_by().values('pk').query.sql_with_params()
+        table = self.tables[queryset.model]
+        try:
+            # The database the queryset reads from, so a search on a replica-routed request stays there
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute(
+                    f"SELECT rowid FROM {table} WHERE {table} MATCH %s AND +rowid IN ({scope_sql}) "
+                    f"ORDER BY bm25({table}, {self.weights}) LIMIT %s",
+                    [match, *scope_params, settings.NOTICE_SEARCH_MAX_RESULTS],
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+        except DatabaseError:
+            # FTS5 missing from this SQLite build
+            return super().search(queryset, query)
+
+        # Carry the bm25 order over as an integer rank, best match highest: the position of
+        # ",<id>," in the ranked id list, counted from the end. One expression however many
+        # results, where a CASE arm per id took Django longer to build than the search itself.
+        ranked = ',' + ','.join(str(pk) for pk in ids) + ','
+        position = StrIndex(Value(ranked), Concat(Value(','), Cast('pk', CharField()), Value(',')))
+        return queryset.filter(pk__in=ids).annotate(
+            rank=ExpressionWrapper(Value(len(ranked)) - position, output_field=IntegerField()),
+        ).order_by('-rank', '-posted_at')
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    path = settings.NOTICE_SEARCH_BACKEND
+    if path == 'auto':
+        backend_class = {
+            'postgresql': PostgresSearchBackend,
+            'sqlite': SqliteSearchBackend,
+        }.get(connections[using].vendor, BasicSearchBackend)
+    else:
+        backend_class = import_string(path)
+    return backend_class()
+
+
+def search_notices(queryset, query):
+    """Filter `queryset` to notices matching `query`, best match first (annotated as `rank`)."""
+    return get_backend(queryset.db).search(queryset, query)
+
+
+def index_notices(notice_ids):
+    """(Re)build the search rows for the given notices; ids that no longer exist are dropped."""
+    notice_ids = set(notice_ids)
+    notices = list(Notice.objects.filter(pk__in=notice_ids).select_related('posted_by').prefetch_related('attachments'))
+    texts = AttachmentText.texts_for(
+        attachment.sha256 for notice in notices for attachment in notice.attachments.all() if attachment.sha256
+    )
+    rows = []
+    for notice in notices:
+        title, body = build_document(notice, texts)
+        rows.append(NoticeSearchIndex(notice=notice, title=title, body=body))
+    if connection.features.supports_update_conflicts_with_target:
+        # One INSERT ... ON CONFLICT DO UPDATE for the lot (the FTS triggers fire for updates too)
+        NoticeSearchIndex.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['notice'], update_fields=['title', 'body'],
+        )
+    else:
+        for row in rows:
+            NoticeSearchIndex.objects.update_or_create(notice=row.notice, defaults={'title': row.title, 'body': row.body})
+    found = [row.notice_id for row in rows]
+    NoticeSearchIndex.objects.filter(notice_id__in=notice_ids - set(found)).delete()
+    if found:
+        get_backend().update_vectors(found)
+
+
+def index_notice(notice_id):
+    index_notices([notice_id])
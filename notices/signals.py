@@ -1,17 +1,99 @@
-# signals.py - Push notification signals disabled
-# Using custom notification system in views.py instead
-
-# from django.db.models.signals import post_save
-# from django.dispatch import receiver
-# from webpush import send_group_notification
-# from .models import Notice
-
-# @receiver(post_save, sender=Notice)
-# def notify_all_students(sender, instance, created, **kwargs):
-#     if created:
-#         payload = {
-#             "title": "New Notice Posted!",
-#             "body": instance.title,
-#             "url": f"/notices/{instance.id}/"
-#         }
-#         send_group_notification(group_name="students", payload=payload, ttl=1000)
+# notices/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import audience, cache, extraction, live, previews, search, subscriptions
+from .models import ArchivedAttachment, ArchivedNotice, Attachment, Notice, NoticeEvent, PushSubscription
+from .storage import release_blob, release_previews
+
+
+@receiver(post_save, sender=PushSubscription)
+@receiver(post_delete, sender=PushSubscription)
+def subscriptions_changed(sender, **kwargs):
+    # Cached audience segment sizes are stale once any subscription changes
+    audience.invalidate_segments()
+
+
+@receiver(post_delete, sender=PushSubscription)
+def forget_subscription(sender, instance, **kwargs):
+    # A browser subscribing again with the same endpoint must be stored again
+    subscriptions.recent.forget(instance.endpoint)
+
+
+@receiver(post_save, sender=Notice)
+def reindex_notice(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_notice(instance.pk)
+
+
+@receiver(post_save, sender=Notice)
+def record_notice_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        live.record(instance, NoticeEvent.CREATED if created else NoticeEvent.UPDATED)
+
+
+@receiver(post_delete, sender=Notice)
+def record_notice_deleted(sender, instance, **kwargs):
+    live.record(instance, NoticeEvent.DELETED)
+
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def touch_attachment_notice(sender, instance, raw=False, **kwargs):
+    # Attachments are part of the notice page, so they move its updated_at (and ETag) too
+    if not raw:
+        Notice.objects.filter(pk=instance.notice_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Attachment)
+@receiver(post_delete, sender=ArchivedAttachment)
+def release_attachment_file(sender, instance, **kwargs):
+    # Other notices may share the same stored file; it goes once the last reference does.
+    # Wait for the commit so a rolled-back delete doesn't lose the file.
+    name, sha256 = instance.file.name, instance.sha256
+    thumbnail, preview = instance.thumbnail.name, instance.preview.name
+
+    def release():
+        release_blob(name, sha256)
+        release_previews(thumbnail, preview)
+    transaction.on_commit(release)
+
+
+@receiver(post_save, sender=Attachment)
+def schedule_attachment_previews(sender, instance, raw=False, **kwargs):
+    # Images get a thumbnail and preview in the background once the upload is committed
+    if not raw and instance.preview_status == Attachment.PREVIEW_PENDING:
+        attachment_id = instance.pk
+        transaction.on_commit(lambda: previews.generator.schedule(attachment_id))
+
+
+@receiver(post_save, sender=Attachment)
+def schedule_text_extraction(sender, instance, raw=False, **kwargs):
+    # Text inside the file becomes searchable once it has been read in the background
+    if not raw and instance.file and extraction.is_extractable(instance.filename()):
+        attachment_id = instance.pk
+        transaction.on_commit(lambda: extraction.extractor.schedule(attachment_id))
+
+
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+def reindex_attachment_notice(sender, instance, raw=False, **kwargs):
+    # Attachment names are part of the notice's search text. Wait for the commit so that
+    # attachments removed by a notice's cascade delete don't re-create its index row.
+    if not raw:
+        notice_id = instance.notice_id
+        transaction.on_commit(lambda: search.index_notice(notice_id))
+
+
+@receiver(post_save, sender=Notice)
+@receiver(post_delete, sender=Notice)
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+@receiver(post_save, sender=ArchivedNotice)
+@receiver(post_delete, sender=ArchivedNotice)
+def invalidate_cached_pages(sender, **kwargs):
+    # New board version: every cached list and detail page is now a miss
+    cache.bump_board_version()
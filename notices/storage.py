@@ -0,0 +1,201 @@
+# notices/storage.py
+#
+# Content-addressed storage for attachments. Every upload is stored once under
+# the SHA-256 of its bytes (notice_attachments/cas/ab/abcdef….pdf); uploading a
+# file that is already on disk writes nothing. Attachment rows record the hash,
+# and a blob is deleted only when the last row referring to it goes away.
+#
+# The hash is computed while the upload streams in (see the upload handlers
+# below), so deduplication doesn't cost a second read of the file.
+#
+# An upload whose bytes are already stored writes nothing, but its row only
+# appears once its transaction commits. So a blob's last reference going away
+# can't be trusted on its own: the same file may be in the middle of being
+# attached again. Reusing a blob therefore touches its mtime, and a blob is
+# only deleted when nothing refers to it *and* it hasn't been touched for
+# ATTACHMENT_BLOB_GRACE_SECONDS. Both steps hold a lock on the blob (a file
+# lock, so it works across worker processes). Blobs kept back this way, and
+# ones left behind by rolled-back uploads, go in sweep_blobs(): `manage.py
+# sweep_attachments`, which gunicorn.conf.py runs hourly next to the web workers
+# because it must run where MEDIA_ROOT is mounted.
+
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+CAS_PREFIX = 'notice_attachments/cas'
+# One lock file per two-character hash prefix, under the CAS directory
+LOCK_DIR = '.locks'
+PREVIEW_PREFIX = 'notice_attachments/previews'
+
+
+class HashingUploadMixin:
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.content_sha256 = self.hasher.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def content_digest(content):
+    """SHA-256 of a File, reusing the digest taken during upload when there is one."""
+    digest = getattr(content, 'content_sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = content.content_sha256 = hasher.hexdigest()
+    return digest
+
+
+def cas_name(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()[:16]
+    return f'{CAS_PREFIX}/{digest[:2]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        target = cas_name(content_digest(content), name)
+        with self.lock(target):
+            # Same bytes already stored (possibly by another department): nothing to write,
+            # but keep release_blob() off it until this upload's row is committed
+            if self.exists(target):
+                os.utime(self.path(target))
+                return target
+            return super().save(target, content, max_length=max_length)
+
+    @contextmanager
+    def lock(self, name):
+        """Exclusive lock on a stored blob, shared by every process using this MEDIA_ROOT."""
+        digest = os.path.basename(name)
+        path = self.path(f'{CAS_PREFIX}/{LOCK_DIR}/{digest[:2]}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(file)
+
+
+def preview_name(digest, variant):
+    # Derived from the content too, so every copy of an image shares its previews
+    return f'{PREVIEW_PREFIX}/{digest[:2]}/{digest}-{variant}.webp'
+
+
+attachment_storage = ContentAddressedStorage()
+# Previews are saved under the names above as they are, not rehashed
+preview_storage = FileSystemStorage()
+
+
+def get_attachment_storage():
+    # Callable so migrations don't serialise the storage instance
+    return attachment_storage
+
+
+def get_preview_storage():
+    return preview_storage
+
+
+def blob_in_use(sha256):
+    from .models import ArchivedAttachment, Attachment
+
+    # Archived notices' attachments count too (notices/archive.py)
+    return any(model.objects.filter(sha256=sha256).exists() for model in (Attachment, ArchivedAttachment))
+
+
+def recently_used(name):
+    try:
+        return time.time() - os.path.getmtime(attachment_storage.path(name)) < settings.ATTACHMENT_BLOB_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def release_blob(name, sha256):
+    """
+    Delete a stored file (and its extracted text) once no attachment refers to its content any more.
+    Returns whether it was deleted; a recently stored or reused one is left to sweep_blobs().
+    """
+    from .models import AttachmentText
+
+    if not sha256 or blob_in_use(sha256):
+        return False
+    if not name.startswith(CAS_PREFIX + '/'):
+        # Uploaded before deduplication; owned by a single row
+        AttachmentText.objects.filter(sha256=sha256).delete()
+        return False
+    with attachment_storage.lock(name):
+        # Checked again under the lock: an upload of the same bytes may have reused it meanwhile
+        if blob_in_use(sha256) or recently_used(name):
+            return False
+        AttachmentText.objects.filter(sha256=sha256).delete()
+        attachment_storage.delete(name)
+    return True
+
+
+def sweep_blobs(batch_size=500):
+    """Delete stored files that no attachment has referred to for ATTACHMENT_BLOB_GRACE_SECONDS. Returns how many."""
+    from .models import ArchivedAttachment, Attachment
+
+    root = attachment_storage.path(CAS_PREFIX)
+    cutoff = time.time() - settings.ATTACHMENT_BLOB_GRACE_SECONDS
+    candidates = {}
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if name != LOCK_DIR]
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if os.path.getmtime(path) < cutoff:
+                name = os.path.relpath(path, attachment_storage.location).replace(os.sep, '/')
+                candidates[os.path.splitext(filename)[0]] = name
+
+    deleted = 0
+    digests = list(candidates)
+    for start in range(0, len(digests), batch_size):
+        batch = digests[start:start + batch_size]
+        used = set()
+        for model in (Attachment, ArchivedAttachment):
+            used.update(model.objects.filter(sha256__in=batch).values_list('sha256', flat=True))
+        for digest in batch:
+            if digest not in used and release_blob(candidates[digest], digest):
+                deleted += 1
+    return deleted
+
+
+def release_previews(*names):
+    """Delete preview files that no attachment shows any more."""
+    from django.db.models import Q
+
+    from .models import ArchivedAttachment, Attachment
+
+    for name in names:
+        if name and not any(
+            model.objects.filter(Q(thumbnail=name) | Q(preview=name)).exists() for model in (Attachment, ArchivedAttachment)
+        ):
+            preview_storage.delete(name)
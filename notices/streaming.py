@@ -0,0 +1,50 @@
+# notices/streaming.py
+#
+# Streamed responses under ASGI. Django's ASGI handler reads a
+# StreamingHttpResponse (FileResponse included) asynchronously, and when the
+# content is a plain iterator it falls back to sync_to_async(list): the whole
+# export or file is read into memory before the first byte is sent. For
+# requests that came in over ASGI these hand it async iterators instead, which
+# fetch one chunk at a time on a worker thread.
+#
+# There is no sendfile(2) under uvicorn either, so behind nginx or Apache
+# ATTACHMENT_SERVE_MODE=x-accel-redirect / x-sendfile is still the cheaper way
+# to send attachments in ASGI mode.
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+# Bytes read per chunk of a file; each chunk costs a hop to a worker thread
+FILE_CHUNK_SIZE = 64 * 1024
+
+_done = object()
+
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+def joined(lines, size):
+    """Groups of `size` lines as single strings: fewer, larger chunks to hand across threads."""
+    group = []
+    for line in lines:
+        group.append(line)
+        if len(group) >= size:
+            yield ''.join(group)
+            group = []
+    if group:
+        yield ''.join(group)
+
+
+async def iterate_in_thread(iterable):
+    # Thread-sensitive, so a database cursor behind the iterator stays on the request's thread
+    iterator = iter(iterable)
+    take = sync_to_async(next)
+    while (chunk := await take(iterator, _done)) is not _done:
+        yield chunk
+
+
+async def read_in_thread(file):
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while chunk := await read(FILE_CHUNK_SIZE):
+        yield chunk
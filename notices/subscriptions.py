@@ -0,0 +1,109 @@
+# notices/subscriptions.py
+#
+# Saving /subscribe/ requests. Every open page re-subscribes when it loads, so
+# right after a notice goes out thousands of browsers post the subscription
+# they already have. Two things keep that cheap:
+#
+# - an identical repeat of a subscription this process saved in the last
+#   SUBSCRIBE_SKIP_TTL seconds is answered without touching the database;
+# - everything else is a single INSERT ... ON CONFLICT (endpoint) DO UPDATE,
+#   which only writes the row when something in it changed, instead of
+#   update_or_create's SELECT then INSERT or UPDATE in a transaction.
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+
+from . import audience
+from .models import PushSubscription
+
+
+class RecentSubscriptions:
+    """Subscriptions saved by this process lately, with the fields they were saved with."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # endpoint: (fields, expires)
+
+    def seen(self, endpoint, fields):
+        if not settings.SUBSCRIBE_SKIP_TTL:
+            return False
+        with self._lock:
+            entry = self._entries.get(endpoint)
+            if entry is None:
+                return False
+            saved, expires = entry
+            if expires < time.monotonic():
+                del self._entries[endpoint]
+                return False
+            return saved == fields
+
+    def remember(self, endpoint, fields):
+        if not settings.SUBSCRIBE_SKIP_TTL:
+            return
+        with self._lock:
+            self._entries[endpoint] = (dict(fields), time.monotonic() + settings.SUBSCRIBE_SKIP_TTL)
+            self._entries.move_to_end(endpoint)
+            while len(self._entries) > settings.SUBSCRIBE_SKIP_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def forget(self, endpoint):
+        with self._lock:
+            self._entries.pop(endpoint, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+recent = RecentSubscriptions()
+
+
+def upsert(connection, endpoint, fields):
+    """
+    Create or update the subscription in one statement. Returns True if it was
+    created, False if it was updated and None if it was already stored as given.
+    """
+    opts = PushSubscription._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    subscribed_at = opts.get_field('subscribed_at')
+    now = subscribed_at.get_db_prep_value(timezone.now(), connection)
+
+    columns = [quote(opts.get_field(name).column) for name in ['endpoint', *fields]]
+    changing = columns[1:]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}, {quote(subscribed_at.column)}) "
+        f"VALUES ({', '.join(['%s'] * (len(columns) + 1))}) "
+        f"ON CONFLICT ({columns[0]}) DO UPDATE SET "
+        + ', '.join(f'{column} = excluded.{column}' for column in changing) +
+        ' WHERE ' + ' OR '.join(f'{table}.{column} <> excluded.{column}' for column in changing) +
+        # A row that was already there keeps its own subscribed_at
+        f" RETURNING {quote(subscribed_at.column)} = %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [endpoint, *fields.values(), now, now])
+        row = cursor.fetchone()
+    return None if row is None else bool(row[0])
+
+
+def save_subscription(endpoint, fields):
+    """Store a subscription from /subscribe/ (see parse_subscription). Returns True if it is new."""
+    if recent.seen(endpoint, fields):
+        return False
+
+    connection = connections[router.db_for_write(PushSubscription)]
+    # ON CONFLICT ... RETURNING needs PostgreSQL or SQLite 3.35+
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_rows_from_bulk_insert:
+        created = upsert(connection, endpoint, fields)
+        if created is not None:
+            # The signals that usually do this don't fire for raw SQL
+            audience.invalidate_segments()
+    else:
+        _, created = PushSubscription.objects.update_or_create(endpoint=endpoint, defaults=fields)
+    recent.remember(endpoint, fields)
+    return bool(created)
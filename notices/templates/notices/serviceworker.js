@@ -0,0 +1,176 @@
+// Service worker: push notifications, and an offline copy of the board.
+//
+// The board, the archive and notice pages are answered from the cache straight
+// away (stale-while-revalidate), so they open instantly and on flaky Wi-Fi.
+// In the background the worker asks {% url 'api-sync' %} what changed since its
+// last sync, and only downloads again the pages those changes touched, with
+// If-None-Match so an unchanged page costs a 304.
+
+const PAGES = 'notice-pages-v1';
+// The sync state lives in the same cache, under a URL no page uses
+const STATE_URL = '/__notice-sync-state';
+const SYNC_URL = '{% url "api-sync" %}';
+const LIST_PATHS = ['{% url "notice-list" %}', '{% url "notice-archive" %}'];
+const DETAIL_PATH = new RegExp('^' + '{% url "notice-detail" 12345 %}'.replace('12345', '(\\d+)') + '$');
+// Don't ask for changes more often than this
+const SYNC_INTERVAL = 30 * 1000;
+// Check cached pages with the server at least this often anyway: the board also changes
+// at midnight, and a signed-in session can expire, without any notice changing
+const MAX_AGE = 10 * 60 * 1000;
+// Notices whose last change is remembered; older ones fall back to the reset point
+const MAX_TRACKED = 1000;
+
+self.addEventListener('push', function (event) {
+  const data = event.data.json();
+  const title = data.title;
+  const options = {
+    body: data.body,
+    icon: '/static/icons/notice.png',  // optional
+    data: { url: data.url }
+  };
+  event.waitUntil(self.registration.showNotification(title, options));
+});
+
+self.addEventListener('notificationclick', function (event) {
+  event.notification.close();
+  event.waitUntil(clients.openWindow(event.notification.data.url));
+});
+
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', event => event.waitUntil(self.clients.claim()));
+
+let clearing = Promise.resolve();
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+  if (request.method !== 'GET') {
+    // Signing in or out, or posting or editing a notice, changes what the pages
+    // show this browser: start the offline copy again
+    clearing = caches.delete(PAGES);
+    event.waitUntil(clearing);
+    return;
+  }
+  if (LIST_PATHS.includes(url.pathname) || DETAIL_PATH.test(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event));
+  }
+});
+
+async function staleWhileRevalidate(event) {
+  await clearing;
+  const cache = await caches.open(PAGES);
+  const cached = await cache.match(event.request, { ignoreVary: true });
+  if (!cached) {
+    try {
+      return await fetchPage(cache, event.request);
+    } catch (error) {
+      return offline(cache);
+    }
+  }
+  event.waitUntil(revalidate(cache, event.request, cached).catch(() => {}));
+  return cached;
+}
+
+async function revalidate(cache, request, cached) {
+  await sync(cache);
+  if (isFresh(new URL(request.url), cached, await readState(cache))) return;
+  await fetchPage(cache, request, cached);
+}
+
+async function fetchPage(cache, request, cached) {
+  // Stamp the copy with the sync cursor from before the download: any change after that is newer
+  const cursor = (await readState(cache)).cursor;
+  const headers = {};
+  const etag = cached && cached.headers.get('ETag');
+  if (etag) headers['If-None-Match'] = etag;
+  const response = await fetch(request.url, { headers, credentials: 'same-origin', cache: 'no-store' });
+  if (response.status === 304 && cached) {
+    await cache.put(request, stamp(cached, await cached.clone().blob(), cursor));
+    return cached;
+  }
+  if (response.ok && !response.redirected) {
+    await cache.put(request, stamp(response, await response.clone().blob(), cursor));
+  }
+  return response;
+}
+
+function stamp(response, body, cursor) {
+  const headers = new Headers(response.headers);
+  headers.set('X-Sync-Cursor', cursor === null ? '' : String(cursor));
+  headers.set('X-Stored-At', String(Date.now()));
+  return new Response(body, { status: response.status, statusText: response.statusText, headers });
+}
+
+function isFresh(url, cached, state) {
+  const stamped = cached.headers.get('X-Sync-Cursor');
+  if (!stamped || state.cursor === null) return false;
+  if (Date.now() - Number(cached.headers.get('X-Stored-At')) > MAX_AGE) return false;
+  const cursor = Number(stamped);
+  if (cursor < state.resetAt) return false;
+  const detail = url.pathname.match(DETAIL_PATH);
+  if (detail) return cursor >= (state.changedAt[detail[1]] || 0);
+  // Any change can move a card on or off a list
+  return cursor >= state.listsChangedAt;
+}
+
+async function readState(cache) {
+  const response = await cache.match(STATE_URL);
+  return response ? response.json() : { cursor: null, resetAt: 0, listsChangedAt: 0, changedAt: {} };
+}
+
+function writeState(cache, state) {
+  return cache.put(STATE_URL, new Response(JSON.stringify(state), { headers: { 'Content-Type': 'application/json' } }));
+}
+
+let syncing = null;
+let lastSync = 0;
+
+function sync(cache) {
+  if (syncing) return syncing;
+  if (Date.now() - lastSync < SYNC_INTERVAL) return Promise.resolve();
+  syncing = applyChanges(cache).finally(() => { syncing = null; });
+  return syncing;
+}
+
+async function applyChanges(cache) {
+  const state = await readState(cache);
+  let more = true;
+  while (more) {
+    const url = state.cursor === null ? SYNC_URL : `${SYNC_URL}?since=${state.cursor}`;
+    const response = await fetch(url, { credentials: 'same-origin', cache: 'no-store' });
+    if (!response.ok) throw new Error(response.status);
+    const delta = await response.json();
+    if (delta.reset) {
+      // Too far behind (or the first sync): nothing cached can be trusted
+      state.resetAt = delta.cursor;
+      state.changedAt = {};
+    }
+    for (const notice of delta.changed) state.changedAt[notice.id] = delta.cursor;
+    for (const id of delta.deleted) {
+      delete state.changedAt[id];
+      await cache.delete('{% url "notice-detail" 12345 %}'.replace('12345', id), { ignoreVary: true });
+    }
+    if (delta.changed.length || delta.deleted.length) state.listsChangedAt = delta.cursor;
+    state.cursor = delta.cursor;
+    more = delta.more;
+  }
+
+  const tracked = Object.entries(state.changedAt).sort((a, b) => b[1] - a[1]);
+  if (tracked.length > MAX_TRACKED) {
+    // Forgetting a notice's change is only safe if copies from before it count as stale
+    state.resetAt = Math.max(state.resetAt, tracked[MAX_TRACKED][1]);
+    state.changedAt = Object.fromEntries(tracked.slice(0, MAX_TRACKED));
+  }
+  await writeState(cache, state);
+  lastSync = Date.now();
+}
+
+async function offline(cache) {
+  // Not cached yet: the board is better than an error page
+  const board = await cache.match(LIST_PATHS[0], { ignoreVary: true });
+  if (board) return board;
+  return new Response('<h1>You are offline</h1><p>This page will load once you are connected again.</p>', {
+    status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' },
+  });
+}
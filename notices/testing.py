@@ -0,0 +1,19 @@
+# notices/testing.py
+#
+# The test runner (settings.TEST_RUNNER). Without REPLICA_DATABASE_URL it adds a
+# second SQLite database as the 'replica' alias, so ReadReplicaTests and the
+# ReplicaRouter run in every test run, not only where a replica is configured.
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class NoticeTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Before the test modules are imported: ReadReplicaTests lists the alias in its databases
+        if 'replica' not in settings.DATABASES:
+            settings.DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+            connections.configure_settings(settings.DATABASES)
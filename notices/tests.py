@@ -1,3 +1,1763 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import zipfile
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.db.models import Case, IntegerField, When
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from PIL import Image
+
+from notice_board_project import urls as project_urls
+
+from . import archive, audience, live, metrics, outbox, replicas, search, storage, subscriptions
+from . import urls as notices_urls
+from .models import (
+    DEPARTMENTS, SEMESTERS, ArchivedAttachment, ArchivedNotice, Attachment, AttachmentText, Notice, NoticeEvent,
+    NoticeSearchIndex, PushDelivery, PushSubscription,
+)
+from .push import PushDispatcher, dispatcher
+from .push_transport import transport
+from .views import todays_range
+
+
+def seed_notices(teachers=4, notices=120, attachments_per_notice=2, today=25):
+    """A board with a few teachers, a semester of history and some notices from today."""
+    users = [User.objects.create_user(f'teacher{i}', f'teacher{i}@college.edu', 'pw') for i in range(teachers)]
+    now = timezone.now()
+    created = []
+    for i in range(notices):
+        created.append(Notice.objects.create(
+            title=f'Notice {i} about examinations' if i % 5 == 0 else f'Notice {i}',
+            description=f'Details for notice {i}. ' * 20,
+            posted_by=users[i % teachers],
+            department=DEPARTMENTS[i % len(DEPARTMENTS)][0],
+            semester=SEMESTERS[i % len(SEMESTERS)][0],
+        ))
+    # posted_at is auto_now_add, so spread the history out afterwards
+    for i, notice in enumerate(created[today:]):
+        Notice.objects.filter(pk=notice.pk).update(posted_at=now - timedelta(days=1 + i % 150, minutes=i))
+    Attachment.objects.bulk_create([
+        Attachment(notice=notice, file=f'notice_attachments/multiple/file_{notice.pk}_{j}.pdf', name=f'Sheet {j}')
+        for notice in created for j in range(attachments_per_notice)
+    ])
+    return users, created
+
+
+async def asgi_body(response):
+    """The parts of a streamed response, read the way Django's ASGI handler reads them."""
+    with warnings.catch_warnings():
+        # StreamingHttpResponse warns just before it reads a sync iterator into memory whole
+        warnings.simplefilter('error')
+        return [part async for part in response]
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    # Even with REPLICA_DATABASE_URL set, only ReadReplicaTests read from it
+    READ_REPLICA=None,
+)
+class NoticeTestCase(TestCase):
+    """Runs against a private in-memory cache, emptied before each test."""
+
+    def setUp(self):
+        cache.clear()
+        subscriptions.recent.clear()
+
+
+class TempMediaMixin:
+    """An empty MEDIA_ROOT of its own for each test (self.media_root), removed afterwards."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(NOTICES_PER_PAGE=50)
+class NoticeQueryBudgetTests(NoticeTestCase):
+    """
+    Every public page costs a fixed number of queries, however many notices it shows.
+
+    These are cold-cache costs: the first queries of each list page compute the board
+    state for its ETag (the archive page the archived notices' too) and find the last live
+    event (see LiveFeedMixin), the detail page looks up the notice's updated_at.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers, cls.notices = seed_notices()
+
+    def assertPageQueries(self, num, url, data=None, count=None):
+        with self.assertNumQueries(num):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        if count is not None:
+            self.assertEqual(len(response.context['notices']), count)
+        return response
+
+    def test_todays_board(self):
+        self.assertPageQueries(3, reverse('notice-list'), count=25)
+
+    def test_board_department_filter(self):
+        self.assertPageQueries(3, reverse('notice-list'), {'department': 'CSE'}, count=30)
+
+    def test_board_search(self):
+        # Board state, FTS lookup, then the page itself
+        self.assertPageQueries(3, reverse('notice-list'), {'search': 'examinations'}, count=24)
+
+    def test_archive(self):
+        self.assertPageQueries(4, reverse('notice-archive'), count=50)
+
+    def test_archive_filters_and_next_page(self):
+        # Fewer hot notices than a page, so the archived ones are read too
+        response = self.assertPageQueries(5, reverse('notice-archive'), {'semester': 'S1'}, count=14)
+        self.assertIsNone(response.context['next_page_url'])
+
+        # The board and archive state and last event are already cached for the following pages
+        response = self.assertPageQueries(1, reverse('notice-archive'), count=50)
+        self.assertPageQueries(1, response.context['next_page_url'], count=50)
+        self.assertPageQueries(1, response.context['more_url'], count=50)
+
+    def test_archive_search(self):
+        # The archive's FTS lookup too; it matches nothing, so no page query follows
+        self.assertPageQueries(5, reverse('notice-archive'), {'search': 'examinations'}, count=24)
+
+    def test_archive_as_author(self):
+        # Session and user lookups, board and archive state, last event, then the page
+        self.client.force_login(self.teachers[0])
+        self.assertPageQueries(6, reverse('notice-archive'), count=50)
+
+    def test_detail(self):
+        # updated_at for the ETag, the notice with its author, then its attachments
+        response = self.assertPageQueries(3, reverse('notice-detail', kwargs={'pk': self.notices[0].pk}))
+        self.assertContains(response, 'Sheet 1')
+
+    def test_my_notices(self):
+        self.client.force_login(self.teachers[1])
+        self.assertPageQueries(3, reverse('my-notices'), count=30)
+
+
+class TodaysBoardTests(NoticeTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+
+    def post_at(self, moment):
+        notice = Notice.objects.create(title=moment.isoformat(), description='-', posted_by=self.teacher)
+        Notice.objects.filter(pk=notice.pk).update(posted_at=moment)
+        return notice
+
+    def test_today_is_a_half_open_range_in_kolkata(self):
+        kolkata = ZoneInfo('Asia/Kolkata')
+        start, end = todays_range()
+        self.assertEqual(start.utcoffset(), timedelta(hours=5, minutes=30))
+        self.assertEqual(start.astimezone(kolkata).time(), datetime.min.time())
+        self.assertEqual(end - start, timedelta(days=1))
+
+        self.post_at(start - timedelta(microseconds=1))
+        first = self.post_at(start)
+        last = self.post_at(end - timedelta(microseconds=1))
+        self.post_at(end)
+
+        response = self.client.get(reverse('notice-list'))
+        self.assertEqual(list(response.context['notices']), [last, first])
+
+
+class NoticeIndexTests(NoticeTestCase):
+    """The list queries are answered from the composite indexes on Notice."""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, msg=f"Expected {index_name} in plan:\n{plan}")
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_todays_board_uses_posted_at_index(self):
+        start, end = todays_range()
+        queryset = Notice.objects.filter(posted_at__gte=start, posted_at__lt=end).order_by('-posted_at', '-id')
+        self.assertUsesIndex(queryset, 'notice_posted_idx')
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_filtered_archive_uses_composite_indexes(self):
+        newest_first = ('-posted_at', '-id')
+        self.assertUsesIndex(
+            Notice.objects.filter(department='CSE', semester='S3').order_by(*newest_first),
+            'notice_dept_sem_posted_idx',
+        )
+        self.assertUsesIndex(Notice.objects.filter(semester='S3').order_by(*newest_first), 'notice_sem_posted_idx')
+        self.assertUsesIndex(
+            Notice.objects.filter(posted_by_id=1).order_by(*newest_first), 'notice_author_posted_idx',
+        )
+
+
+class TiedRankSearchBackend(search.BasicSearchBackend):
+    """Ranks semester 1 notices 2 and the rest 1, so most matches tie."""
+
+    def search(self, queryset, query):
+        return queryset.filter(search_index__title__icontains=query).annotate(
+            rank=Case(When(semester='S1', then=2), default=1, output_field=IntegerField()),
+        ).order_by('-rank', '-posted_at')
+
+
+@override_settings(NOTICES_PER_PAGE=5)
+class KeysetPaginationTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.notices = [
+            Notice.objects.create(
+                title=f'Exam notice {i}', description='-', posted_by=teacher, semester='S1' if i % 3 == 0 else 'S2',
+            )
+            for i in range(12)
+        ]
+        # Posted in the same instant, so only the id tells equal ranks apart
+        Notice.objects.update(posted_at=timezone.now() - timedelta(days=2))
+
+    def pages(self, data):
+        pages, url = [], reverse('notice-archive')
+        while url:
+            response = self.client.get(url, data if not pages else None)
+            pages.append([notice.pk for notice in response.context['notices']])
+            url = response.context['next_page_url']
+        return pages
+
+    def test_equal_ranks_across_page_boundaries(self):
+        newest_first = sorted(self.notices, key=lambda notice: notice.pk, reverse=True)
+        for backend in ['notices.tests.TiedRankSearchBackend', 'notices.search.BasicSearchBackend']:
+            with self.subTest(backend=backend), override_settings(NOTICE_SEARCH_BACKEND=backend):
+                cache.clear()
+                pages = self.pages({'search': 'exam'})
+                self.assertEqual([len(page) for page in pages], [5, 5, 2])
+                if backend.endswith('TiedRankSearchBackend'):
+                    # Semester 1 first, newest first within each rank
+                    expected = [n for n in newest_first if n.semester == 'S1'] + \
+                               [n for n in newest_first if n.semester != 'S1']
+                else:
+                    expected = newest_first
+                self.assertEqual(sum(pages, []), [notice.pk for notice in expected])
+
+    def test_last_row_on_a_page_boundary(self):
+        # Exactly two pages: no link to an empty third one
+        Notice.objects.filter(pk__in=[notice.pk for notice in self.notices[10:]]).delete()
+        self.assertEqual([len(page) for page in self.pages({'search': 'exam'})], [5, 5])
+        self.assertEqual([len(page) for page in self.pages({})], [5, 5])
+
+    @override_settings(NOTICE_SEARCH_BACKEND='notices.tests.TiedRankSearchBackend')
+    def test_rank_cursor(self):
+        response = self.client.get(reverse('notice-archive'), {'search': 'exam'})
+        cursor = archive.decode_cursor(response.context['next_page_url'].split('after=')[1])
+        archived, rank, posted_at, pk = cursor
+        self.assertEqual((archived, rank), (False, 1))
+        second_page = [notice.pk for notice in self.client.get(response.context['next_page_url']).context['notices']]
+
+        # The rank comes back as the same whole number, however the cursor wrote it
+        for written in [rank, str(rank)]:
+            after = archive.encode_cursor([archived, written, posted_at, pk])
+            cache.clear()  # not the cached page
+            response = self.client.get(reverse('notice-archive'), {'search': 'exam', 'after': after})
+            self.assertEqual([notice.pk for notice in response.context['notices']], second_page)
+        # A cursor that can't be read starts from the top
+        for written in ['high', None]:
+            after = archive.encode_cursor([archived, written, posted_at, pk])
+            cache.clear()  # not the cached page
+            response = self.client.get(reverse('notice-archive'), {'search': 'exam', 'after': after})
+            self.assertEqual(len(response.context['notices']), 5)
+            self.assertNotEqual([notice.pk for notice in response.context['notices']], second_page)
+
+
+class CachedPageTests(NoticeTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers, cls.notices = seed_notices(teachers=2, notices=10, attachments_per_notice=1, today=10)
+
+    def test_repeat_visits_are_served_from_cache(self):
+        for url in [reverse('notice-list'), reverse('notice-archive'),
+                    reverse('notice-detail', kwargs={'pk': self.notices[0].pk})]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second['X-Cache'], 'hit')
+            self.assertEqual(first.content, second.content)
+
+    def test_filters_are_cached_separately(self):
+        cse = self.client.get(reverse('notice-archive'), {'department': 'CSE'})
+        ee = self.client.get(reverse('notice-archive'), {'department': 'EE'})
+        self.assertEqual(ee['X-Cache'], 'miss')
+        self.assertNotEqual(cse.content, ee.content)
+
+    def test_writes_invalidate_cached_pages(self):
+        self.client.get(reverse('notice-archive'))
+        Notice.objects.create(title='Fresh notice', description='-', posted_by=self.teachers[0])
+        response = self.client.get(reverse('notice-archive'))
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertContains(response, 'Fresh notice')
+
+        notice = self.notices[0]
+        self.client.get(reverse('notice-detail', kwargs={'pk': notice.pk}))
+        Attachment.objects.create(notice=notice, file='notice_attachments/multiple/new.pdf', name='Late addition')
+        self.assertContains(self.client.get(reverse('notice-detail', kwargs={'pk': notice.pk})), 'Late addition')
+
+    def test_authors_do_not_share_the_anonymous_copy(self):
+        self.client.get(reverse('notice-archive'))
+        self.client.force_login(self.teachers[0])
+        response = self.client.get(reverse('notice-archive'))
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertContains(response, 'Logged in as')
+
+    @override_settings(NOTICE_CACHE_ENABLED=False)
+    def test_cards_are_cached_until_their_notice_changes(self):
+        notice = self.notices[0]
+        self.client.get(reverse('notice-archive'))
+        # A change that skips save() (and so updated_at) keeps serving the cached card
+        Notice.objects.filter(pk=notice.pk).update(title='Quietly renamed')
+        self.assertNotContains(self.client.get(reverse('notice-archive')), 'Quietly renamed')
+
+        notice.refresh_from_db()
+        notice.save()
+        self.assertContains(self.client.get(reverse('notice-archive')), 'Quietly renamed')
+
+    @override_settings(NOTICE_CACHE_ENABLED=False)
+    def test_edit_controls_are_not_part_of_the_cached_card(self):
+        self.client.get(reverse('notice-archive'))
+        author, other = self.teachers
+        mine = reverse('notice-update', kwargs={'pk': self.notices[0].pk})
+        theirs = reverse('notice-update', kwargs={'pk': self.notices[1].pk})
+        self.assertEqual(self.notices[0].posted_by, author)
+
+        self.client.force_login(author)
+        response = self.client.get(reverse('notice-archive'))
+        self.assertContains(response, mine)
+        self.assertNotContains(response, theirs)
+
+        self.client.force_login(other)
+        response = self.client.get(reverse('notice-archive'))
+        self.assertNotContains(response, mine)
+        self.assertContains(response, theirs)
+
+
+class ConditionalGetTests(NoticeTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers, cls.notices = seed_notices(teachers=2, notices=10, attachments_per_notice=1, today=10)
+
+    def revalidate(self, url, response):
+        return self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        for url in [reverse('notice-list'), reverse('notice-archive') + '?department=CSE',
+                    reverse('notice-detail', kwargs={'pk': self.notices[0].pk})]:
+            response = self.client.get(url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+    def test_edits_change_the_validators(self):
+        notice = self.notices[0]
+        url = reverse('notice-detail', kwargs={'pk': notice.pk})
+        detail = self.client.get(url)
+        archive = self.client.get(reverse('notice-archive'))
+
+        notice.title = 'Edited title'
+        notice.save()
+
+        self.assertContains(self.revalidate(url, detail), 'Edited title')
+        self.assertEqual(self.revalidate(reverse('notice-archive'), archive).status_code, 200)
+
+    def test_deletes_change_the_board_etag(self):
+        archive = self.client.get(reverse('notice-archive'))
+        self.notices[-1].delete()
+        self.assertEqual(self.revalidate(reverse('notice-archive'), archive).status_code, 200)
+
+    def test_archived_notices_change_the_archive_etag(self):
+        archive.archive_notices(0)
+        archived = ArchivedNotice.objects.order_by('pk')
+        page = self.client.get(reverse('notice-archive'))
+        self.assertEqual(self.revalidate(reverse('notice-archive'), page).status_code, 304)
+
+        archived.first().delete()
+        response = self.revalidate(reverse('notice-archive'), page)
+        self.assertEqual(response.status_code, 200)
+
+        notice = archived.last()
+        notice.title, notice.updated_at = 'Edited title', timezone.now()
+        notice.save()
+        self.assertContains(self.revalidate(reverse('notice-archive'), response), 'Edited title')
+
+    def test_teachers_get_no_last_modified(self):
+        self.client.force_login(self.teachers[0])
+        response = self.client.get(reverse('notice-archive'))
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+@override_settings(NOTICES_PER_PAGE=10)
+class NoticeApiTests(NoticeTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers, cls.notices = seed_notices(teachers=2, notices=30, attachments_per_notice=1, today=5)
+
+    def test_archive_api_pages_with_the_archive_filters(self):
+        response = self.client.get(reverse('api-notices'), {'department': 'CSE'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 8)
+        self.assertTrue(all(item['department'] == 'CSE' for item in data['results']))
+        self.assertIsNone(data['next'])
+
+        ids = []
+        url = reverse('api-notices')
+        while url:
+            data = self.client.get(url).json()
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+        self.assertEqual(sorted(ids), sorted(notice.pk for notice in self.notices))
+
+    def test_board_api_lists_today(self):
+        data = self.client.get(reverse('api-board')).json()
+        self.assertEqual(len(data['results']), 5)
+
+    def test_detail_api_includes_attachments(self):
+        notice = self.notices[0]
+        data = self.client.get(reverse('api-notice-detail', kwargs={'pk': notice.pk})).json()
+        self.assertEqual(data['title'], notice.title)
+        self.assertEqual(data['posted_by'], notice.posted_by.username)
+        self.assertEqual([a['name'] for a in data['attachments']], ['Sheet 0'])
+        self.assertEqual(self.client.get(reverse('api-notice-detail', kwargs={'pk': 0})).status_code, 404)
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get(reverse('api-notices-export'), {'semester': 'S2'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), len([n for n in self.notices if n.semester == 'S2']))
+        self.assertEqual(set(rows[0]), {
+            'id', 'title', 'notice_type', 'department', 'semester', 'description',
+            'posted_by', 'posted_at', 'updated_at',
+        })
+
+    def test_export_streams_csv(self):
+        response = self.client.get(reverse('api-notices-export'), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['id', 'title'])
+        self.assertEqual(len(rows), 31)
+
+    @mock.patch('notices.api.EXPORT_CHUNK_SIZE', 4)
+    async def test_export_streams_under_asgi(self):
+        response = await self.async_client.get(reverse('api-notices-export'), {'format': 'csv'})
+        parts = await asgi_body(response)
+        # A part per chunk of rows (the header line joins the first), not one buffered body
+        self.assertEqual(len(parts), 8)
+        self.assertEqual(len(b''.join(parts).decode().splitlines()), 31)
+
+
+class ContentAddressedAttachmentTests(TempMediaMixin, NoticeTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.teacher)
+
+    def post_notice(self, title, *files):
+        data = {
+            'title': title, 'notice_type': 'Common', 'department': 'CSE', 'semester': 'ALL',
+            'description': '-', 'attachments-TOTAL_FORMS': str(len(files)), 'attachments-INITIAL_FORMS': '0',
+        }
+        for i, (filename, content) in enumerate(files):
+            data[f'attachments-{i}-file'] = SimpleUploadedFile(filename, content)
+            data[f'attachments-{i}-name'] = ''
+        self.assertEqual(self.client.post(reverse('create-notice'), data).status_code, 302)
+        return Notice.objects.get(title=title)
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root) for name in names if storage.LOCK_DIR not in root
+        )
+
+    def age(self, name, seconds=3600):
+        # As if it had been stored, and not uploaded again, `seconds` ago
+        path = storage.attachment_storage.path(name)
+        os.utime(path, (time.time() - seconds, time.time() - seconds))
+
+    def test_identical_uploads_are_stored_once(self):
+        timetable = b'%PDF-1.4 exam timetable' * 100
+        cse = self.post_notice('CSE timetable', ('timetable.pdf', timetable))
+        ee = self.post_notice('EE timetable', ('EE Timetable.PDF', timetable), ('rules.txt', b'no phones'))
+
+        digest = hashlib.sha256(timetable).hexdigest()
+        self.assertEqual(self.stored_files(), sorted([
+            f'notice_attachments/cas/{digest[:2]}/{digest}.pdf',
+            f'notice_attachments/cas/{hashlib.sha256(b"no phones").hexdigest()[:2]}/'
+            f'{hashlib.sha256(b"no phones").hexdigest()}.txt',
+        ]))
+        first, second = cse.attachments.get(), ee.attachments.get(original_filename='EE Timetable.PDF')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.sha256, digest)
+        # Display names are unchanged by the hashed storage name
+        self.assertEqual((first.filename(), second.filename()), ('timetable.pdf', 'EE Timetable.PDF'))
+
+    def test_shared_file_is_deleted_with_its_last_reference(self):
+        cse = self.post_notice('CSE timetable', ('timetable.pdf', b'same bytes'))
+        ee = self.post_notice('EE timetable', ('timetable.pdf', b'same bytes'))
+
+        name = ee.attachments.get().file.name
+        self.age(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            cse.delete()
+        self.assertEqual(len(self.stored_files()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ee.delete()
+        self.assertEqual(self.stored_files(), [])
+
+    def test_delete_racing_an_upload_of_the_same_file(self):
+        # The last reference is deleted while the same bytes are being attached to another
+        # notice, whose row isn't committed yet (the steps of both, interleaved by hand)
+        cse = self.post_notice('CSE timetable', ('timetable.pdf', b'same bytes'))
+        name = cse.attachments.get().file.name
+        self.age(name)
+        reused = storage.attachment_storage.save('timetable.pdf', ContentFile(b'same bytes'))
+        self.assertEqual(reused, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            cse.delete()
+        ee = Notice.objects.create(title='EE timetable', description='-', posted_by=self.teacher)
+        Attachment.objects.create(notice=ee, file=reused, sha256=hashlib.sha256(b'same bytes').hexdigest())
+        self.assertEqual(self.client.get(ee.attachments.get().download_url()).status_code, 200)
+
+        # The other way round: deleted first, so the upload writes the file again
+        self.age(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            ee.delete()
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(storage.attachment_storage.save('timetable.pdf', ContentFile(b'same bytes')), name)
+        self.assertEqual(self.stored_files(), [name])
+
+    def test_stored_names_fit_their_columns(self):
+        # PostgreSQL rejects a name longer than the column; SQLite would store it regardless
+        longest = {
+            'file': storage.cas_name('a' * 64, 'scan.' + 'x' * 40),
+            'thumbnail': storage.preview_name('a' * 64, 'thumbnail'),
+            'preview': storage.preview_name('a' * 64, 'preview'),
+        }
+        for model in (Attachment, ArchivedAttachment):
+            for field, name in longest.items():
+                with self.subTest(model=model.__name__, field=field):
+                    self.assertLessEqual(len(name), model._meta.get_field(field).max_length)
+
+    def test_sweep_deletes_files_nothing_refers_to(self):
+        kept = self.post_notice('CSE timetable', ('timetable.pdf', b'in use')).attachments.get().file.name
+        # Left behind by an upload whose transaction rolled back
+        orphan = storage.attachment_storage.save('rules.pdf', ContentFile(b'rolled back'))
+        recent = storage.attachment_storage.save('hall.pdf', ContentFile(b'still committing'))
+        for name in (kept, orphan):
+            self.age(name)
+        out = io.StringIO()
+        call_command('sweep_attachments', stdout=out)
+        self.assertEqual(out.getvalue(), "Deleted 1 unused attachment files\n")
+        self.assertEqual(self.stored_files(), sorted([kept, recent]))
+
+
+class AttachmentDownloadTests(TempMediaMixin, NoticeTestCase):
+    content = bytes(range(256)) * 40  # 10240 bytes
+
+    def setUp(self):
+        super().setUp()
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        notice = Notice.objects.create(title='Syllabus', description='-', posted_by=teacher)
+        self.attachment = Attachment.objects.create(
+            notice=notice, file=SimpleUploadedFile('Syllabus 2026.pdf', self.content),
+        )
+        self.url = self.attachment.download_url()
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.attachment.sha256}"')
+        self.assertIn('Syllabus', response['Content-Disposition'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @mock.patch('notices.streaming.FILE_CHUNK_SIZE', 4096)
+    async def test_asgi_download_is_read_in_chunks(self):
+        parts = await asgi_body(await self.async_client.get(self.url))
+        self.assertEqual([len(part) for part in parts], [4096, 4096, 2048])
+        self.assertEqual(b''.join(parts), self.content)
+
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=10000-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(await asgi_body(response)), self.content[10000:])
+
+    def test_unversioned_url_is_revalidated(self):
+        response = self.client.get(reverse('attachment-download', kwargs={'pk': self.attachment.pk}))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_ranges(self):
+        cases = [
+            ('bytes=0-99', 0, 99),
+            ('bytes=10000-', 10000, 10239),
+            ('bytes=-40', 10200, 10239),
+            ('bytes=10200-99999', 10200, 10239),
+        ]
+        for header, start, end in cases:
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/10240')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+                self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10240')
+
+        # Several ranges, or an If-Range for a different version: the whole file
+        for headers in ({'HTTP_RANGE': 'bytes=0-1,5-6'}, {'HTTP_RANGE': 'bytes=0-1', 'HTTP_IF_RANGE': '"stale"'}):
+            response = self.client.get(self.url, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(b''.join(response.streaming_content)), 10240)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.attachment.sha256}"')
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(ATTACHMENT_SERVE_MODE='x-accel-redirect', ATTACHMENT_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.attachment.file.name}')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+
+@override_settings(PREVIEWS_ASYNC=False, PREVIEW_THUMBNAIL_SIZE=64, PREVIEW_SIZE=256)
+class AttachmentPreviewTests(TempMediaMixin, NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.notice = Notice.objects.create(title='Seating plan', description='-', posted_by=teacher)
+
+    def image_bytes(self, size=(800, 600), format='JPEG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, format)
+        return buffer.getvalue()
+
+    def attach(self, filename, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment = Attachment.objects.create(notice=self.notice, file=SimpleUploadedFile(filename, content))
+        attachment.refresh_from_db()
+        return attachment
+
+    def test_image_gets_bounded_webp_previews(self):
+        attachment = self.attach('plan.jpg', self.image_bytes())
+
+        self.assertEqual(attachment.preview_status, Attachment.PREVIEW_READY)
+        self.assertEqual((attachment.thumbnail_width, attachment.thumbnail_height), (64, 48))
+        with Image.open(attachment.preview.path) as preview:
+            self.assertEqual((preview.format, preview.size), ('WEBP', (256, 192)))
+
+        response = self.client.get(attachment.thumbnail_url())
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        page = self.client.get(reverse('notice-detail', kwargs={'pk': self.notice.pk}))
+        self.assertContains(page, f'src="{attachment.thumbnail_url()}"')
+        self.assertContains(page, f'href="{attachment.preview_url()}"')
+
+    def test_other_files_get_no_preview(self):
+        self.assertEqual(self.attach('rules.pdf', b'%PDF-1.4').preview_status, '')
+        broken = self.attach('broken.png', b'not an image')
+        self.assertEqual(broken.preview_status, Attachment.PREVIEW_FAILED)
+        self.assertEqual(self.client.get(broken.thumbnail_url()).status_code, 404)
+
+    def test_previews_are_shared_and_released_with_the_image(self):
+        content = self.image_bytes(format='PNG')
+        first, second = self.attach('plan.png', content), self.attach('copy.png', content)
+        self.assertEqual(first.thumbnail.name, second.thumbnail.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(second.thumbnail.path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(second.thumbnail.path))
+        self.assertFalse(os.path.exists(second.preview.path))
+
+    def test_backfill_command(self):
+        attachment = self.attach('plan.jpg', self.image_bytes())
+        # As if uploaded before previews existed
+        Attachment.objects.filter(pk=attachment.pk).update(preview_status='', thumbnail='', preview='')
+
+        out = io.StringIO()
+        call_command('generate_previews', '--workers=1', stdout=out)
+        self.assertIn('Previews ready for 1 attachments, 0 failed', out.getvalue())
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.preview_status, Attachment.PREVIEW_READY)
+        self.assertTrue(os.path.exists(attachment.thumbnail.path))
+
+
+def docx_bytes(*paragraphs):
+    # The smallest .docx the extractor understands: word/document.xml inside a zip
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>',
+        )
+    return buffer.getvalue()
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False, PREVIEWS_ASYNC=False)
+class AttachmentTextTests(TempMediaMixin, NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.notice = Notice.objects.create(title='Exam schedule', description='See attached.', posted_by=teacher)
+
+    def attach(self, filename, content, notice=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Attachment.objects.create(notice=notice or self.notice, file=SimpleUploadedFile(filename, content))
+
+    def search_archive(self, query):
+        response = self.client.get(reverse('notice-archive'), {'search': query})
+        return [notice.pk for notice in response.context['notices']]
+
+    def test_text_inside_attachments_is_searchable(self):
+        self.attach('hall.txt', 'Midterms are held in Auditorium Kalpana.'.encode())
+        self.attach('slots.csv', b'date,subject\n2026-11-02,"Thermodynamics, paper II"\n')
+        self.attach('rules.docx', docx_bytes('Bring your identity card.', 'No calculators allowed.'))
+
+        for query in ('Kalpana', 'thermodynamics', 'calculators'):
+            with self.subTest(query):
+                self.assertEqual(self.search_archive(query), [self.notice.pk])
+        self.assertEqual(self.search_archive('photosynthesis'), [])
+
+        text = AttachmentText.objects.get(sha256=self.notice.attachments.get(original_filename='slots.csv').sha256)
+        self.assertEqual(zlib.decompress(text.content).decode(), 'date subject\n2026-11-02 Thermodynamics, paper II')
+
+    def test_limit_inside_a_character(self):
+        content = 'Salle de réunion, première étage'.encode()
+        # The byte limit falls between the two bytes of the first 'è'
+        limit = content.index('è'.encode()) + 1
+        with override_settings(ATTACHMENT_TEXT_MAX_BYTES=limit):
+            self.attach('salle.txt', content)
+        self.assertEqual(zlib.decompress(AttachmentText.objects.get().content).decode(), 'Salle de réunion, premi')
+
+    def test_extraction_is_incremental(self):
+        content = b'Lab submission deadline moved to Friday'
+        self.attach('deadline.txt', content)
+        extracted_at = AttachmentText.objects.get().extracted_at
+
+        # Same bytes on another notice, and an edit that keeps the file: nothing is read again
+        other = Notice.objects.create(title='Lab', description='-', posted_by=self.notice.posted_by)
+        copy = self.attach('copy.txt', content, notice=other)
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.name = 'Deadline'
+            copy.save()
+
+        self.assertEqual(AttachmentText.objects.get().extracted_at, extracted_at)
+        self.assertCountEqual(self.search_archive('deadline'), [self.notice.pk, other.pk])
+
+    def test_unreadable_files_are_not_retried(self):
+        broken = self.attach('broken.docx', b'not a zip')
+        text = AttachmentText.objects.get(sha256=broken.sha256)
+        self.assertEqual(text.chars, 0)
+        self.assertTrue(text.error)
+
+        out = io.StringIO()
+        call_command('extract_attachment_text', stdout=out)
+        self.assertIn('Reindexed 0 notices', out.getvalue())
+
+    @override_settings(ATTACHMENT_BLOB_GRACE_SECONDS=0)
+    def test_backfill_command_and_cleanup(self):
+        attachment = self.attach('hall.txt', b'Venue: seminar hall')
+        AttachmentText.objects.all().delete()
+        self.assertEqual(self.search_archive('seminar'), [self.notice.pk])  # reindexed before the delete
+
+        out = io.StringIO()
+        call_command('extract_attachment_text', stdout=out)
+        self.assertIn('Reindexed 1 notices', out.getvalue())
+        self.assertTrue(AttachmentText.objects.filter(sha256=attachment.sha256).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.delete()
+        self.assertFalse(AttachmentText.objects.exists())
+        self.assertEqual(self.search_archive('seminar'), [])
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class BenchCommandTests(TempMediaMixin, NoticeTestCase):
+
+    def test_seed_then_bench_every_url(self):
+        call_command('seed_notices', teachers=3, notices=60, subscriptions=20, today=10, stdout=io.StringIO())
+        self.assertEqual(Notice.objects.count(), 60)
+        self.assertEqual(NoticeSearchIndex.objects.count(), 60)
+        self.assertEqual(PushSubscription.objects.count(), 20)
+        self.assertEqual(Notice.objects.filter(posted_at__gte=todays_range()[0]).count(), 10)
+
+        report_path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(report_path))
+        call_command('bench', iterations=2, warmup=0, output=report_path, stderr=io.StringIO())
+        with open(report_path) as f:
+            report = json.load(f)
+
+        url_names = {result['url_name'] for result in report['results']}
+        self.assertTrue({'notice-list', 'notice-detail', 'notice-archive', 'my-notices', 'subscribe',
+                         'attachment-download', 'api-notices-export'} <= url_names)
+        self.assertNotIn('create_admin', url_names)
+        for result in report['results']:
+            with self.subTest(result['name']):
+                self.assertEqual(result['errors'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertIn('queries', result)
+        # Subscriptions made while benchmarking are removed again
+        self.assertEqual(PushSubscription.objects.count(), 20)
+
+
+class MetricsTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        settings_override = override_settings(METRICS_DIR=metrics_dir, METRICS_TOKEN='scrape-me')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(metrics.registry.reset)
+        metrics.registry.reset()
+        self.metrics_dir = metrics_dir
+
+        self.staff = User.objects.create_user('staff', 'staff@college.edu', 'pw', is_staff=True)
+        Notice.objects.create(title='Fee deadline', description='-', posted_by=self.staff)
+
+    def scrape(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse('notice-archive'))
+        self.client.get(reverse('notice-archive'))
+        self.client.get(reverse('notice-detail', kwargs={'pk': 999}))
+        text = self.scrape()
+
+        self.assertIn('notices_http_requests_total{view="notice-archive",method="GET",status="200"} 2', text)
+        self.assertIn('notices_http_requests_total{view="notice-detail",method="GET",status="404"} 1', text)
+        self.assertIn('notices_http_request_duration_seconds_count{view="notice-archive"} 2', text)
+        self.assertIn('notices_http_request_duration_seconds_bucket{view="notice-archive",le="+Inf"} 2', text)
+        self.assertIn('notices_db_queries_per_request_count{view="notice-archive"} 2', text)
+        # The second request was a cache hit, so only the first rendered a template
+        self.assertIn('notices_template_render_duration_seconds_count{view="notice-archive"} 1', text)
+        self.assertIn('notices_http_response_bytes_count{view="notice-archive"} 2', text)
+        self.assertIn('# TYPE notices_push_sent_total counter', text)
+
+    def test_totals_are_summed_across_workers(self):
+        # Another gunicorn worker's file, as it would have written it
+        other = metrics.Registry()
+        other.path_name = 'other-worker.json'
+        other.inc('notices_push_sent_total', value=40)
+        other.observe('notices_push_fanout_duration_seconds', 0.3)
+        other.flush(force=True)
+        metrics.inc('notices_push_sent_total', value=2)
+        metrics.observe('notices_push_fanout_duration_seconds', 3.0)
+
+        text = self.scrape()
+        self.assertIn('notices_push_sent_total 42', text)
+        self.assertIn('notices_push_fanout_duration_seconds_bucket{le="0.5"} 1', text)
+        self.assertIn('notices_push_fanout_duration_seconds_bucket{le="5.0"} 2', text)
+        self.assertIn('notices_push_fanout_duration_seconds_count 2', text)
+        self.assertEqual(len([name for name in os.listdir(self.metrics_dir) if name.endswith('.json')]), 2)
+
+    def test_files_of_exited_workers_are_merged(self):
+        def worker_file(pid, started, sent):
+            worker = metrics.Registry()
+            worker.path_name = f'{pid}-{started}.json'
+            worker.inc('notices_push_sent_total', value=sent)
+            worker.observe('notices_push_fanout_duration_seconds', 0.3)
+            worker.flush(force=True)
+            return worker.path_name
+
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True)
+        gone_pid = int(exited.stdout)
+        worker_file(gone_pid, 1, 10)
+        # An earlier process that had this process's pid
+        worker_file(os.getpid(), 1, 20)
+        metrics.inc('notices_push_sent_total', value=2)
+
+        for _ in range(2):
+            text = self.scrape()
+            self.assertIn('notices_push_sent_total 32', text)
+            self.assertIn('notices_push_fanout_duration_seconds_count 2', text)
+            self.assertEqual(
+                sorted(name for name in os.listdir(self.metrics_dir) if name.endswith('.json')),
+                [metrics.registry.path_name, metrics.EXITED_FILE],
+            )
+
+        # Stopped after merging a file but before deleting it: it isn't counted twice
+        left_over = worker_file(gone_pid, 2, 5)
+        with open(os.path.join(self.metrics_dir, metrics.EXITED_FILE)) as f:
+            merged = json.load(f)
+        merged['counters'][0][2] += 5
+        merged['files'] = [left_over]
+        metrics.write(os.path.join(self.metrics_dir, metrics.EXITED_FILE), merged)
+        self.assertIn('notices_push_sent_total 37', self.scrape())
+        self.assertNotIn(left_over, os.listdir(self.metrics_dir))
+
+    def test_staff_or_token_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.client.force_login(teacher)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class AsyncViewTests(NoticeTestCase):
+    """The views notices/urls.py routes to when ASYNC_VIEWS is on (ASGI mode)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers, cls.notices = seed_notices(teachers=2, notices=30, attachments_per_notice=1, today=10)
+
+    def setUp(self):
+        super().setUp()
+        self.route_views(async_views=True)
+        self.addCleanup(self.route_views, async_views=False)
+
+    def route_views(self, async_views):
+        with override_settings(ASYNC_VIEWS=async_views):
+            importlib.reload(notices_urls)
+            importlib.reload(project_urls)
+        clear_url_caches()
+
+    def test_pages_match_the_sync_views(self):
+        detail = reverse('notice-detail', kwargs={'pk': self.notices[0].pk})
+        for url in [reverse('notice-list'), reverse('notice-archive'), reverse('notice-archive') + '?department=CSE',
+                    reverse('notice-archive-more'), detail]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.resolver_match.func.view_class.view_is_async, url)
+            async_content = response.content
+            self.assertEqual(self.client.get(url)['X-Cache'], 'hit')
+
+            self.route_views(async_views=False)
+            cache.clear()
+            self.assertEqual(self.client.get(url).content, async_content, url)
+            self.route_views(async_views=True)
+
+        response = self.client.get(reverse('notice-archive'))
+        self.assertEqual(len(response.context['notices']), 20)
+        self.assertContains(self.client.get(response.context['more_url']), 'card-title', count=10)
+        self.assertEqual(self.client.get(reverse('notice-detail', kwargs={'pk': 99999})).status_code, 404)
+        self.assertEqual(self.client.post(detail).status_code, 405)
+
+    def test_revalidation_and_teacher_pages(self):
+        url = reverse('notice-archive')
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.client.force_login(self.teachers[0])
+        response = self.client.get(url)
+        self.assertContains(response, 'Logged in as')
+        self.assertContains(response, reverse('notice-update', kwargs={'pk': self.notices[0].pk}))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_subscribe(self):
+        body = {'endpoint': 'https://push.example.com/1', 'keys': {'p256dh': 'key', 'auth': 'secret'}}
+        response = self.client.post(reverse('subscribe'), body, content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Subscription created successfully')
+        body['department'] = 'EE'
+        response = self.client.post(reverse('subscribe'), body, content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Subscription updated successfully')
+        self.assertEqual(PushSubscription.objects.get().department, 'EE')
+
+        response = self.client.post(reverse('subscribe'), '{', content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Invalid JSON data')
+
+    async def test_asgi_request(self):
+        # Through the ASGI handler and the async middleware chain
+        response = await self.async_client.get(reverse('notice-detail', kwargs={'pk': self.notices[0].pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.notices[0].title)
+        self.assertTrue(response.has_header('ETag'))
+        response = await self.async_client.get(reverse('notice-list'))
+        self.assertEqual(len(response.context['notices']), 10)
+
+
+class NoticeSyncTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+
+    def sync(self, since=None):
+        response = self.client.get(reverse('api-sync'), {} if since is None else {'since': since})
+        self.assertIn('no-store', response['Cache-Control'])
+        return response.json()
+
+    def test_changes_and_tombstones(self):
+        first = self.sync()
+        self.assertTrue(first['reset'])
+
+        kept = Notice.objects.create(title='Lab moved', description='-', posted_by=self.teacher)
+        gone = Notice.objects.create(title='Typo', description='-', posted_by=self.teacher)
+        kept.title = 'Lab moved to LH-2'
+        kept.save()
+        self.client.force_login(self.teacher)
+        self.client.post(reverse('notice-delete', kwargs={'pk': gone.pk}))
+
+        delta = self.sync(first['cursor'])
+        self.assertFalse(delta['reset'])
+        self.assertEqual([notice['title'] for notice in delta['changed']], ['Lab moved to LH-2'])
+        self.assertEqual(delta['deleted'], [gone.pk])
+        self.assertEqual(self.sync(delta['cursor'])['changed'], [])
+
+        # Paged, and a cursor from before the retained log starts over
+        with mock.patch('notices.api.SYNC_PAGE_SIZE', 2):
+            page = self.sync(first['cursor'])
+            self.assertTrue(page['more'])
+            self.assertEqual(self.sync(page['cursor'])['deleted'], [gone.pk])
+        NoticeEvent.objects.filter(pk__lte=first['cursor'] + 2).delete()
+        self.assertTrue(self.sync(first['cursor'])['reset'])
+
+    def test_archived_notices_are_not_tombstones(self):
+        cursor = self.sync()['cursor']
+        old = Notice.objects.create(title='Old timetable', description='-', posted_by=self.teacher)
+        Notice.objects.filter(pk=old.pk).update(posted_at=timezone.now() - timedelta(days=400))
+        archive.archive_notices(365)
+
+        delta = self.sync(cursor)
+        self.assertEqual(delta['deleted'], [])
+        self.assertEqual([notice['id'] for notice in delta['changed']], [old.pk])
+
+    def test_service_worker(self):
+        response = self.client.get(reverse('service-worker'))
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+        self.assertContains(response, f"const SYNC_URL = '{reverse('api-sync')}'")
+
+
+class SubscribeTests(NoticeTestCase):
+
+    def subscribe(self, **changes):
+        body = {'endpoint': 'https://push.example.com/1', 'keys': {'p256dh': 'key', 'auth': 'secret'}, **changes}
+        response = self.client.post(reverse('subscribe'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['message']
+
+    @skipUnlessDBFeature('can_return_rows_from_bulk_insert')
+    def test_upsert(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.subscribe(), 'Subscription created successfully')
+        subscribed_at = PushSubscription.objects.get().subscribed_at
+
+        # Page loads re-posting the same subscription don't reach the database
+        with self.assertNumQueries(0):
+            self.assertEqual(self.subscribe(), 'Subscription updated successfully')
+
+        self.assertEqual(audience.segment_size('CSE', 'S3'), 1)
+        self.subscribe(department='EE')
+        subscription = PushSubscription.objects.get()
+        self.assertEqual((subscription.department, subscription.subscribed_at), ('EE', subscribed_at))
+        self.assertEqual(audience.segment_size('CSE', 'S3'), 0)
+
+        # Another worker (an empty skip cache) stores nothing for an unchanged repeat
+        subscriptions.recent.clear()
+        self.assertEqual(self.subscribe(department='EE'), 'Subscription updated successfully')
+
+        subscription.delete()
+        self.assertEqual(self.subscribe(department='EE'), 'Subscription created successfully')
+
+    def test_rejects_unknown_department_or_semester(self):
+        body = {'endpoint': 'https://push.example.com/1', 'keys': {'p256dh': 'key', 'auth': 'secret'}}
+        for choice in ({'department': 'XYZ'}, {'department': 'cse'}, {'semester': 'S9'}, {'semester': 3}):
+            with self.subTest(**choice):
+                response = self.client.post(reverse('subscribe'), {**body, **choice}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'Unknown department or semester')
+        self.assertFalse(PushSubscription.objects.exists())
+
+        # Leaving either out subscribes to all of them
+        self.subscribe(department='', semester=None)
+        subscription = PushSubscription.objects.get()
+        self.assertEqual((subscription.department, subscription.semester), ('ALL', 'ALL'))
+
+
+class AudienceTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        # A student for every department/semester choice, 'ALL' included
+        departments = ['ALL', 'CSE', 'EE']
+        semesters = ['ALL', 'S3', 'S5']
+        PushSubscription.objects.bulk_create([
+            PushSubscription(
+                endpoint=f'https://push.example.com/{department}/{semester}', p256dh_key='key', auth_key='secret',
+                department=department, semester=semester,
+            )
+            for department in departments for semester in semesters
+        ])
+
+    def receivers(self, department, semester):
+        notice = Notice.objects.create(
+            title='Timetable', description='-', posted_by=self.teacher, department=department, semester=semester,
+        )
+        return sorted(
+            tuple(endpoint.split('/')[-2:]) for endpoint in audience.audience(notice).values_list('endpoint', flat=True)
+        )
+
+    def test_who_receives_a_notice(self):
+        expected = {
+            # A notice for one semester of a department: that semester, or all of them, of that department or all
+            ('CSE', 'S3'): [('ALL', 'ALL'), ('ALL', 'S3'), ('CSE', 'ALL'), ('CSE', 'S3')],
+            ('EE', 'S5'): [('ALL', 'ALL'), ('ALL', 'S5'), ('EE', 'ALL'), ('EE', 'S5')],
+            # A semester nobody chose reaches only those who chose every semester
+            ('CSE', 'S1'): [('ALL', 'ALL'), ('CSE', 'ALL')],
+            # A notice for every semester reaches each semester of the department
+            ('CSE', 'ALL'): [
+                ('ALL', 'ALL'), ('ALL', 'S3'), ('ALL', 'S5'), ('CSE', 'ALL'), ('CSE', 'S3'), ('CSE', 'S5'),
+            ],
+            # And a department nobody chose reaches only the 'ALL' departments
+            ('ME', 'S3'): [('ALL', 'ALL'), ('ALL', 'S3')],
+            ('ME', 'ALL'): [('ALL', 'ALL'), ('ALL', 'S3'), ('ALL', 'S5')],
+        }
+        for (department, semester), receivers in expected.items():
+            with self.subTest(department=department, semester=semester):
+                self.assertEqual(self.receivers(department, semester), receivers)
+                self.assertEqual(audience.segment_size(department, semester), len(receivers))
+
+    def test_reaches_agrees_with_the_query(self):
+        subscriptions = list(PushSubscription.objects.values_list('department', 'semester'))
+        for department, _ in DEPARTMENTS:
+            for semester, _ in SEMESTERS:
+                with self.subTest(department=department, semester=semester):
+                    self.assertEqual(
+                        sorted(s for s in subscriptions if audience.reaches(*s, department, semester)),
+                        self.receivers(department, semester),
+                    )
+
+    def test_chunks_cover_the_audience_once(self):
+        notice = Notice.objects.create(
+            title='Timetable', description='-', posted_by=self.teacher, department='CSE', semester='ALL',
+        )
+        chunks = list(audience.audience_chunks(notice, fields=('endpoint',), chunk_size=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 2])
+        self.assertEqual(
+            sorted(endpoint for chunk in chunks for (endpoint,) in chunk),
+            sorted(audience.audience(notice).values_list('endpoint', flat=True)),
+        )
+
+
+def push_keys():
+    """A browser's p256dh and auth keys, so payloads can really be encrypted."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    point = key.public_key().public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+    encode = lambda data: base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+    return encode(point), encode(os.urandom(16))
+
+
+class PushServiceStub:
+    """
+    A push service on localhost. /gone/... subscriptions answer 410, /missing/... 404, /flaky/... 503,
+    /throttled/... 429 with a Retry-After of two minutes, everything else 201.
+    Keeps connections alive and records which one each request came in on.
+    """
+
+    def __init__(self):
+        stub = self
+        self.requests = []
+        self.connections = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.requests.append((self.path, {key.lower(): value for key, value in self.headers.items()}))
+                stub.connections.append(self.client_address)
+                status = (
+                    410 if self.path.startswith('/gone/') else 404 if self.path.startswith('/missing/') else
+                    503 if self.path.startswith('/flaky/') else
+                    429 if self.path.startswith('/throttled/') else 201
+                )
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '120')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def vapid_private_key():
+    key = ec.generate_private_key(ec.SECP256R1())
+    der = key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return base64.urlsafe_b64encode(der).rstrip(b'=').decode()
+
+
+class PushSenderTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stub = PushServiceStub()
+        self.addCleanup(self.stub.close)
+        self.addCleanup(transport.close)
+        webpush_settings = dict(settings.WEBPUSH_SETTINGS, VAPID_PRIVATE_KEY=vapid_private_key())
+        override = override_settings(WEBPUSH_SETTINGS=webpush_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.notice = Notice.objects.create(title='Lab closed', description='-', posted_by=teacher)
+        for path in ['ok/1', 'ok/2', 'ok/3', 'gone/1', 'flaky/1']:
+            p256dh, auth = push_keys()
+            PushSubscription.objects.create(endpoint=f'{self.stub.url}/{path}', p256dh_key=p256dh, auth_key=auth)
+
+    def assertDelivered(self, sender):
+        with override_settings(PUSH_SENDER=sender, PUSH_INLINE_DRAIN=True):
+            totals = PushDispatcher(max_workers=2).fan_out(self.notice.pk)
+        self.assertEqual((totals['sent'], totals['retrying'], totals['failed'], totals['pruned']), (3, 1, 0, 1))
+        self.assertEqual(len(self.stub.requests), 5)
+        path, headers = self.stub.requests[0]
+        self.assertEqual(headers['content-encoding'], 'aes128gcm')
+        self.assertEqual(headers['ttl'], str(settings.PUSH_TTL))
+        self.assertFalse(PushSubscription.objects.filter(endpoint__contains='/gone/').exists())
+        self.assertEqual(PushDelivery.objects.get(subscription__endpoint__contains='/flaky/').status, PushDelivery.PENDING)
+
+        # One signed VAPID header for the origin, and pooled connections rather than one per send
+        authorizations = {headers['authorization'] for path, headers in self.stub.requests}
+        self.assertEqual(len(authorizations), 1)
+        token = authorizations.pop().split('t=')[1].split(',')[0]
+        claims = json.loads(base64.urlsafe_b64decode(token.split('.')[1] + '=='))
+        self.assertEqual(claims['aud'], self.stub.url)
+        self.assertLessEqual(len(set(self.stub.connections)), 2)
+
+    def test_thread_sender(self):
+        self.assertDelivered('threads')
+
+    def test_asyncio_sender(self):
+        self.assertDelivered('asyncio')
+
+    def test_retry_after(self):
+        throttled = PushServiceStub()
+        self.addCleanup(throttled.close)
+        for path in ['throttled/1', 'throttled/2']:
+            p256dh, auth = push_keys()
+            PushSubscription.objects.create(endpoint=f'{throttled.url}/{path}', p256dh_key=p256dh, auth_key=auth)
+        with override_settings(PUSH_INLINE_DRAIN=True):
+            totals = PushDispatcher(max_workers=1).fan_out(self.notice.pk)
+        self.assertEqual((totals['sent'], totals['retrying']), (3, 2))
+
+        # The service asked for two minutes: nothing more is sent to it, and the send
+        # that never went out doesn't count as an attempt
+        self.assertEqual(len(throttled.requests), 1)
+        deliveries = PushDelivery.objects.filter(subscription__endpoint__startswith=throttled.url)
+        self.assertEqual(sorted(deliveries.values_list('attempts', flat=True)), [0, 1])
+        for delivery in deliveries:
+            self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=100))
+
+
+@override_settings(PUSH_INLINE_DRAIN=False)
+class NewNoticePushTests(NoticeTestCase):
+    """Posting a notice hands its push to the dispatcher once the notice is committed."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('teacher', 'teacher@college.edu', 'pw'))
+        PushSubscription.objects.bulk_create([
+            PushSubscription(endpoint=f'https://push.example.com/{department}', p256dh_key='key', auth_key='secret',
+                             department=department)
+            for department in ['CSE', 'EE']
+        ])
+
+    def post_notice(self):
+        data = {
+            'title': 'Lab closed', 'notice_type': 'Common', 'department': 'CSE', 'semester': 'ALL',
+            'description': '-', 'attachments-TOTAL_FORMS': '0', 'attachments-INITIAL_FORMS': '0',
+        }
+        self.assertEqual(self.client.post(reverse('create-notice'), data).status_code, 302)
+        return Notice.objects.get(title='Lab closed')
+
+    @override_settings(PUSH_ASYNC=False)
+    def test_push_queued_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notice = self.post_notice()
+            # Nothing is queued while the notice could still roll back
+            self.assertFalse(PushDelivery.objects.exists())
+        self.assertEqual(
+            list(PushDelivery.objects.values_list('notice', 'subscription__endpoint', 'status')),
+            [(notice.pk, 'https://push.example.com/CSE', PushDelivery.PENDING)],
+        )
+
+    @override_settings(PUSH_ASYNC=True)
+    def test_push_runs_on_the_background_pool(self):
+        threads = []
+        record_thread = lambda notice_id: threads.append(threading.current_thread().name)
+        with mock.patch.object(dispatcher, 'fan_out', side_effect=record_thread) as fan_out:
+            with self.captureOnCommitCallbacks(execute=True):
+                notice = self.post_notice()
+                fan_out.assert_not_called()
+            # The pool has one coordinator thread, so this waits for the fan-out before it
+            dispatcher._coordinator.submit(lambda: None).result(timeout=10)
+        fan_out.assert_called_once_with(notice.pk)
+        self.assertTrue(threads[0].startswith('push-fanout'))
+
+
+class OutboxTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.notice = Notice.objects.create(title='Lab closed', description='-', posted_by=teacher)
+        PushSubscription.objects.bulk_create([
+            PushSubscription(endpoint=f'https://push.example.com/{i}', p256dh_key='key', auth_key='secret')
+            for i in range(3)
+        ])
+        self.assertEqual(outbox.enqueue_notice(self.notice), 3)
+
+    def test_expired_lease_is_reclaimed(self):
+        first = outbox.claim_batch()
+        self.assertEqual(len(first), 3)
+        first_token = PushDelivery.objects.values_list('claim_token', flat=True).distinct().get()
+        # Claimed rows aren't handed to another worker while the lease lasts
+        self.assertEqual(outbox.claim_batch(), [])
+
+        # The first worker died: once its lease runs out the rows are claimed again, under a new token
+        PushDelivery.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        second = outbox.claim_batch(batch_size=2)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(len(outbox.claim_batch()), 1)
+        tokens = set(PushDelivery.objects.values_list('claim_token', flat=True))
+        self.assertEqual(len(tokens), 2)
+        self.assertNotIn(first_token, tokens)
+        self.assertGreater(PushDelivery.objects.get(pk=second[0].pk).claimed_until, timezone.now())
+
+    @override_settings(PUSH_RETRY_BASE_DELAY=30, PUSH_RETRY_MAX_DELAY=200, PUSH_MAX_ATTEMPTS=5)
+    def test_backoff(self):
+        delivery = outbox.claim_batch(batch_size=1)[0]
+        delays = []
+        with mock.patch('notices.outbox.random.uniform', return_value=1.0):
+            for attempt in range(1, 5):
+                before = timezone.now()
+                self.assertEqual(outbox.mark_failed(delivery, 'HTTP 503'), PushDelivery.PENDING)
+                delivery.refresh_from_db()
+                self.assertEqual((delivery.attempts, delivery.claim_token), (attempt, None))
+                delays.append(round((delivery.next_attempt_at - before).total_seconds()))
+                # Not due again until the delay has passed
+                self.assertNotIn(delivery.pk, [d.pk for d in outbox.claim_batch()])
+                PushDelivery.objects.filter(status=PushDelivery.SENDING).update(status=PushDelivery.PENDING)
+        # Doubling from the base delay, up to the maximum
+        self.assertEqual(delays, [30, 60, 120, 200])
+
+        # A Retry-After longer than the backoff wins
+        delivery.attempts = 0
+        before = timezone.now()
+        outbox.mark_failed(delivery, 'HTTP 429', retry_after=600)
+        delivery.refresh_from_db()
+        self.assertGreaterEqual(delivery.next_attempt_at - before, timedelta(seconds=600))
+
+        # The last attempt, or a permanent error, gives up
+        delivery.attempts = 4
+        self.assertEqual(outbox.mark_failed(delivery, 'HTTP 503'), PushDelivery.FAILED)
+        delivery.attempts = 0
+        self.assertEqual(outbox.mark_failed(delivery, 'HTTP 400', transient=False), PushDelivery.FAILED)
+
+        # Jitter keeps retries of one fan-out apart, within 20% of the delay
+        delays = {outbox.retry_delay(2).total_seconds() for _ in range(20)}
+        self.assertGreater(len(delays), 1)
+        self.assertTrue(all(48 <= delay <= 72 for delay in delays))
+
+    def test_gone_subscriptions_are_pruned(self):
+        stub = PushServiceStub()
+        self.addCleanup(stub.close)
+        self.addCleanup(transport.close)
+        webpush_settings = dict(settings.WEBPUSH_SETTINGS, VAPID_PRIVATE_KEY=vapid_private_key())
+        override = override_settings(WEBPUSH_SETTINGS=webpush_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+        PushSubscription.objects.all().delete()
+        for path in ['ok/1', 'gone/1', 'missing/1', 'flaky/1']:
+            p256dh, auth = push_keys()
+            PushSubscription.objects.create(endpoint=f'{stub.url}/{path}', p256dh_key=p256dh, auth_key=auth)
+        outbox.enqueue_notice(self.notice)
+        # The gone subscription also has an older delivery waiting for a retry
+        other = Notice.objects.create(title='Lab open', description='-', posted_by=self.notice.posted_by)
+        PushDelivery.objects.create(
+            notice=other, subscription=PushSubscription.objects.get(endpoint__contains='/gone/'),
+            next_attempt_at=timezone.now() + timedelta(hours=1),
+        )
+
+        call_command('push_worker', '--once', stdout=io.StringIO())
+        # 410 and 404 both mean the subscription is gone: it and every delivery to it are removed
+        self.assertEqual(
+            sorted(PushSubscription.objects.values_list('endpoint', flat=True)),
+            [f'{stub.url}/flaky/1', f'{stub.url}/ok/1'],
+        )
+        self.assertEqual(
+            dict(PushDelivery.objects.values_list('subscription__endpoint', 'status')),
+            {f'{stub.url}/ok/1': PushDelivery.SENT, f'{stub.url}/flaky/1': PushDelivery.PENDING},
+        )
+
+
+class LiveFeedTests(NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        self.since = live.latest_event_id()
+
+    def post(self, title, department):
+        return Notice.objects.create(title=title, description='-', posted_by=self.teacher, department=department)
+
+    def feed(self, last_event_id=None, **params):
+        headers = {'HTTP_LAST_EVENT_ID': str(last_event_id)} if last_event_id else {}
+        response = self.client.get(reverse('notice-live'), params, **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.content.decode()
+
+    def last_id(self, body):
+        return int(re.findall(r'^id: (\d+)$', body, re.M)[-1])
+
+    def test_pages_link_to_the_feed(self):
+        response = self.client.get(reverse('notice-archive'), {'department': 'CSE', 'semester': 'S3'})
+        self.assertIn('department=CSE&semester=S3', response.context['live_url'])
+        # The feed picks up after the last change the page could have shown
+        lab = self.post('Lab moved', 'CSE')
+        cache.clear()
+        response = self.client.get(reverse('notice-archive'))
+        self.assertIn(f'since={NoticeEvent.objects.get(notice_id=lab.pk).pk}', response.context['live_url'])
+        self.assertContains(response, 'data-live-url=')
+        self.assertIsNone(self.client.get(reverse('notice-archive'), {'search': 'exam'}).context['live_url'])
+
+    def test_changes_since_the_page_was_rendered(self):
+        lab = self.post('Lab moved', 'CSE')
+        self.post('Workshop timings', 'EE')
+        body = self.feed(department='CSE', since=self.since)
+        self.assertIn('event: created', body)
+        self.assertIn('Lab moved', body)
+        self.assertIn(f'data-notice-id=\\"{lab.pk}\\"', body)
+        self.assertNotIn('Workshop timings', body)
+        self.assertIn('retry: ', body)
+
+        # Reconnecting carries on from the last event seen
+        lab.department = 'EE'
+        lab.save()
+        body = self.feed(self.last_id(body), department='CSE')
+        self.assertEqual(body.count('event: '), 1)
+        self.assertIn('event: removed', body)
+        lab.delete()
+        self.assertIn('event: deleted', self.feed(self.last_id(body), department='EE'))
+
+        with override_settings(LIVE_REPLAY_LIMIT=2):
+            self.assertIn('event: reload', self.feed(since=self.since))
+
+    @override_settings(LIVE_STREAMING=True, LIVE_POLL_INTERVAL=0.05, LIVE_KEEPALIVE=0.2, LIVE_MAX_DURATION=1)
+    async def test_stream(self):
+        await sync_to_async(self.post)('Lab moved', 'CSE')
+        response = await self.async_client.get(reverse('notice-live'), {'since': self.since})
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b'retry: ', await anext(chunks))
+        self.assertIn(b'Lab moved', await anext(chunks))
+        self.assertIn(b'id: ', await anext(chunks))
+
+        # Picked up by the hub while the stream is open
+        await sync_to_async(self.post)('Fee deadline extended', 'ME')
+        rest = b''.join([chunk async for chunk in chunks])
+        self.assertIn(b'Fee deadline extended', rest)
+        self.assertEqual(rest.count(b'event: created'), 1)
+        self.assertEqual(live.hub.screens, set())
+
+
+@override_settings(NOTICES_PER_PAGE=3)
+class NoticeArchiveTests(TempMediaMixin, NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        now = timezone.now()
+        self.notices = []
+        for i, days in enumerate([0, 1, 2, 400, 401, 402]):
+            notice = Notice.objects.create(
+                title=f'Exam notice {i}', description='-', posted_by=self.teacher, department='CSE',
+            )
+            Notice.objects.filter(pk=notice.pk).update(posted_at=now - timedelta(days=days))
+            self.notices.append(notice)
+        with self.captureOnCommitCallbacks(execute=True):
+            # The same file on a notice that stays and on one that is archived
+            for notice in (self.notices[0], self.notices[3]):
+                Attachment.objects.create(notice=notice, file=SimpleUploadedFile('rules.pdf', b'%PDF rules'))
+
+    def test_old_notices_move_with_their_attachments(self):
+        old = self.notices[3]
+        updated_at = Notice.objects.get(pk=old.pk).updated_at
+        events = NoticeEvent.objects.count()
+        out = io.StringIO()
+        call_command('archive_notices', '--older-than-days=365', '--batch-size=2', stdout=out)
+
+        self.assertIn('Archived 3 notices', out.getvalue())
+        self.assertEqual(set(Notice.objects.values_list('pk', flat=True)), {n.pk for n in self.notices[:3]})
+        archived = ArchivedNotice.objects.get(pk=old.pk)
+        self.assertEqual((archived.title, archived.updated_at), (old.title, updated_at))
+        self.assertEqual(archived.attachments.get().filename(), 'rules.pdf')
+        self.assertFalse(NoticeSearchIndex.objects.filter(notice_id=old.pk).exists())
+        # Nothing changed as far as the live feed and offline copies are concerned
+        self.assertEqual(NoticeEvent.objects.count(), events)
+
+        # The blob stays while the archived attachment refers to it
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notices[0].delete()
+        self.assertEqual(self.client.get(archived.attachments.get().download_url()).status_code, 200)
+
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('notice-detail', kwargs={'pk': old.pk}))
+        self.assertContains(response, 'Archived')
+        self.assertNotContains(response, 'Edit Notice')
+
+    def test_archive_page_lists_and_searches_both(self):
+        archive.archive_notices(365)
+        self.client.force_login(self.teacher)
+        titles, url = [], reverse('notice-archive')
+        while url:
+            response = self.client.get(url, {'department': 'CSE'} if not titles else None)
+            titles += [notice.title for notice in response.context['notices']]
+            url = response.context['next_page_url']
+        self.assertEqual(titles, [f'Exam notice {i}' for i in range(6)])
+        # Archived notices are read-only
+        self.assertNotContains(response, 'class="author-controls"')
+
+        response = self.client.get(reverse('notice-archive'), {'search': 'exam'})
+        response = self.client.get(response.context['next_page_url'])
+        self.assertEqual([notice.archived for notice in response.context['notices']], [True] * 3)
+        self.assertEqual(self.client.get(reverse('notice-update', kwargs={'pk': self.notices[4].pk})).status_code, 404)
+
+
+
+@override_settings(TEXT_EXTRACTION_ASYNC=False)
+class ImportExportTests(TempMediaMixin, NoticeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.files = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.files)
+
+        self.teacher = User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        User.objects.create_user('office', 'office@college.edu', 'pw')
+        with open(os.path.join(self.files, 'timetable.txt'), 'w') as file:
+            file.write('Monday: thermodynamics lab')
+
+    def write_csv(self, rows):
+        path = os.path.join(self.files, 'notices.csv')
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['title', 'description', 'notice_type', 'department', 'semester', 'posted_by',
+                             'posted_at', 'attachments'])
+            writer.writerows(rows)
+        return path
+
+    def test_csv_import(self):
+        path = self.write_csv([
+            ['Timetable', 'For S3', 'Common', 'Mechanical Engineering', 'S3', 'teacher', '2025-07-01',
+             'timetable.txt'],
+            ['Fee dates', 'Pay by Friday', 'Common', 'CSE', 'ALL', 'someone', '', ''],
+            ['No department', '-', 'Common', 'Physics', 'S1', 'teacher', '', ''],
+            ['Bad date', '-', 'Common', 'CSE', 'S1', 'teacher', 'last week', ''],
+        ])
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_notices', path, '--files', self.files, '--default-user', 'office', '--dry-run',
+                     stdout=out, stderr=err)
+        self.assertIn('Would import 2 notices, skipped 2 rows', out.getvalue())
+        self.assertIn("Line 4: unknown department 'Physics'", err.getvalue())
+        self.assertFalse(Notice.objects.exists())
+
+        call_command('import_notices', path, '--files', self.files, '--default-user', 'office',
+                     stdout=out, stderr=io.StringIO())
+        timetable = Notice.objects.get(title='Timetable')
+        self.assertEqual((timetable.department, timetable.posted_by), ('ME', self.teacher))
+        self.assertEqual(timezone.localdate(timetable.posted_at).isoformat(), '2025-07-01')
+        self.assertEqual(timetable.attachments.get().filename(), 'timetable.txt')
+        self.assertEqual(Notice.objects.get(title='Fee dates').posted_by.username, 'office')
+        self.assertEqual(NoticeEvent.objects.filter(kind=NoticeEvent.CREATED).count(), 2)
+        # Indexed with the attachment's text, as if posted through the form
+        self.assertContains(self.client.get(reverse('notice-archive'), {'search': 'thermodynamics'}), 'Timetable')
+
+    def test_export_reimports(self):
+        path = self.write_csv([
+            ['Timetable', 'For S3', 'Common', 'ME', 'S3', 'teacher', '2025-07-01', 'timetable.txt'],
+            ['Old notice', '-', 'Common', 'ME', 'S1', 'teacher', '2020-01-01', ''],
+            ['Other department', '-', 'Common', 'CSE', 'S1', 'teacher', '', ''],
+        ])
+        call_command('import_notices', path, '--files', self.files, stdout=io.StringIO())
+        archive.archive_notices(365)
+
+        exported = os.path.join(self.files, 'export')
+        output = os.path.join(self.files, 'me.ndjson')
+        out = io.StringIO()
+        call_command('export_notices', '--output', output, '--department', 'ME', '--files', exported, stdout=out)
+        self.assertIn('Exported 2 notices', out.getvalue())
+        with open(output) as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual([record['title'] for record in records], ['Timetable', 'Old notice'])
+        self.assertEqual(records[0]['posted_by'], 'teacher')
+
+        Notice.objects.all().delete()
+        ArchivedNotice.objects.all().delete()
+        call_command('import_notices', output, '--files', exported, stdout=io.StringIO())
+        timetable = Notice.objects.get(title='Timetable')
+        self.assertEqual(timetable.attachments.get().file.read(), b'Monday: thermodynamics lab')
+        self.assertEqual(timezone.localtime(Notice.objects.get(title='Old notice').posted_at).year, 2020)
+
+    @override_settings(PUSH_INLINE_DRAIN=False)
+    def test_notify_sends_one_summary_per_subscriber(self):
+        for path, department, semester in [('cse', 'CSE', 'ALL'), ('ee', 'EE', 'S3'), ('all', 'ALL', 'ALL')]:
+            p256dh, auth = push_keys()
+            PushSubscription.objects.create(endpoint=f'https://push.example.com/{path}', p256dh_key=p256dh,
+                                            auth_key=auth, department=department, semester=semester)
+        rows = [[f'CSE notice {i}', '-', 'Common', 'CSE', 'S1', 'teacher', '', ''] for i in range(3)]
+        path = self.write_csv(rows + [['EE notice', '-', 'Common', 'EE', 'S3', 'teacher', '', '']])
+        out = io.StringIO()
+        call_command('import_notices', path, '--notify', stdout=out)
+        self.assertIn("{'queued': 3}", out.getvalue())
+
+        payloads = {
+            delivery.subscription.endpoint.rsplit('/', 1)[1]: delivery.payload
+            for delivery in PushDelivery.objects.select_related('subscription')
+        }
+        self.assertEqual(json.loads(payloads['all'])['title'], '4 New Notices')
+        summary = json.loads(payloads['cse'])
+        self.assertEqual((summary['title'], summary['body']),
+                         ('3 New Notices: Computer Science and Engineering', 'Latest: CSE notice 2'))
+        self.assertIn('department=CSE', summary['url'])
+        # A single notice gets the ordinary push
+        self.assertEqual(payloads['ee'], '')
+
+
+class ReadReplicaTests(NoticeTestCase):
+    # The replica's test database is a separate, empty one that nothing copies to, so whether
+    # a page shows the notice tells which database it was read from (without REPLICA_DATABASE_URL,
+    # notices.testing.NoticeTestRunner provides it)
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        replicas.health.clear()
+        settings_override = override_settings(READ_REPLICA='replica', REPLICA_STICKY_SECONDS=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        User.objects.create_user('teacher', 'teacher@college.edu', 'pw')
+        Notice.objects.create(title='Lab closed', description='-', posted_by=User.objects.get())
+
+    def test_reads_use_the_replica_once_writes_have_settled(self):
+        # A notice changed moments ago: the replica may not have it yet
+        self.assertContains(self.client.get(reverse('notice-list')), 'Lab closed')
+        cache.clear()
+        with override_settings(REPLICA_STICKY_SECONDS=0), CaptureQueriesContext(connections['replica']) as queries:
+            self.assertNotContains(self.client.get(reverse('notice-list')), 'Lab closed')
+            # Writes still go to the primary
+            self.client.post(reverse('subscribe'), json.dumps({
+                'endpoint': 'https://push.example.com/1', 'keys': {'p256dh': 'key', 'auth': 'auth'},
+            }), content_type='application/json')
+        self.assertTrue(queries)
+        self.assertTrue(PushSubscription.objects.using('default').exists())
+        self.assertFalse(PushSubscription.objects.using('replica').exists())
+
+    def test_search_reads_the_replica(self):
+        search.index_notices(Notice.objects.values_list('pk', flat=True))
+        with override_settings(REPLICA_STICKY_SECONDS=0), \
+                CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('notice-archive'), {'search': 'lab'})
+        self.assertEqual(list(response.context['notices']), [])
+        # The full-text lookup as well as the page itself
+        self.assertTrue(any('MATCH' in query['sql'] for query in replica.captured_queries))
+        self.assertFalse(any('MATCH' in query['sql'] for query in primary.captured_queries))
+
+        # On the primary, the same search finds it
+        cache.clear()
+        self.client.cookies[replicas.STICKY_COOKIE] = '1'
+        response = self.client.get(reverse('notice-archive'), {'search': 'lab'})
+        self.assertEqual([notice.title for notice in response.context['notices']], ['Lab closed'])
+
+    async def test_async_requests(self):
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.assertNotContains(await self.async_client.get(reverse('notice-list')), 'Lab closed')
+
+    def test_browser_that_wrote_reads_the_primary(self):
+        response = self.client.post(reverse('login'), {'username': 'teacher', 'password': 'pw'})
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+        cache.delete(replicas.BOARD_WRITE_KEY)
+        # Signed in (the session is only on the primary) and seeing the notice
+        response = self.client.get(reverse('my-notices'))
+        self.assertContains(response, 'Lab closed')
+
+        del self.client.cookies[replicas.STICKY_COOKIE]
+        self.assertNotContains(self.client.get(reverse('notice-list')), 'Lab closed')
+
+    def test_unhealthy_replica_falls_back_to_the_primary(self):
+        failing = mock.patch.object(connections['replica'], 'ensure_connection', side_effect=OperationalError('down'))
+        with override_settings(REPLICA_STICKY_SECONDS=0), failing, self.assertLogs('notices.replicas', 'WARNING'):
+            self.assertContains(self.client.get(reverse('notice-list')), 'Lab closed')
+            # Not checked again until REPLICA_HEALTH_CHECK_INTERVAL has passed
+            self.assertContains(self.client.get(reverse('notice-list') + '?page=1'), 'Lab closed')
+        self.assertEqual(replicas.health['replica'][0], False)
@@ -1,19 +1,47 @@
+from django.conf import settings
 from django.urls import path
 from django.views.generic import TemplateView
-from . import views
+from . import api, live, views
+from .downloads import AttachmentDownloadView
 from .views import StudentNoticeListView, AllNoticesListView,NoticeCreateView,NoticeUpdateView, NoticeDeleteView, NoticeDetailView,MyNoticesListView, SubscribeView,create_admin
 
+# Under ASGI the read pages and /subscribe/ have async versions (see notices/async_views.py)
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        AsyncAllNoticesListView as AllNoticesListView,
+        AsyncNoticeDetailView as NoticeDetailView,
+        AsyncStudentNoticeListView as StudentNoticeListView,
+        AsyncSubscribeView as SubscribeView,
+    )
+
 urlpatterns = [
   
-    path('', views.StudentNoticeListView.as_view(), name='notice-list'), 
+    path('', StudentNoticeListView.as_view(), name='notice-list'), 
+    path('more/', StudentNoticeListView.as_view(fragment=True), name='notice-list-more'),
     path('create-notice/', NoticeCreateView.as_view(), name='create-notice'),
     path('<int:pk>/edit/', NoticeUpdateView.as_view(), name='notice-update'),
     path('<int:pk>/delete/', NoticeDeleteView.as_view(), name='notice-delete'),
     path('<int:pk>/', NoticeDetailView.as_view(), name='notice-detail'),
     path('archive/', AllNoticesListView.as_view(), name='notice-archive'),
+    path('archive/more/', AllNoticesListView.as_view(fragment=True), name='notice-archive-more'),
+    path('attachments/<int:pk>/', AttachmentDownloadView.as_view(), name='attachment-download'),
+    path('attachments/<int:pk>/thumbnail/', AttachmentDownloadView.as_view(variant='thumbnail'), name='attachment-thumbnail'),
+    path('attachments/<int:pk>/preview/', AttachmentDownloadView.as_view(variant='preview'), name='attachment-preview'),
     path('my-notices/', MyNoticesListView.as_view(), name='my-notices'),
+    path('my-notices/more/', MyNoticesListView.as_view(fragment=True), name='my-notices-more'),
     path('about/', TemplateView.as_view(template_name='notices/about.html'), name='about'),
     path('contact/', TemplateView.as_view(template_name='notices/contact.html'), name='contact'),
     path('subscribe/', SubscribeView.as_view(), name='subscribe'),
+    path('live/', live.live_feed, name='notice-live'),
     path("create-admin/", create_admin, name="create_admin"),
+    # At the site root, so the worker's scope covers every page
+    path('serviceworker.js', views.service_worker, name='service-worker'),
+    path('metrics', views.metrics_view, name='metrics'),
+
+    # Read-only JSON API (same filters as the board and the archive)
+    path('api/board/', api.BoardAPIView.as_view(), name='api-board'),
+    path('api/notices/', api.NoticeListAPIView.as_view(), name='api-notices'),
+    path('api/notices/export/', api.NoticeExportView.as_view(), name='api-notices-export'),
+    path('api/notices/<int:pk>/', api.NoticeDetailAPIView.as_view(), name='api-notice-detail'),
+    path('api/sync/', api.NoticeSyncView.as_view(), name='api-sync'),
 ]
\ No newline at end of file
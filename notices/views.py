@@ -1,23 +1,37 @@
 # notices/views.py
 
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
-from django.db.models import Q # Used to create 'OR' logic
+from django.db import transaction
 from django.conf import settings
 
 from django.contrib.auth.mixins import LoginRequiredMixin,UserPassesTestMixin
 from django.urls import reverse_lazy, reverse
 from django.shortcuts import get_object_or_404,redirect
-from .models import PushSubscription,Notice
+from django.http import Http404
+from django.template.loader import render_to_string
+from .models import PushSubscription,Notice,ArchivedNotice,SUBSCRIPTION_DEPARTMENTS,SEMESTERS
 from .forms import NoticeForm
 from .attachment_forms import AttachmentFormSet
+from . import metrics
+from .archive import ArchiveListMixin
+from .live import LiveFeedMixin
+from .cache import BoardConditionalMixin, CachedResponseMixin, ConditionalGetMixin, archive_state, make_etag, notice_updated_at, viewer_key
+from .pagination import KeysetPaginationMixin
+from .push import dispatcher
+from .search import search_notices
+from .subscriptions import save_subscription
 from django.utils import timezone
 from django.views import View # <-- NEW IMPORT
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import json
-from webpush.utils import _send_notification
+import logging
+from datetime import datetime, time, timedelta
 from django.contrib.auth import get_user_model
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
 
 def create_admin(request):
     # Add a simple security key to prevent outsiders from using it
@@ -32,61 +46,93 @@ def create_admin(request):
     else:
         return HttpResponse("⚠️ Superuser already exists.")
     
+def metrics_view(request):
+    # Staff only; a Prometheus scraper can't log in, so it may send METRICS_TOKEN as a bearer token instead
+    token = settings.METRICS_TOKEN
+    bearer = request.headers.get('Authorization', '')
+    if not (request.user.is_staff or (token and constant_time_compare(bearer, f'Bearer {token}'))):
+        return HttpResponse("Forbidden", status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def service_worker(request):
+    response = HttpResponse(render_to_string('notices/serviceworker.js'), content_type='text/javascript')
+    # Browsers check for a new worker on their own schedule; make each check reach us
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 def vapid_key(request):
     return {'vapid_key': settings.WEBPUSH_SETTINGS['VAPID_PUBLIC_KEY']}
 
+def parse_subscription(body):
+    """
+    The endpoint and the fields to store from a /subscribe/ request body.
+    Raises ValueError with a message for the browser when the body is unusable.
+    """
+    # 1. Parse the JSON data sent from the browser
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        raise ValueError('Invalid JSON data')
+    if not isinstance(data, dict):
+        raise ValueError('Invalid JSON data')
+    endpoint = data.get('endpoint')
+    keys = data.get('keys') or {}
+
+    if not endpoint:
+        raise ValueError('Missing endpoint')
+
+    # Extract the necessary keys
+    p256dh = keys.get('p256dh')
+    auth = keys.get('auth')
+
+    if not p256dh or not auth:
+        raise ValueError('Missing push keys')
+
+    # 2. Extract filtering preferences (default: every notice)
+    department = data.get('department') or 'ALL'
+    semester = data.get('semester') or 'ALL'
+    if department not in dict(SUBSCRIPTION_DEPARTMENTS) or semester not in dict(SEMESTERS):
+        raise ValueError('Unknown department or semester')
+
+    return endpoint, {
+        'p256dh_key': p256dh,
+        'auth_key': auth,
+        'department': department,
+        'semester': semester,
+        # 'user': request.user if request.user.is_authenticated else None,
+    }
+
+
+def subscription_response(created):
+    message = 'Subscription created successfully' if created else 'Subscription updated successfully'
+    return JsonResponse({'status': 'ok', 'message': message}, status=201)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class SubscribeView(View):
     def post(self, request, *args, **kwargs):
         try:
-            # 1. Parse the JSON data sent from the browser
-            data = json.loads(request.body)
-            endpoint = data.get('endpoint')
-            keys = data.get('keys', {})
-            
-            if not endpoint:
-                return JsonResponse({'status': 'error', 'message': 'Missing endpoint'}, status=400)
-            
-            # Extract the necessary keys
-            p256dh = keys.get('p256dh')
-            auth = keys.get('auth')
-            
-            if not p256dh or not auth:
-                return JsonResponse({'status': 'error', 'message': 'Missing push keys'}, status=400)
-            
-            # 2. Extract filtering preferences (we can assume default filters for now)
-            # A future step could allow the student to select filters on a settings page
-            
-            # 3. Create or Update the subscription record
-            # We use update_or_create to handle returning students
-            subscription, created = PushSubscription.objects.update_or_create(
-                endpoint=endpoint,
-                defaults={
-                    'p256dh_key': p256dh,
-                    'auth_key': auth,
-                    # We can hardcode 'ALL' for default filtering for now
-                    'department': 'ALL',
-                    'semester': 'ALL',
-                    # 'user': request.user if request.user.is_authenticated else None,
-                }
-            )
-
-            message = 'Subscription created successfully' if created else 'Subscription updated successfully'
-            return JsonResponse({'status': 'ok', 'message': message}, status=201)
-
-        except json.JSONDecodeError:
-            return JsonResponse({'status': 'error', 'message': 'Invalid JSON data'}, status=400)
+            endpoint, fields = parse_subscription(request.body)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        try:
+            # 3. Create or Update the subscription record (one upsert, or nothing for a recent repeat)
+            created = save_subscription(endpoint, fields)
         except Exception as e:
-            # Log the error (optional)
-            print(f"Subscription error: {e}")
+            logger.exception("Subscription error: %s", e)
             return JsonResponse({'status': 'error', 'message': f'Server error: {str(e)}'}, status=500)
+        return subscription_response(created)
 
 
 
-class MyNoticesListView(LoginRequiredMixin, ListView):
+class MyNoticesListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Notice
     template_name = 'notices/my_notices.html' # NEW TEMPLATE
     context_object_name = 'notices'
+    fragment_template_name = 'notices/_my_notice_cards.html'
+    page_url_name = 'my-notices'
+    fragment_url_name = 'my-notices-more'
     
     # Filter the queryset to only include notices posted by the current user
     def get_queryset(self):
@@ -144,17 +190,36 @@ class NoticeDeleteView(LoginRequiredMixin, AuthorRequiredMixin, DeleteView):
     success_url = reverse_lazy('notice-list')
     context_object_name = 'notice' 
 
-class StudentNoticeListView(ListView):
+def todays_range():
+    # Today in the college's time zone (TIME_ZONE, Asia/Kolkata) as a half-open [start, end) range.
+    # Comparing the raw column keeps the posted_at indexes usable, unlike posted_at__date.
+    today = timezone.localdate()
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(today, time.min, tzinfo=tz)
+    end = datetime.combine(today + timedelta(days=1), time.min, tzinfo=tz)
+    return start, end
+
+class StudentNoticeListView(BoardConditionalMixin, CachedResponseMixin, LiveFeedMixin, KeysetPaginationMixin, ListView):
     model = Notice
     # Django will look for this file: notices/templates/notices/notice_list.html
     template_name = 'notices/notice_list.html' 
     context_object_name = 'notices'
+    fragment_template_name = 'notices/_notice_cards.html'
+    page_url_name = 'notice-list'
+    fragment_url_name = 'notice-list-more'
+
+    def get_validators(self, request, *args, **kwargs):
+        # The default board also changes at midnight, when today's notices roll off it
+        etag, last_modified = super().get_validators(request, *args, **kwargs)
+        start, _ = todays_range()
+        return make_etag(etag, start.date()), max(filter(None, [last_modified, start]))
 
     def get_queryset(self):
         department_filter = self.request.GET.get('department')
         search_query = self.request.GET.get('search')
 
-        queryset = Notice.objects.all().order_by('-posted_at')
+        # The cards show the author, so fetch it in the same query
+        queryset = Notice.objects.select_related('posted_by').order_by('-posted_at')
     
        
         if department_filter or search_query:
@@ -162,17 +227,12 @@ class StudentNoticeListView(ListView):
             if department_filter:
                 queryset = queryset.filter(department=department_filter)
 
-        # 4. Apply Search Filter (Title, Description, or Posted By name)
+        # 4. Apply Search Filter (full-text index over title, description, author and attachments)
             if search_query:
-                # Use Q objects for OR logic: search in title OR description OR username
-                queryset = queryset.filter(
-                    Q(title__icontains=search_query) |
-                    Q(description__icontains=search_query) |
-                    Q(posted_by__username__icontains=search_query)
-                )
+                queryset = search_notices(queryset, search_query)
         else:
-            today = timezone.localdate()
-            queryset = queryset.filter(posted_at__date=today).order_by('-posted_at')
+            start, end = todays_range()
+            queryset = queryset.filter(posted_at__gte=start, posted_at__lt=end).order_by('-posted_at')
         return queryset
 
 class NoticeCreateView(LoginRequiredMixin, CreateView):
@@ -194,45 +254,9 @@ class NoticeCreateView(LoginRequiredMixin, CreateView):
 
 
     def send_notice_push(self, notice):
-        # 1. Prepare the payload (what the student's browser will display)
-        payload = {
-            "title": f"New Notice: {notice.get_department_display()}",
-            "body": notice.title,
-            "url": reverse('notice-detail', kwargs={'pk': notice.pk}) # Link to the new notice
-        }
-
-        # 2. Get all relevant subscriptions based on filters
-        # For simplicity, we are currently only filtering by those who subscribed to 'ALL'
-        subscriptions = PushSubscription.objects.filter(
-             # In a future update, this would filter by notice.department and notice.semester
-             # For now, let's notify everyone who is subscribed (or if they have 'ALL' selected)
-             Q(department='ALL') | Q(department=notice.department)
-        ).distinct()
-
-        # 3. Send the notification to each active subscription
-        sent_count = 0
-        failed_count = 0
-        
-        for subscription in subscriptions:
-            # webpush expects the full subscription object, not just the token
-            try:
-                # 'send_user_notification' is a slight misnomer; it sends to the subscription
-                _send_notification(
-                    user=None, # Not using Django User, so set to None
-                    subscription_object=subscription,
-                    payload=payload,
-                    ttl=1000 # Time to Live (seconds)
-                )
-                sent_count += 1
-                print(f"Successfully sent notification to {subscription.endpoint[:30]}...")
-            except Exception as e:
-                failed_count += 1
-                # Log the error and delete the token if it's expired
-                print(f"Failed to send notification to endpoint {subscription.endpoint}: {e}")
-                # Uncomment the next line to automatically clean up bad tokens
-                # subscription.delete()
-        
-        print(f"Push notification summary: {sent_count} sent, {failed_count} failed")
+        # Hand the fan-out to the background dispatcher once the notice is committed,
+        # so the teacher is redirected without waiting on any push service
+        transaction.on_commit(lambda: dispatcher.dispatch(notice.pk))
 
     # Process both forms on successful submission
     def form_valid(self, form):
@@ -260,41 +284,69 @@ class NoticeCreateView(LoginRequiredMixin, CreateView):
     
 
     
-class NoticeDetailView(DetailView):
+class NoticeDetailView(ConditionalGetMixin, CachedResponseMixin, DetailView):
     model = Notice
     # Django will automatically look for notices/notice_detail.html
     template_name = 'notices/notice_detail.html'
     context_object_name = 'notice'
 
-class AllNoticesListView(ListView):
+    def get_validators(self, request, *args, **kwargs):
+        updated_at = notice_updated_at(kwargs['pk'])
+        if updated_at is None:
+            return None, None  # let the view raise its 404
+        return make_etag('notice', kwargs['pk'], updated_at, viewer_key(request)), updated_at
+
+    def get_queryset(self):
+        # Author joined in, attachments loaded once for the whole page
+        return Notice.objects.select_related('posted_by').prefetch_related('attachments')
+
+    def get_archive_queryset(self):
+        return ArchivedNotice.objects.select_related('posted_by').prefetch_related('attachments')
+
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Old notices live in the archive, under the same id (notices/archive.py)
+            return get_object_or_404(self.get_archive_queryset(), pk=self.kwargs['pk'])
+
+class AllNoticesListView(BoardConditionalMixin, CachedResponseMixin, LiveFeedMixin, ArchiveListMixin, KeysetPaginationMixin, ListView):
     model = Notice
     # Django will look for this file: notices/templates/notices/notice_list.html
     template_name = 'notices/all_notices_archive.html' 
     context_object_name = 'notices'
+    live_filters = ('department', 'semester')
+    fragment_template_name = 'notices/_notice_cards.html'
+    page_url_name = 'notice-archive'
+    fragment_url_name = 'notice-archive-more'
+
+    def get_validators(self, request, *args, **kwargs):
+        # Archived notices are listed too, and deleting one changes nothing in board_state()
+        etag, last_modified = super().get_validators(request, *args, **kwargs)
+        archive_updated, archive_count = archive_state()
+        return make_etag(etag, archive_updated, archive_count), max(filter(None, [last_modified, archive_updated]), default=None)
 
     def get_queryset(self):
+        # The cards show the author, so fetch it in the same query
+        return self.filter_notices(Notice.objects.select_related('posted_by').order_by('-posted_at'))
+
+    def get_archive_queryset(self):
+        # Listed after the hot notices run out (ArchiveListMixin), with the same filters
+        return self.filter_notices(ArchivedNotice.objects.select_related('posted_by').order_by('-posted_at'))
+
+    def filter_notices(self, queryset):
         department_filter = self.request.GET.get('department')
         search_query = self.request.GET.get('search')
         semester_filter = self.request.GET.get('semester')
-        queryset = Notice.objects.all().order_by('-posted_at')
-    
+
         # Apply Department Filter
         if department_filter:
             queryset = queryset.filter(department=department_filter)
 
         if semester_filter and semester_filter != 'ALL':
             queryset = queryset.filter(semester=semester_filter)
-        # Apply Search Filter (using Q logic)
+        # Apply Search Filter (ranked full-text search, see notices/search.py)
         if search_query:
-            queryset = queryset.filter(
-                # Existing search fields (Title, Description, Posted By)
-                Q(title__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(posted_by__username__icontains=search_query) |
-                
-                # NEW: Search the Attachment model's fields
-                Q(attachments__name__icontains=search_query) |        # Search the custom name given by the teacher
-                Q(attachments__file__icontains=search_query)          # Search the actual filename/path
-            ).distinct() # Use .distinct() to prevent duplicate notices if multiple attachments match
+            queryset = search_notices(queryset, search_query)
 
         return queryset
\ No newline at end of file